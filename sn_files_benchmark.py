@@ -0,0 +1,387 @@
+############## SECURITY NOW PODCAST FILES: OFFLINE BENCHMARK ##############
+"""
+Measures the download functions without sending a single request to grc.com.
+
+A local HTTP server stands in for grc.com, serving synthetic files at the same URL layout (/sn/sn-NNN.pdf, /sn/sn-NNN.txt, /sn/sn-NNN-notes.pdf, /sn/notes-NNN.htm, /securitynow.htm), with configurable latency, bandwidth, missing episodes (404s) and injected server errors. Each grab_* function, plus last_downloaded_episode and latest_episode_number, is then run against synthetic archives of several sizes and its throughput and memory use reported.
+
+Run from the program directory, e.g.:
+    python sn_files_benchmark.py
+    python sn_files_benchmark.py --sizes 100 1000 --latency 0.05 --workers 4 --json results.json
+    python sn_files_benchmark.py --baseline results.json   (exit code 1 if anything is more than --tolerance slower)
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import sn_files_utils
+
+try:
+    import resource # Unix only, used for peak process memory
+except ImportError:
+    resource = None
+
+
+######################### STAND-IN SERVER #########################
+
+# Synthetic file sizes (bytes) for each file format, roughly the size of the real files.
+synthetic_file_sizes = {
+    "pdf_transcript": 250_000,
+    "txt_transcript": 90_000,
+    "pdf_shownotes": 400_000,
+    "htm_shownotes": 15_000,
+}
+
+# URL path of every file the stand-in server can serve. Group 1 is the episode number.
+served_paths = [
+    (re.compile(r"/sn/sn-(\d+)\.pdf$"), "pdf_transcript"),
+    (re.compile(r"/sn/sn-(\d+)\.txt$"), "txt_transcript"),
+    (re.compile(r"/sn/sn-(\d+)-notes\.pdf$"), "pdf_shownotes"),
+    (re.compile(r"/sn/notes-(\d+)\.htm$"), "htm_shownotes"),
+]
+
+
+def synthetic_body(file_format, episode, size):
+    """Returns deterministic file content of roughly the given size for an episode, shaped like the real format (e.g. PDFs start with %PDF- and end with %%EOF)."""
+    if file_format in ("pdf_transcript", "pdf_shownotes"):
+        head, tail = b"%PDF-1.4\n", b"\n%%EOF\n"
+    elif file_format == "htm_shownotes":
+        head, tail = f"<html><body><h1>Security Now! Episode #{episode}</h1>".encode(), b"</body></html>\n"
+    else:
+        head, tail = f"GIBSON RESEARCH CORPORATION\nEPISODE: #{episode}\n\nSTEVE: ".encode(), b"\n\nEND\n"
+    filler = b"Security Now is a weekly podcast about security and privacy. "
+    body_size = max(0, size - len(head) - len(tail))
+    body = (filler * (body_size // len(filler) + 1))[:body_size]
+    return head + body + tail
+
+
+class StandInServer:
+    """
+    Local HTTP server imitating grc.com's Security Now URL layout, run in a background thread.
+
+    Args:
+        latest_episode (int): Highest episode number served.
+        latency (float): Seconds to wait before answering each request.
+        bandwidth (float): Bytes per second each response body is sent at. 0 for unlimited.
+        gap_rate (float): Fraction (0 to 1) of files that return 404, chosen at random but the same for every run with the same seed.
+        error_rate (float): Fraction (0 to 1) of requests answered with 503 Service Unavailable and Retry-After: 1, chosen at random per request.
+        drop_rate (float): Fraction (0 to 1) of file downloads cut off half way through, chosen at random per request, to imitate a flaky connection.
+        seed (int): Seed for choosing the missing files and injected errors.
+    """
+
+    def __init__(self, latest_episode, latency=0.0, bandwidth=0, gap_rate=0.0, error_rate=0.0, drop_rate=0.0, seed=1):
+        self.latest_episode = latest_episode
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.gap_rate = gap_rate
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.request_count = 0
+        self.bytes_sent = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, like the real server
+            disable_nagle_algorithm = True # headers and body are written separately, so don't let TCP hold one back waiting for the other
+
+            def log_message(self, format, *args):
+                pass # keep the benchmark output readable
+
+            def do_HEAD(self):
+                self.respond(send_body=False)
+
+            def do_GET(self):
+                self.respond(send_body=True)
+
+            def respond(self, send_body):
+                server.request_count += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                with server.random_lock:
+                    inject_error = server.random.random() < server.error_rate
+                if inject_error:
+                    self.send_response(503)
+                    self.send_header("Retry-After", "1")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                body = server.body_for(self.path.split("?")[0])
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"' # from the contents, so it changes whenever the page or file does
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                # Range requests, as grc.com supports, so interrupted downloads can be resumed
+                status, start = 200, 0
+                range_match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+                if range_match and self.headers.get("If-Range", etag) == etag:
+                    start = int(range_match.group(1))
+                    if start >= len(body):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(body)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    status = 206
+
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body) - start))
+                self.send_header("ETag", etag)
+                self.send_header("Accept-Ranges", "bytes")
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+                self.end_headers()
+                if send_body:
+                    with server.random_lock:
+                        drop = server.random.random() < server.drop_rate
+                    if drop: # send half of what's left, then hang up
+                        server.send_throttled(self.wfile, body[start:start + (len(body) - start) // 2])
+                        self.close_connection = True
+                        return
+                    server.send_throttled(self.wfile, body[start:])
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.handle_error = lambda request, client_address: None # clients hanging up mid-response is expected, don't print tracebacks
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def is_gap(self, file_format, episode):
+        """Whether this file is one of the randomly chosen missing ones. Decided by a hash of the seed, format and episode so it never changes between requests."""
+        return random.Random(f"{self.seed}-{file_format}-{episode}").random() < self.gap_rate
+
+    def body_for(self, path):
+        """Returns the response body for a URL path, or None for a 404."""
+        if path == "/securitynow.htm":
+            episodes = "".join(f"<tr><td>Episode&nbsp;#{episode} | synthetic title</td></tr>\n" for episode in range(self.latest_episode, max(0, self.latest_episode - 50), -1))
+            return f"<html><body>{'<p>page header</p>' * 200}{episodes}</body></html>".encode()
+        if path == "/nat/nat.htm":
+            path = "/sn/notes-003.htm"
+        if path == "/wmf/wmf.htm":
+            path = "/sn/notes-023.htm"
+        for pattern, file_format in served_paths:
+            match = pattern.match(path)
+            if match:
+                episode = int(match.group(1))
+                if episode < 1 or episode > self.latest_episode or self.is_gap(file_format, episode):
+                    return None
+                return synthetic_body(file_format, episode, synthetic_file_sizes[file_format])
+        return None
+
+    def send_throttled(self, wfile, body):
+        """Writes body to the client, no faster than self.bandwidth bytes per second."""
+        chunk_size = 16 * 1024
+        started = time.perf_counter()
+        for offset in range(0, len(body), chunk_size):
+            wfile.write(body[offset:offset + chunk_size])
+            self.bytes_sent += len(body[offset:offset + chunk_size])
+            if self.bandwidth:
+                due = (offset + chunk_size) / self.bandwidth
+                elapsed = time.perf_counter() - started
+                if due > elapsed:
+                    time.sleep(due - elapsed)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+######################### MEASUREMENT #########################
+
+def peak_process_memory_mb():
+    """Peak memory (MB) used by this process so far, or None where the resource module isn't available (Windows)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1) # bytes on macOS, KB elsewhere
+
+
+def archive_totals(directory):
+    """Returns (number of files, total bytes) of the Security Now files in directory."""
+    files, total_bytes = 0, 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if sn_files_utils.classify_filename(entry.name):
+                files += 1
+                total_bytes += entry.stat().st_size
+    return files, total_bytes
+
+
+def measure(name, size, function, output_directory, *args):
+    """
+    Runs function(output_directory, *args), timing it and tracing the peak Python memory allocated while it runs.
+
+    Returns:
+        dict: name, archive size, seconds, peak traced memory (MB), peak process memory (MB), and the files / MB added to output_directory with the resulting throughput.
+    """
+    files_before, bytes_before = archive_totals(output_directory)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    function(output_directory, *args)
+    seconds = max(time.perf_counter() - started, 1e-6)
+    peak_traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    files_after, bytes_after = archive_totals(output_directory)
+    files = files_after - files_before
+    megabytes = (bytes_after - bytes_before) / 1_000_000
+    return {"benchmark": name, "size": size, "seconds": round(seconds, 4), "files": files, "megabytes": round(megabytes, 2),
+            "files_per_second": round(files / seconds, 1), "megabytes_per_second": round(megabytes / seconds, 2),
+            "peak_traced_mb": round(peak_traced / 1_000_000, 2), "peak_process_mb": peak_process_memory_mb()}
+
+
+def make_synthetic_archive(directory, size):
+    """Fills directory with empty files named like a downloaded archive of size episodes in every format, for benchmarking the local (no network) functions."""
+    for episode in range(1, size + 1):
+        for file_format in sn_files_utils.file_formats:
+            first_episode, last_episode = sn_files_utils.file_formats[file_format][1:]
+            if episode >= first_episode and (last_episode is None or episode <= last_episode):
+                filename = sn_files_utils.episode_url_and_filename(episode, file_format)[1]
+                open(os.path.join(directory, filename), "wb").close()
+
+
+######################### BENCHMARK SUITE #########################
+
+def run_benchmarks(sizes, latency, bandwidth, gap_rate, error_rate, workers, rate, drop_rate=0.0):
+    """
+    Runs every benchmark for every archive size against a fresh stand-in server and temporary output directories.
+
+    Returns:
+        list: One result dict per benchmark and size (see measure).
+    """
+    # Benchmark settings replace the user's settings for this process only
+    sn_files_utils.max_workers = workers
+    sn_files_utils.requests_per_second = rate
+    sn_files_utils.http_pool_size = max(workers, sn_files_utils.http_pool_size)
+    sn_files_utils.rate_limiter = None
+    sn_files_utils.close_http_session()
+    sn_files_utils.use_log_file = False
+
+    results = []
+    for size in sizes:
+        latest_episode = 431 + size # so the PDF shownotes range (from 432) is the same size as the others
+        with StandInServer(latest_episode, latency, bandwidth, gap_rate, error_rate, drop_rate) as server:
+            sn_files_utils.grc_base_url = server.base_url
+            with tempfile.TemporaryDirectory(prefix="sn_benchmark_") as work_directory:
+                grabs = [
+                    ("grab_sn_transcripts_pdfs", sn_files_utils.grab_sn_transcripts_pdfs, (latest_episode, 1, size)),
+                    ("grab_sn_transcripts_txts", sn_files_utils.grab_sn_transcripts_txts, (latest_episode, 1, size)),
+                    ("grab_sn_shownotes_pdfs", sn_files_utils.grab_sn_shownotes_pdfs, (latest_episode, 432, latest_episode)),
+                    ("grab_sn_shownotes_htm", sn_files_utils.grab_sn_shownotes_htm, (1, min(size, 177))),
+                ]
+                for name, function, grab_args in grabs:
+                    output_directory = os.path.join(work_directory, name)
+                    os.makedirs(output_directory)
+                    results.append(measure(name, size, function, output_directory, *grab_args))
+                    # Second run over the same range: everything is already downloaded, so this measures the duplicate checks
+                    results.append(measure(name + " (resync)", size, function, output_directory, *grab_args))
+
+                archive_directory = os.path.join(work_directory, "archive")
+                os.makedirs(archive_directory)
+                make_synthetic_archive(archive_directory, size)
+                results.append(measure("last_downloaded_episode (new manifest)", size, sn_files_utils.last_downloaded_episode, archive_directory))
+                results.append(measure("last_downloaded_episode", size, sn_files_utils.last_downloaded_episode, archive_directory))
+
+                results.append(measure("latest_episode_number", size, sn_files_utils.latest_episode_number, archive_directory))
+                results.append(measure("latest_episode_number (conditional)", size, sn_files_utils.latest_episode_number, archive_directory))
+
+                for connection in sn_files_utils.manifest_connections.values():
+                    connection.close()
+                sn_files_utils.manifest_connections.clear()
+    return results
+
+
+def print_results(results):
+    """Prints benchmark results as a table."""
+    print(f"\n{'benchmark':<42}{'size':>6}{'seconds':>10}{'files/s':>10}{'MB/s':>9}{'peak MB':>9}")
+    for result in results:
+        print(f"{result['benchmark']:<42}{result['size']:>6}{result['seconds']:>10}{result.get('files_per_second', ''):>10}{result.get('megabytes_per_second', ''):>9}{result['peak_traced_mb']:>9}")
+    peak = peak_process_memory_mb()
+    if peak is not None:
+        print(f"\nPeak process memory: {peak} MB")
+
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """
+    Compares each result's seconds against a previously saved --json results file.
+
+    Returns:
+        list: Descriptions of the benchmarks that were more than tolerance (e.g. 0.25 = 25%) slower than the baseline.
+    """
+    with open(baseline_path) as baseline_file:
+        baseline = {(result["benchmark"], result["size"]): result for result in json.load(baseline_file)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["benchmark"], result["size"]))
+        if previous and previous["seconds"] > 0 and result["seconds"] > previous["seconds"] * (1 + tolerance):
+            regressions.append(f"{result['benchmark']} (size {result['size']}): {previous['seconds']}s -> {result['seconds']}s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Security Now download functions against a local stand-in for grc.com.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000], help="archive sizes (number of episodes) to benchmark")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of server latency per request")
+    parser.add_argument("--bandwidth", type=float, default=0, help="bytes per second per response, 0 for unlimited")
+    parser.add_argument("--gap-rate", type=float, default=0.02, help="fraction of files that return 404")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that return 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of downloads cut off half way through")
+    parser.add_argument("--workers", type=int, default=sn_files_utils.max_workers, help="max_workers to benchmark with")
+    parser.add_argument("--rate", type=float, default=1000, help="requests_per_second to benchmark with (no need to be polite to a local server)")
+    parser.add_argument("--json", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results file from a previous run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="fraction slower than the baseline that counts as a regression")
+    parser.add_argument("--verbose", action="store_true", help="show the program's normal log messages")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        sn_files_utils.log_level = "ERROR"
+
+    results = run_benchmarks(args.sizes, args.latency, args.bandwidth, args.gap_rate, args.error_rate, args.workers, args.rate, args.drop_rate)
+    print_results(results)
+
+    if args.json:
+        settings = {key: value for key, value in vars(args).items() if key not in ("json", "baseline", "verbose")}
+        with open(args.json, "w") as results_file:
+            json.dump({"settings": settings, "results": results}, results_file, indent=2)
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print("\nPerformance regressions against baseline:")
+            for regression in regressions:
+                print(f"    {regression}")
+            return 1
+        print("\nNo performance regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
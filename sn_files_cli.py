@@ -0,0 +1,373 @@
+############## SECURITY NOW PODCAST FILES: COMMAND LINE ##############
+"""
+Command line entry point, for running from a terminal, cron or a shell script instead of editing sn_files_main.py.
+
+Settings come from sn_files_user_variables.py, and any of the common options below overrides them for that run only.
+
+Examples:
+    python sn_files_cli.py latest                       (files for the newest episodes)
+    python sn_files_cli.py missing                      (every file missing from the archive, in the formats you already collect)
+    python sn_files_cli.py backfill --formats txt_transcript --start 1 --stop 100
+    python sn_files_cli.py backfill --formats pdf_transcript --processes 4   (share the range between 4 processes)
+    python sn_files_cli.py watch                        (keep running, downloading each new episode as it is published)
+    python sn_files_cli.py catalog --list               (update and show the episode catalog: titles, dates, formats published)
+    python sn_files_cli.py verify --rehash
+    python sn_files_cli.py search '"three dumb routers"' --start 500
+    python sn_files_cli.py related 950                  (episodes on similar topics to SN#950, needs numpy and scipy)
+    python sn_files_cli.py related --text "post-quantum cryptography"
+    python sn_files_cli.py turns                        (words and turns per speaker, from the transcript turn store)
+    python sn_files_cli.py turns --episode 950 --speaker leo
+    python sn_files_cli.py shownotes --episode 950      (extract text from new shownotes, then print SN#950's)
+    python sn_files_cli.py pack --remove-originals      (move the txt and htm files into one packed file)
+    python sn_files_cli.py export --destination /mnt/copy   (write the packed files back out as sn-xxx files)
+    python sn_files_cli.py missing -o /mnt/archive --workers 4 --log-level WARNING
+
+Exit codes: 0 success, 1 nothing found / something wrong (latest episode couldn't be determined, bad files found, no search results / related episodes / turns), 2 invalid options.
+
+Start-up is kept quick: only the modules a command needs are imported, requests is only imported if the command goes online, and verify (without --check-server), search, related, turns, shownotes, pack and export never contact grc.com.
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+
+import sn_files_user_variables
+
+######################### GLOBAL VARIABLE #########################
+
+format_choices = ["pdf_transcript", "txt_transcript", "pdf_shownotes", "htm_shownotes"] # keys of sn_files_utils.file_formats, repeated here so --help doesn't need to import sn_files_utils
+
+
+######################### HELPER FUNCTIONS #########################
+
+def apply_settings(args):
+    """
+    Overrides settings from sn_files_user_variables.py with any options given on the command line, then sets up the output directory and log file.
+
+    Returns:
+        module: sn_files_utils, ready to use.
+    """
+    import sn_files_utils
+
+    if args.workers is not None:
+        sn_files_utils.max_workers = args.workers
+        sn_files_utils.http_pool_size = max(args.workers, sn_files_utils.http_pool_size)
+    if args.rate is not None:
+        sn_files_utils.requests_per_second = args.rate
+    if args.log_level is not None:
+        sn_files_utils.log_level = args.log_level
+    if args.no_log_file:
+        sn_files_utils.use_log_file = False
+
+    sn_files_utils.output_directory_check(args.output_directory)
+    sn_files_utils.log_file_setup(sn_files_utils.use_log_file, args.log_directory)
+    return sn_files_utils
+
+
+def get_latest_episode(sn_files_utils, output_directory):
+    """Returns the latest episode number published on grc.com, or None (after logging why) if it couldn't be determined."""
+    latest_episode = sn_files_utils.latest_episode_number(output_directory)
+    if latest_episode is None:
+        msg_error = "Couldn't determine the latest episode number from grc.com, so nothing was downloaded.\n"
+        sn_files_utils.log_file_write(msg_error, sn_files_utils.log_path, logging.ERROR)
+    return latest_episode
+
+
+######################### SUBCOMMANDS #########################
+
+def command_latest(args):
+    """Downloads the chosen formats for the most recent episode(s)."""
+    sn_files_utils = apply_settings(args)
+    latest_episode = get_latest_episode(sn_files_utils, args.output_directory)
+    if latest_episode is None:
+        return 1
+    ep_start = max(1, latest_episode - args.count + 1)
+    sn_files_utils.grab_episodes(args.output_directory, latest_episode, args.formats, ep_start, latest_episode)
+    return 0
+
+
+def command_missing(args):
+    """Downloads every file missing from the archive, including new episodes and gaps in the middle."""
+    sn_files_utils = apply_settings(args)
+    latest_episode = get_latest_episode(sn_files_utils, args.output_directory)
+    if latest_episode is None:
+        return 1
+    downloaded = sn_files_utils.grab_missing_files(args.output_directory, latest_episode, args.formats)
+    return 1 if downloaded is False else 0
+
+
+def worker_command(args, rate):
+    """Builds the command line for an extra backfill process with the same options as this one, but the given request rate and no further processes of its own."""
+    command = [sys.executable, os.path.abspath(__file__), "backfill", "-o", args.output_directory, "--log-directory", args.log_directory, "--rate", str(rate), "--formats", *args.formats, "--start", str(args.start), "--shard-size", str(args.shard_size)]
+    if args.stop is not None:
+        command += ["--stop", str(args.stop)]
+    if args.no_log_file:
+        command.append("--no-log-file")
+    if args.log_level is not None:
+        command += ["--log-level", args.log_level]
+    if args.workers is not None:
+        command += ["--workers", str(args.workers)]
+    return command
+
+
+def command_backfill(args):
+    """
+    Downloads the chosen formats for an episode range (the back catalogue), in shards of --shard-size episodes.
+
+    Shards are claimed with lease files in the output directory, so any number of backfill processes (started here with --processes, or separately, e.g. overlapping cron jobs) can work on the same range at once without downloading anything twice. With --processes, the request rate is shared between the processes, so grc.com still never gets more than --rate (or requests_per_second) requests per second in total.
+    """
+    workers = []
+    if args.processes > 1:
+        total_rate = args.rate if args.rate is not None else sn_files_user_variables.requests_per_second
+        args.rate = total_rate / args.processes
+        workers = [subprocess.Popen(worker_command(args, args.rate)) for _ in range(args.processes - 1)]
+
+    sn_files_utils = apply_settings(args)
+    latest_episode = get_latest_episode(sn_files_utils, args.output_directory)
+    if latest_episode is not None:
+        sn_files_utils.grab_episodes_sharded(args.output_directory, latest_episode, args.formats, args.start, args.stop, args.shard_size)
+
+    exit_codes = [worker.wait() for worker in workers]
+    return 1 if latest_episode is None or any(exit_codes) else 0
+
+
+def command_watch(args):
+    """Keeps running, downloading each new episode as soon as it is published, until stopped with Ctrl+C."""
+    sn_files_utils = apply_settings(args)
+    latest_episode = sn_files_utils.watch_for_new_episodes(args.output_directory, args.formats, args.interval, args.max_interval)
+    return 1 if latest_episode is None else 0
+
+
+def command_catalog(args):
+    """Builds or refreshes the episode catalog from grc.com's episode pages, optionally printing it."""
+    sn_files_utils = apply_settings(args)
+    episode_count = sn_files_utils.update_catalog(args.output_directory, rebuild=args.rebuild)
+    if args.list:
+        for entry in sn_files_utils.catalog_entries(args.output_directory, args.start, args.stop):
+            print(f"#{entry.episode:<5} {entry.date or '':<10}  {', '.join(sorted(entry.formats)):<60}  {entry.title or ''}")
+    return 0 if episode_count else 1
+
+
+def command_verify(args):
+    """Checks the archive for truncated or corrupted files. Only contacts grc.com with --check-server or --redownload."""
+    sn_files_utils = apply_settings(args)
+    if args.reconcile:
+        sn_files_utils.manifest_reconcile(args.output_directory)
+    bad_files = sn_files_utils.verify_archive(args.output_directory, rehash=args.rehash, check_server=args.check_server, redownload=args.redownload)
+    return 1 if bad_files else 0
+
+
+def command_search(args):
+    """Searches the downloaded txt transcripts. Never contacts grc.com."""
+    apply_settings(args)
+    from sn_files_search import update_search_index, search_transcripts, print_search_results
+
+    if not args.no_update:
+        update_search_index(args.output_directory)
+    results = search_transcripts(args.output_directory, args.query, args.start, args.stop, args.snippet_length)
+    print_search_results(results)
+    return 0 if results else 1
+
+
+def command_related(args):
+    """Lists the episodes most similar to an episode, or to some text. Never contacts grc.com."""
+    apply_settings(args)
+    try:
+        from sn_files_similar import update_similarity_index, related_episodes, print_related_episodes
+        if not args.no_update:
+            update_similarity_index(args.output_directory)
+        results = related_episodes(args.output_directory, episode=args.episode, text=args.text, top_k=args.count)
+    except ImportError as error: # numpy / scipy not installed
+        print(error)
+        return 1
+    print_related_episodes(results)
+    return 0 if results else 1
+
+
+def command_turns(args):
+    """Prints each speaker's words and turns, or the turns of one episode / speaker, from the transcript turn store. Never contacts grc.com."""
+    apply_settings(args)
+    from sn_files_turns import update_turn_store, speaker_summary, find_turns, print_speaker_summary
+
+    if not args.no_update:
+        update_turn_store(args.output_directory, workers=args.processes or os.cpu_count() or 1)
+    if args.episode is None and args.speaker is None:
+        summary = speaker_summary(args.output_directory, args.start, args.stop)
+        print_speaker_summary(summary)
+        return 0 if summary else 1
+
+    found = 0
+    for turn in find_turns(args.output_directory, episode=args.episode, speaker=args.speaker, ep_start=args.start, ep_stop=args.stop):
+        print(f"#{turn.episode} {turn.speaker}:  {turn.text}\n")
+        found += 1
+    print(f"{found} turns found.\n")
+    return 0 if found else 1
+
+
+def command_shownotes(args):
+    """Extracts plain text from new or changed shownotes, and optionally prints one episode's. Never contacts grc.com."""
+    apply_settings(args)
+    from sn_files_shownotes import update_shownotes_text, shownotes_text
+
+    if not args.no_update:
+        update_shownotes_text(args.output_directory, workers=args.processes or os.cpu_count() or 1)
+    if args.episode is None:
+        return 0
+    text = shownotes_text(args.output_directory, args.episode)
+    if text is None:
+        print(f"No shownotes text for episode {args.episode}.\n")
+        return 1
+    print(text)
+    return 0
+
+
+def command_pack(args):
+    """Appends the txt transcripts and htm shownotes to the packed archive. Never contacts grc.com."""
+    apply_settings(args)
+    from sn_files_pack import pack_files
+
+    pack_files(args.output_directory, remove_originals=args.remove_originals)
+    return 0
+
+
+def command_export(args):
+    """Writes the packed files back out under their original sn-xxx names. Never contacts grc.com."""
+    apply_settings(args)
+    from sn_files_pack import export_packed_files
+
+    export_packed_files(args.output_directory, destination=args.destination, filenames=args.files or None, overwrite=args.overwrite)
+    return 0
+
+
+######################### ARGUMENT PARSING #########################
+
+def common_options(with_defaults):
+    """
+    Returns a parser holding the options shared by every subcommand.
+
+    Args:
+        with_defaults (bool): True for the main parser. False for the subcommand parsers, whose defaults would otherwise overwrite an option given before the subcommand (e.g. "-o archive missing").
+    """
+    def default(value):
+        return value if with_defaults else argparse.SUPPRESS
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-o", "--output-directory", default=default(sn_files_user_variables.output_directory), help="directory holding the Security Now files (default: output_directory in sn_files_user_variables.py)")
+    common.add_argument("--log-directory", default=default(sn_files_user_variables.path_to_logs), help="directory for the log file (default: path_to_logs)")
+    common.add_argument("--no-log-file", action="store_true", default=default(False), help="don't write a log file this run")
+    common.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default=default(None), help="least important messages shown (default: log_level)")
+    common.add_argument("--workers", type=int, default=default(None), help="files downloaded at once (default: max_workers)")
+    common.add_argument("--rate", type=float, default=default(None), help="maximum requests per second to grc.com (default: requests_per_second)")
+    return common
+
+
+def build_parser():
+    """Builds the argument parser, with one subcommand per action. The common options can be given before or after the subcommand."""
+    parser = argparse.ArgumentParser(description="Download, verify and search an archive of Security Now podcast transcripts and shownotes from grc.com.", parents=[common_options(True)])
+    common = common_options(False)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    latest = subparsers.add_parser("latest", parents=[common], help="download the newest episode(s)")
+    latest.add_argument("--formats", nargs="+", choices=format_choices, default=["pdf_shownotes", "txt_transcript", "pdf_transcript"], help="formats to download (default: all current formats)")
+    latest.add_argument("--count", type=int, default=2, help="number of most recent episodes to check (default: 2, which also picks up a file published late for the previous episode)")
+    latest.set_defaults(function=command_latest)
+
+    missing = subparsers.add_parser("missing", parents=[common], help="download every file missing from the archive, new episodes and gaps")
+    missing.add_argument("--formats", nargs="+", choices=format_choices, help="formats to fill (default: those already in the output directory)")
+    missing.set_defaults(function=command_missing)
+
+    backfill = subparsers.add_parser("backfill", parents=[common], help="download an episode range of the back catalogue")
+    backfill.add_argument("--formats", nargs="+", choices=format_choices, required=True, help="formats to download")
+    backfill.add_argument("--start", type=int, default=1, help="first episode (default: 1, or each format's first available episode)")
+    backfill.add_argument("--stop", type=int, help="last episode (default: the latest published episode)")
+    backfill.add_argument("--shard-size", type=int, default=100, help="episodes per shard, the unit of work claimed by one process (default: 100)")
+    backfill.add_argument("--processes", type=int, default=1, help="processes to share the range between, each claiming shards in turn (default: 1)")
+    backfill.set_defaults(function=command_backfill)
+
+    watch = subparsers.add_parser("watch", parents=[common], help="keep running and download each new episode as soon as it is published")
+    watch.add_argument("--formats", nargs="+", choices=format_choices, default=["pdf_shownotes", "txt_transcript", "pdf_transcript"], help="formats to download (default: all current formats)")
+    watch.add_argument("--interval", type=float, help="shortest wait between checks, in seconds (default: watch_poll_seconds)")
+    watch.add_argument("--max-interval", type=float, help="longest wait between checks, in seconds (default: watch_max_poll_seconds)")
+    watch.set_defaults(function=command_watch)
+
+    catalog = subparsers.add_parser("catalog", parents=[common], help="build or refresh the catalog of published episodes, so downloads skip files grc.com doesn't have")
+    catalog.add_argument("--rebuild", action="store_true", help="re-read every yearly archive page, not just the newest")
+    catalog.add_argument("--list", action="store_true", help="print the catalog")
+    catalog.add_argument("--start", type=int, help="first episode to print")
+    catalog.add_argument("--stop", type=int, help="last episode to print")
+    catalog.set_defaults(function=command_catalog)
+
+    verify = subparsers.add_parser("verify", parents=[common], help="check downloaded files for truncation or corruption")
+    verify.add_argument("--rehash", action="store_true", help="re-check every file's SHA-256 against the hash recorded at download")
+    verify.add_argument("--check-server", action="store_true", help="also compare every file's size with grc.com's (one HEAD request per file)")
+    verify.add_argument("--redownload", action="store_true", help="download bad files again straight away")
+    verify.add_argument("--reconcile", action="store_true", help="rebuild the manifest from the output directory first")
+    verify.set_defaults(function=command_verify)
+
+    search = subparsers.add_parser("search", parents=[common], help="search the downloaded txt transcripts")
+    search.add_argument("query", help='words and "quoted phrases" that must all appear in an episode')
+    search.add_argument("--start", type=int, help="first episode to search")
+    search.add_argument("--stop", type=int, help="last episode to search")
+    search.add_argument("--snippet-length", type=int, default=200, help="characters of text shown around the first match (default: 200)")
+    search.add_argument("--no-update", action="store_true", help="don't update the search index first")
+    search.set_defaults(function=command_search)
+
+    related = subparsers.add_parser("related", parents=[common], help="list episodes on similar topics to an episode or some text (needs numpy and scipy)")
+    related.add_argument("episode", type=int, nargs="?", help="episode number to find related episodes for")
+    related.add_argument("--text", help="find episodes about this text instead of an episode")
+    related.add_argument("--count", type=int, default=10, help="number of episodes to list (default: 10)")
+    related.add_argument("--no-update", action="store_true", help="don't update the related episodes index first")
+    related.set_defaults(function=command_related)
+
+    turns = subparsers.add_parser("turns", parents=[common], help="per-speaker word counts, or the turns of an episode / speaker, from the txt transcripts")
+    turns.add_argument("--episode", type=int, help="print the turns of this episode")
+    turns.add_argument("--speaker", help="print the turns of this speaker, e.g. STEVE (with --episode, only theirs)")
+    turns.add_argument("--start", type=int, help="first episode to include")
+    turns.add_argument("--stop", type=int, help="last episode to include")
+    turns.add_argument("--processes", type=int, help="processes used to parse new or changed transcripts (default: one per CPU core)")
+    turns.add_argument("--no-update", action="store_true", help="don't update the turn store first")
+    turns.set_defaults(function=command_turns)
+
+    shownotes = subparsers.add_parser("shownotes", parents=[common], help="extract plain text from the downloaded PDF and htm shownotes (PDFs need pypdf)")
+    shownotes.add_argument("--episode", type=int, help="print the text of this episode's shownotes")
+    shownotes.add_argument("--processes", type=int, help="processes used to extract new or changed shownotes (default: one per CPU core)")
+    shownotes.add_argument("--no-update", action="store_true", help="don't extract new or changed shownotes first")
+    shownotes.set_defaults(function=command_shownotes)
+
+    pack = subparsers.add_parser("pack", parents=[common], help="keep the txt transcripts and htm shownotes in one packed file (sn_files_archive.pack)")
+    pack.add_argument("--remove-originals", action="store_true", help="delete each loose file once it is safely in the pack")
+    pack.set_defaults(function=command_pack)
+
+    export = subparsers.add_parser("export", parents=[common], help="write the files in the packed archive back out as sn-xxx files")
+    export.add_argument("files", nargs="*", help="only these files, e.g. sn-950.txt (default: every packed file)")
+    export.add_argument("--destination", help="directory to write them to (default: the output directory)")
+    export.add_argument("--overwrite", action="store_true", help="replace files already in the destination")
+    export.set_defaults(function=command_export)
+
+    return parser
+
+
+def main(argv=None):
+    """Parses the command line and runs the chosen subcommand. Returns the exit code."""
+    args = build_parser().parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        print("--workers must be 1 or more.")
+        return 2
+    if args.rate is not None and args.rate <= 0:
+        print("--rate must be greater than 0.")
+        return 2
+    if args.command == "backfill" and (args.shard_size < 1 or args.processes < 1):
+        print("--shard-size and --processes must be 1 or more.")
+        return 2
+    if args.command in ("turns", "shownotes") and args.processes is not None and args.processes < 1:
+        print("--processes must be 1 or more.")
+        return 2
+    if args.command == "related" and ((args.episode is None) == (args.text is None) or args.count < 1):
+        print("Give either an episode number or --text, and a --count of 1 or more.")
+        return 2
+    return args.function(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
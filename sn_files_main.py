@@ -1,8 +1,13 @@
 ############## SECURITY NOW PODCAST FILES: RUN PROGRAM ##############
+import sys
+
+if __name__ == "__main__" and len(sys.argv) > 1: # run with a subcommand (e.g. "python sn_files_main.py missing"), so use the command line version instead of the function calls below. See sn_files_cli.py.
+    import runpy
+    runpy.run_module("sn_files_cli", run_name="__main__", alter_sys=True) # run exactly as "python sn_files_cli.py ..." would, so worker processes (turns, shownotes --processes) re-import sn_files_cli.py, not this script and its function calls below. Exits when done.
 
 from sn_files_user_variables import use_log_file, path_to_logs, output_directory
 
-from sn_files_utils import output_directory_check, log_file_setup, latest_episode_number, last_downloaded_episode, grab_sn_transcripts_pdfs, grab_sn_transcripts_txts, grab_sn_shownotes_pdfs, grab_sn_shownotes_htm
+from sn_files_utils import output_directory_check, log_file_setup, latest_episode_number, last_downloaded_episode, manifest_reconcile, update_catalog, verify_archive, grab_missing_files, grab_episodes, watch_for_new_episodes, grab_sn_transcripts_pdfs, grab_sn_transcripts_txts, grab_sn_shownotes_pdfs, grab_sn_shownotes_htm
 
 ############################ NOTES ############################
 """ Security Now podcast goodies come in the following file formats:
@@ -11,6 +16,9 @@ from sn_files_utils import output_directory_check, log_file_setup, latest_episod
 
 * Transcripts: published in pdf and txt format, both currently and historically.
 
+---
+To run from a terminal, cron or a shell script without editing this file, use the command line version instead, e.g. "python sn_files_cli.py missing" (or "python sn_files_cli.py --help" for all the options).
+
 ---
 Any function calls which can potentially trigger a large number of requests / downloads have been left commented out with a single (#) to prevent accidental execution / spamming grc's servers. Uncomment the function calls (delete the '# ') to run them. 
 
@@ -25,7 +33,13 @@ All you need to do is supply your required ep_start & ep_stop integers (as int,
 
 output_directory_check(output_directory)
 log_file_setup(use_log_file, path_to_logs)
-latest_episode = latest_episode_number() # determines latest episode number as published on grc.com
+latest_episode = latest_episode_number(output_directory) # determines latest episode number as published on grc.com. Passing output_directory lets later runs skip re-downloading the page if it hasn't changed.
+
+"""Downloaded files are tracked in a manifest (sn_files_manifest.db) in your output_directory, built automatically the first time. If you have added, renamed or deleted sn-files by hand since, uncomment the line below to rebuild it from what is actually in the folder."""
+# manifest_reconcile(output_directory)
+
+"""Optional: builds (first time, about 20 requests) or refreshes (after that, usually a single small request) a catalog of every published episode's title, date and available file formats, read from grc.com's episode pages. With a catalog, downloads skip files grc.com doesn't publish instead of requesting each one to find out."""
+# update_catalog(output_directory)
 
 
 ############ GRAB THE SINGLE VERY LATEST EPISODE ############
@@ -37,6 +51,9 @@ ep_stop = latest_episode
 # grab_sn_transcripts_txts(output_directory, latest_episode, ep_start, ep_stop)
 # grab_sn_transcripts_pdfs(output_directory, latest_episode, ep_start, ep_stop)
 
+"""Or grab several formats in one go (one queue, one pass). Remove any format you don't want from the list."""
+# grab_episodes(output_directory, latest_episode, ["pdf_shownotes", "txt_transcript", "pdf_transcript"], ep_start, ep_stop)
+
 
 #### GRAB ONLY MOST RECENCT EPISODES MISSING FROM DOWNLOAD FOLDER #####
 """Dynamically determines difference between latest_episode published on grc.com and the most recent episode's files in the output_directory folder. 
@@ -60,8 +77,37 @@ last_downloaded_pdf_transcript, last_downloaded_txt_transcript, last_downloaded_
 # grab_sn_shownotes_pdfs(output_directory, latest_episode, last_downloaded_pdf_shownotes, latest_episode)
 
 
+############ FILL ALL HOLES IN DOWNLOAD FOLDER ############
+"""Finds every missing file across the whole available range of each format (not just those after your most recent download), e.g. a missing sn-500.txt in an otherwise complete archive, and downloads them all in one pass.
+
+By default only fills formats you already have at least one file of in output_directory. Supply a list to choose the formats, from: "pdf_transcript", "txt_transcript", "pdf_shownotes", "htm_shownotes".
+"""
+# grab_missing_files(output_directory, latest_episode)
+# grab_missing_files(output_directory, latest_episode, ["txt_transcript", "pdf_shownotes"])
+
+
+############ WATCH FOR NEW EPISODES ############
+"""Keeps running (stop with Ctrl+C), downloading each new episode's files as soon as they are published, instead of re-running this whole script on a schedule. Checks are one small request each, and files published late (e.g. shownotes) are picked up when they appear. How often it checks is set in sn_files_user_variables.py."""
+# watch_for_new_episodes(output_directory)
+# watch_for_new_episodes(output_directory, ["txt_transcript", "pdf_shownotes"])
+
+
+############ VERIFY DOWNLOADED FILES ############
+"""Checks every downloaded file for truncation or corruption (empty files, PDFs missing their end-of-file marker, unreadable txt transcripts, files changed since download) without re-downloading anything. Bad files are renamed to <filename>.corrupt and will be fetched again by grab_missing_files above, or straight away with redownload=True.
+
+rehash=True re-checks every file's SHA-256 against the hash recorded at download. check_server=True also compares every file's size with grc.com's (one small request per file, so slow on a large archive)."""
+# verify_archive(output_directory)
+# verify_archive(output_directory, rehash=True, check_server=True, redownload=True)
+
+
 ############ GRAB BACK CATALOGUE, MANUAL SPECIFICATION ############
 
+"""Grab the back-catalogue of any mix of formats in one go, from: "pdf_transcript", "txt_transcript", "pdf_shownotes", "htm_shownotes". Each format's range is trimmed to what is available, e.g. PDF shownotes still start at 432.
+TEST ME"""
+ep_start = 1
+ep_stop = latest_episode
+# grab_episodes(output_directory, latest_episode, ["pdf_transcript", "txt_transcript", "pdf_shownotes", "htm_shownotes"], ep_start, ep_stop)
+
 """Grab the back-catalogue of transcripts in pdf format.
 Available range: 001 to latest_episode.
 TEST ME"""
@@ -90,6 +136,48 @@ TEST ME"""
 # grab_sn_shownotes_htm(output_directory, ep_start=1, ep_stop=177)
 
 
+############ SEARCH DOWNLOADED TRANSCRIPTS ############
+"""Search the txt transcripts in output_directory without any requests to grc.com. update_search_index only (re)indexes transcripts that are new or changed since it last ran, so run it after downloading. The first run over the full back-catalogue takes a little while.
+
+Put phrases in double quotes. Every word / phrase must appear in an episode for it to be listed. Optionally limit the episode range with ep_start & ep_stop."""
+# from sn_files_search import update_search_index, search_transcripts, print_search_results
+# update_search_index(output_directory)
+# print_search_results(search_transcripts(output_directory, '"three dumb routers"'))
+# print_search_results(search_transcripts(output_directory, 'spinrite drive', ep_start=500, ep_stop=latest_episode))
+
+
+############ RELATED EPISODES ############
+"""List the episodes on the most similar topics to an episode, or to some text, judged by the words used in their txt transcripts. Needs numpy and scipy (pip install numpy scipy). Like the search index, update_similarity_index only reads transcripts that are new or changed since it last ran."""
+# from sn_files_similar import update_similarity_index, related_episodes, print_related_episodes
+# update_similarity_index(output_directory)
+# print_related_episodes(related_episodes(output_directory, episode=950, top_k=10))
+# print_related_episodes(related_episodes(output_directory, text="post-quantum cryptography"))
+
+
+############ TRANSCRIPT TURNS ############
+"""Split the txt transcripts into speaker turns (STEVE:, LEO: ...), kept in a compact column store in output_directory. update_turn_store only parses transcripts that are new or changed since it last ran. Leave workers=1 here, as worker processes re-import this script and would re-run its function calls; `python sn_files_cli.py turns` parses with one process per CPU core."""
+# from sn_files_turns import update_turn_store, speaker_summary, find_turns, print_speaker_summary
+# update_turn_store(output_directory)
+# print_speaker_summary(speaker_summary(output_directory, ep_start=900, ep_stop=latest_episode))
+# for turn in find_turns(output_directory, episode=950, speaker="LEO"):
+#     print(turn.text)
+
+
+############ SHOWNOTES TEXT ############
+"""Extract plain text from the downloaded PDF and htm shownotes, kept in output_directory's sn_files_shownotes_text folder. Only new or changed shownotes are extracted. PDFs need pypdf (pip install pypdf). To extract automatically after every download, set extract_shownotes_after_download in sn_files_user_variables.py."""
+# from sn_files_shownotes import update_shownotes_text, shownotes_text
+# update_shownotes_text(output_directory)
+# print(shownotes_text(output_directory, 950))
+
+
+############ PACKED ARCHIVE ############
+"""Optionally keep the txt transcripts and htm shownotes in one packed file (sn_files_archive.pack) rather than thousands of small files - quicker to back up and scan. New episodes are appended, and packed files still count as downloaded. remove_originals=True deletes the loose files once packed; export_packed_files writes them back out under their original names. Search, related episodes, transcript turns and shownotes text read packed files just like loose ones."""
+# from sn_files_pack import pack_files, read_packed_file, export_packed_files
+# pack_files(output_directory, remove_originals=True)
+# print(read_packed_file(output_directory, "sn-950.txt").decode("utf-8"))
+# export_packed_files(output_directory)
+
+
 
 
 
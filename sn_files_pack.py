@@ -0,0 +1,324 @@
+############## SECURITY NOW PODCAST FILES: PACKED ARCHIVE ##############
+"""
+Optionally keeps the many small txt transcripts and htm shownotes in one packed file (sn_files_archive.pack) instead of thousands of separate files, which makes backing up and scanning the output directory much quicker.
+
+Each file is compressed on its own and only ever appended to the end of the pack, so adding new episodes never rewrites what is already there, and any one file can be read back without decompressing the rest. export_packed_files turns the pack back into the original sn-xxx files at any time.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+
+import sn_files_utils
+from sn_files_utils import log_file_write, classify_filename, manifest_record, try_claim, release_claim
+
+######################### GLOBAL VARIABLE #########################
+
+pack_filename = "sn_files_archive.pack" # the packed file, in the output directory.
+pack_index_filename = "sn_files_archive.pack.idx" # where each file sits in the pack (JSON). Can always be rebuilt from the pack itself, see load_pack_index.
+pack_extensions = (".txt", ".htm") # PDFs are already compressed, and aren't small, so they are left as they are.
+
+pack_magic = b"SNPACK01" # the first 8 bytes of the pack
+# Before each file in the pack: b"SNRC", length of the filename, compressed size, original size, SHA-256 of the original. Then the filename (UTF-8), then the zlib-compressed file. A record with a compressed size of 0 (zlib never makes less than a few bytes) removes the file from the pack, see discard_packed_file.
+record_magic = b"SNRC"
+record_header = struct.Struct("<4sHQQ32s")
+
+
+######################### PACK INDEX #########################
+
+def pack_paths(output_directory):
+    """Returns (path of the pack, path of its index) in output_directory."""
+    return os.path.join(output_directory, pack_filename), os.path.join(output_directory, pack_index_filename)
+
+
+def scan_pack(pack_file, start, files):
+    """
+    Reads the record headers from start to the end of an open pack, adding each file to files (dict of filename: [data offset, compressed size, size, sha256]). A later copy of a file replaces an earlier one, and a removal record removes it.
+
+    Returns:
+        int: Where the last complete record ends. Anything after that is an unfinished append (e.g. the program was stopped part way) and is ignored.
+    """
+    pack_size = os.fstat(pack_file.fileno()).st_size
+    position = start
+    while position + record_header.size <= pack_size:
+        pack_file.seek(position)
+        magic, name_length, compressed_size, size, sha256 = record_header.unpack(pack_file.read(record_header.size))
+        data_offset = position + record_header.size + name_length
+        if magic != record_magic or data_offset + compressed_size > pack_size:
+            break
+        filename = pack_file.read(name_length).decode("utf-8")
+        if compressed_size:
+            files[filename] = [data_offset, compressed_size, size, sha256.hex()]
+        else:
+            files.pop(filename, None)
+        position = data_offset + compressed_size
+    return position
+
+
+def load_pack_index(output_directory):
+    """
+    Returns the index of the pack in output_directory: {"pack_size": bytes of the pack it covers, "files": {filename: [data offset, compressed size, size, sha256]}, "loose": {filename: [size, mtime_ns]}}. "loose" records the size and modification time of each loose file when it was last found to match its packed copy, so pack_files needn't read it again while they are unchanged.
+
+    If the index is missing, or the pack has grown since it was written (e.g. the program was stopped just after appending), the pack's record headers are read to bring it up to date, so the pack alone is always enough.
+    """
+    pack_path, index_path = pack_paths(output_directory)
+    index = {"pack_size": len(pack_magic), "files": {}, "loose": {}}
+    if not os.path.exists(pack_path):
+        return index
+    if os.path.exists(index_path):
+        with open(index_path, encoding="utf-8") as index_file:
+            index = json.load(index_file)
+        index.setdefault("loose", {})
+    if os.path.getsize(pack_path) > index["pack_size"]:
+        with open(pack_path, 'rb') as pack_file:
+            index["pack_size"] = scan_pack(pack_file, index["pack_size"], index["files"])
+    return index
+
+
+def save_pack_index(output_directory, index):
+    """Saves the pack index, replacing the old one in one step."""
+    index_path = pack_paths(output_directory)[1]
+    with open(index_path + ".tmp", "w", encoding="utf-8") as index_file:
+        json.dump(index, index_file)
+    os.replace(index_path + ".tmp", index_path)
+
+
+def packed_filenames(output_directory):
+    """Returns a dict of filename: (size, sha256) for every file in the pack."""
+    return {filename: (entry[2], entry[3]) for filename, entry in load_pack_index(output_directory)["files"].items()}
+
+
+######################### PACK FILES #########################
+
+def pack_files(output_directory, remove_originals=False):
+    """
+    Appends the txt transcripts and htm shownotes in output_directory to the pack, each compressed separately. Files already packed with the same contents are skipped (without even being read, if their size and modification time haven't changed since), and a file whose contents have changed is appended again (the newest copy is the one read back).
+
+    The files stay in the manifest, so they are not downloaded again, and last_downloaded_episode, grab_missing_files and verify_archive treat packed files as present.
+
+    Args:
+        output_directory (str): Directory holding the downloaded Security Now files.
+        remove_originals (bool): If True, delete each loose file once it is safely in the pack (this is what saves the space and inodes).
+
+    Returns:
+        int: The number of files appended to the pack.
+    """
+    if not try_claim(output_directory, "pack.claim", sn_files_utils.file_claim_max_age_seconds):
+        msg = "The pack is being updated by another process. Skipping.\n"
+        log_file_write(msg, sn_files_utils.log_path, logging.WARNING)
+        return 0
+    try:
+        pack_path = pack_paths(output_directory)[0]
+        index = load_pack_index(output_directory)
+
+        to_pack = {}
+        with os.scandir(output_directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(pack_extensions) and classify_filename(entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    to_pack[entry.name] = [stat.st_size, stat.st_mtime_ns]
+
+        appended = 0
+        packed = []
+        with open(pack_path, 'ab') as pack_file:
+            if pack_file.tell() == 0:
+                pack_file.write(pack_magic)
+            elif pack_file.tell() > index["pack_size"]:
+                pack_file.truncate(index["pack_size"]) # drop an unfinished append from an earlier run
+            pack_file.seek(0, os.SEEK_END)
+            for filename in sorted(to_pack):
+                packed.append(filename)
+                if filename in index["files"] and index["loose"].get(filename) == to_pack[filename]:
+                    continue # unchanged since it was packed
+                with open(os.path.join(output_directory, filename), 'rb') as file:
+                    contents = file.read()
+                sha256 = hashlib.sha256(contents)
+                entry = index["files"].get(filename)
+                index["loose"][filename] = to_pack[filename]
+                if entry and entry[3] == sha256.hexdigest():
+                    continue # already packed
+                compressed = zlib.compress(contents, 9)
+                name = filename.encode("utf-8")
+                pack_file.write(record_header.pack(record_magic, len(name), len(compressed), len(contents), sha256.digest()) + name)
+                data_offset = pack_file.tell()
+                pack_file.write(compressed)
+                index["files"][filename] = [data_offset, len(compressed), len(contents), sha256.hexdigest()]
+                appended += 1
+            pack_file.flush()
+            os.fsync(pack_file.fileno()) # safely on disk before any original is removed
+            index["pack_size"] = pack_file.tell()
+        save_pack_index(output_directory, index)
+
+        if remove_originals:
+            for filename in packed:
+                os.remove(os.path.join(output_directory, filename))
+                del index["loose"][filename]
+            save_pack_index(output_directory, index)
+    finally:
+        release_claim(output_directory, "pack.claim")
+
+    msg = f"Packed {appended} files into {pack_filename} ({len(index['files'])} files, {round(index['pack_size'] / 1024**2, 1)} MB in total).{f' Removed {len(packed)} loose files.' if remove_originals else ''}\n"
+    log_file_write(msg, sn_files_utils.log_path)
+    return appended
+
+
+def discard_packed_file(output_directory, filename):
+    """
+    Removes a file from the pack, e.g. because verify_archive found its packed copy damaged, so it isn't counted as downloaded any more (see manifest_reconcile) and is downloaded again. A removal record is appended, so the pack itself is never rewritten and the removal survives rebuilding the index from the pack.
+
+    Returns:
+        bool: True if the file was removed (or wasn't in the pack), False if the pack is being updated by another process.
+    """
+    if not try_claim(output_directory, "pack.claim", sn_files_utils.file_claim_max_age_seconds):
+        return False
+    try:
+        index = load_pack_index(output_directory)
+        if filename not in index["files"]:
+            return True
+        name = filename.encode("utf-8")
+        with open(pack_paths(output_directory)[0], 'ab') as pack_file:
+            if pack_file.tell() > index["pack_size"]:
+                pack_file.truncate(index["pack_size"]) # drop an unfinished append from an earlier run
+            pack_file.seek(0, os.SEEK_END)
+            pack_file.write(record_header.pack(record_magic, len(name), 0, 0, bytes(32)) + name)
+            pack_file.flush()
+            os.fsync(pack_file.fileno())
+            index["pack_size"] = pack_file.tell()
+        del index["files"][filename]
+        index["loose"].pop(filename, None)
+        save_pack_index(output_directory, index)
+    finally:
+        release_claim(output_directory, "pack.claim")
+    return True
+
+
+######################### READ / EXPORT FILES #########################
+
+def read_packed_file(output_directory, filename, index=None):
+    """
+    Reads one file from the pack. Only that file's bytes are read (the pack is memory-mapped) and decompressed.
+
+    Args:
+        output_directory (str): Directory holding the pack.
+        filename (str): Original filename, e.g. "sn-950.txt".
+        index (dict): Optional. The pack index from load_pack_index, to save loading it again when reading many files.
+
+    Returns:
+        bytes: The file's contents, exactly as downloaded, or None if it isn't in the pack.
+    """
+    index = index or load_pack_index(output_directory)
+    entry = index["files"].get(filename)
+    if entry is None:
+        return None
+    data_offset, compressed_size = entry[0], entry[1]
+    with open(pack_paths(output_directory)[0], 'rb') as pack_file:
+        with mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ) as packed:
+            return zlib.decompress(packed[data_offset:data_offset + compressed_size])
+
+
+def archive_files(output_directory, pattern, index=None):
+    """
+    Lists the downloaded files whose names match pattern, whether loose in output_directory or only in the pack. Used by search, related episodes, transcript turns and shownotes text, so they carry on working after pack_files(remove_originals=True).
+
+    Args:
+        output_directory (str): Directory holding the downloaded files (and the pack, if any).
+        pattern (re.Pattern): Filenames to list, e.g. txt_transcript_pattern.
+        index (dict): Optional. The pack index from load_pack_index.
+
+    Returns:
+        dict: filename: (size, change stamp). The stamp is the loose file's modification time (nanoseconds), or for a file only in the pack, where its copy starts in the pack (which moves on whenever a changed copy is appended). Either way, if the stamp changes, the file needs reading again.
+    """
+    index = index or load_pack_index(output_directory)
+    files = {filename: (entry[2], entry[0]) for filename, entry in index["files"].items() if pattern.match(filename)}
+    with os.scandir(output_directory) as entries:
+        for entry in entries:
+            if pattern.match(entry.name) and entry.is_file():
+                stat = entry.stat()
+                files[entry.name] = (stat.st_size, stat.st_mtime_ns) # a loose file is read in preference to its packed copy
+    return files
+
+
+def read_archive_file(output_directory, filename, index=None):
+    """
+    Reads a downloaded file: the loose file in output_directory if there is one, otherwise its copy in the pack.
+
+    Args:
+        output_directory (str): Directory holding the downloaded files (and the pack, if any).
+        filename (str): e.g. "sn-950.txt".
+        index (dict): Optional. The pack index from load_pack_index, to save loading it again when reading many packed files.
+
+    Returns:
+        bytes: The file's contents. Raises FileNotFoundError if it is neither loose nor packed.
+    """
+    try:
+        with open(os.path.join(output_directory, filename), 'rb') as file:
+            return file.read()
+    except FileNotFoundError:
+        contents = read_packed_file(output_directory, filename, index)
+        if contents is None:
+            raise
+        return contents
+
+
+def check_packed_file(output_directory, filename, recorded_sha256=None, index=None):
+    """
+    Checks one packed file, for verify_archive: decompresses it and compares its SHA-256 with the one saved in the pack (and the manifest's, if recorded).
+
+    Returns:
+        VerifyResult: The result, with sha256 set to the hash calculated.
+    """
+    index = index or load_pack_index(output_directory)
+    entry = index["files"][filename]
+    try:
+        contents = read_packed_file(output_directory, filename, index)
+    except (OSError, zlib.error) as e:
+        return sn_files_utils.VerifyResult(filename, entry[2], None, f"can't be read from {pack_filename} ({e})")
+    sha256 = hashlib.sha256(contents).hexdigest()
+    if sha256 != entry[3] or (recorded_sha256 is not None and sha256 != recorded_sha256):
+        return sn_files_utils.VerifyResult(filename, len(contents), sha256, f"packed copy in {pack_filename} is damaged (SHA-256 mismatch)")
+    if not contents:
+        return sn_files_utils.VerifyResult(filename, 0, sha256, "empty file")
+    return sn_files_utils.VerifyResult(filename, len(contents), sha256, None)
+
+
+def export_packed_files(output_directory, destination=None, filenames=None, overwrite=False):
+    """
+    Writes files from the pack back out under their original sn-xxx names, as used by last_downloaded_episode and the rest of the program.
+
+    Args:
+        output_directory (str): Directory holding the pack.
+        destination (str): Directory to write the files to. Defaults to output_directory, i.e. unpacking in place.
+        filenames (list): Optional. Only export these files. Defaults to every file in the pack.
+        overwrite (bool): If False, files already in destination are left alone.
+
+    Returns:
+        int: The number of files written.
+    """
+    destination = destination or output_directory
+    os.makedirs(destination, exist_ok=True)
+    index = load_pack_index(output_directory)
+    exported = 0
+    for filename in sorted(filenames or index["files"]):
+        file_path = os.path.join(destination, filename)
+        if filename not in index["files"] or (os.path.exists(file_path) and not overwrite):
+            continue
+        result = check_packed_file(output_directory, filename, index=index)
+        if result.problem:
+            msg_damaged = f"{filename}: {result.problem}. Not exported; run verify_archive to queue it to download again.\n"
+            log_file_write(msg_damaged, sn_files_utils.log_path, logging.WARNING)
+            continue
+        contents = read_packed_file(output_directory, filename, index)
+        with open(file_path + ".tmp", 'wb') as file:
+            file.write(contents)
+        os.replace(file_path + ".tmp", file_path)
+        if os.path.abspath(destination) != os.path.abspath(output_directory): # a new archive, so record the file in its manifest
+            episode, file_format = classify_filename(filename)
+            manifest_record(destination, filename, episode, file_format, len(contents), index["files"][filename][3])
+        exported += 1
+
+    msg = f"Exported {exported} files from {pack_filename} to {destination}.\n"
+    log_file_write(msg, sn_files_utils.log_path)
+    return exported
@@ -0,0 +1,234 @@
+############## SECURITY NOW PODCAST FILES: TRANSCRIPT SEARCH ##############
+from array import array
+from collections import namedtuple
+import os
+import re
+import sqlite3
+
+import sn_files_utils
+from sn_files_utils import log_file_write
+from sn_files_pack import archive_files, load_pack_index, read_archive_file
+
+######################### GLOBAL VARIABLE #########################
+
+search_index_filename = "sn_files_search_index.db" # SQLite inverted index of the txt transcripts, kept in the output directory next to the transcripts it indexes.
+
+# Only plain sn-xxx.txt transcripts are indexed. Group 1 is the episode number.
+txt_transcript_pattern = re.compile(r"sn-(\d+)\.txt$")
+
+# A 'word' for searching: letters and digits, allowing apostrophes inside words (e.g. "don't", "Gibson's"). Matched case-insensitively.
+token_pattern = re.compile(r"[a-z0-9]+(?:'[a-z0-9]+)*", re.IGNORECASE)
+
+# One search result: the episode, its transcript filename, the character offset of every match within the transcript, and a short snippet of text around the first match.
+SearchResult = namedtuple("SearchResult", ["episode", "filename", "offsets", "snippet"])
+
+
+######################### HELPER FUNCTIONS #########################
+
+def read_transcript(output_directory, filename, pack_index=None):
+    """Reads a txt transcript as text, from the loose file or else the pack (see read_archive_file). Transcripts are saved byte-for-byte as served by grc.com, so fall back to Windows-1252 if a file isn't valid UTF-8."""
+    raw = read_archive_file(output_directory, filename, pack_index)
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("cp1252", errors="replace")
+
+
+def tokenise(text):
+    """
+    Splits text into lower-case search terms.
+
+    Returns:
+        tuple: (terms (list of str), character offsets of each term in text (array of int)).
+    """
+    terms = []
+    offsets = array("I")
+    for match in token_pattern.finditer(text):
+        terms.append(match.group(0).lower())
+        offsets.append(match.start())
+    return terms, offsets
+
+
+######################### BUILD / UPDATE INDEX #########################
+
+def search_index_connect(output_directory):
+    """
+    Opens the inverted index in output_directory, creating it if needed.
+
+    The index has one row per (term, episode) holding the positions (word numbers) of that term in the episode's transcript, plus one row per transcript holding the character offset of every word, so matches can be found without reading the transcripts.
+
+    Returns:
+        sqlite3.Connection: Connection to the index.
+    """
+    connection = sqlite3.connect(os.path.join(output_directory, search_index_filename), timeout=30)
+    connection.execute("""CREATE TABLE IF NOT EXISTS documents (
+        episode INTEGER PRIMARY KEY,
+        filename TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        token_offsets BLOB NOT NULL)""")
+    connection.execute("""CREATE TABLE IF NOT EXISTS postings (
+        term TEXT NOT NULL,
+        episode INTEGER NOT NULL,
+        positions BLOB NOT NULL,
+        PRIMARY KEY (term, episode)) WITHOUT ROWID""")
+    connection.execute("CREATE INDEX IF NOT EXISTS postings_by_episode ON postings (episode)")
+    return connection
+
+
+def index_transcript(connection, output_directory, episode, filename, size, mtime_ns, pack_index=None):
+    """(Re)indexes a single transcript, replacing anything previously indexed for that episode."""
+    terms, offsets = tokenise(read_transcript(output_directory, filename, pack_index))
+
+    positions_by_term = {}
+    for position, term in enumerate(terms):
+        positions_by_term.setdefault(term, array("I")).append(position)
+
+    connection.execute("DELETE FROM postings WHERE episode = ?", (episode,))
+    connection.executemany("INSERT INTO postings (term, episode, positions) VALUES (?, ?, ?)", ((term, episode, positions.tobytes()) for term, positions in positions_by_term.items()))
+    connection.execute("INSERT OR REPLACE INTO documents (episode, filename, size, mtime_ns, token_offsets) VALUES (?, ?, ?, ?, ?)", (episode, filename, size, mtime_ns, offsets.tobytes()))
+
+
+def update_search_index(output_directory):
+    """
+    Brings the transcript search index up to date with the sn-xxx.txt files in output_directory, including any only kept in the pack (see sn_files_pack.py).
+
+    Only transcripts that are new, or whose size or modification time (change stamp, for packed files, see archive_files) has changed since they were last indexed, are read and indexed. Transcripts that have been deleted are removed from the index. The first run indexes everything and takes a little while; later runs take moments.
+
+    Args:
+        output_directory (str): Directory holding the downloaded txt transcripts.
+
+    Returns:
+        int: The number of transcripts (re)indexed.
+    """
+    connection = search_index_connect(output_directory)
+    indexed = {row[0]: (row[1], row[2]) for row in connection.execute("SELECT episode, size, mtime_ns FROM documents")}
+
+    pack_index = load_pack_index(output_directory)
+    on_disk = {int(txt_transcript_pattern.match(filename).group(1)): (filename, size, mtime_ns) for filename, (size, mtime_ns) in archive_files(output_directory, txt_transcript_pattern, pack_index).items()}
+
+    updated = 0
+    with connection: # one transaction for the whole update
+        for episode, (filename, size, mtime_ns) in sorted(on_disk.items()):
+            if indexed.get(episode) == (size, mtime_ns):
+                continue # unchanged since last indexed
+            index_transcript(connection, output_directory, episode, filename, size, mtime_ns, pack_index)
+            updated += 1
+
+        for episode in indexed.keys() - on_disk.keys():
+            connection.execute("DELETE FROM postings WHERE episode = ?", (episode,))
+            connection.execute("DELETE FROM documents WHERE episode = ?", (episode,))
+
+    connection.close()
+    msg = f"Search index updated: {updated} transcripts indexed, {len(on_disk)} transcripts in total.\n"
+    log_file_write(msg, sn_files_utils.log_path)
+    return updated
+
+
+######################### QUERY INDEX #########################
+
+def parse_query(query):
+    """
+    Splits a search query into phrases. Text in double quotes is one phrase, every other word is a phrase of its own.
+
+    Example:
+        'router "three dumb routers"' -> [["router"], ["three", "dumb", "routers"]]
+    """
+    phrases = []
+    for quoted, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        terms = tokenise(quoted or word)[0]
+        if terms:
+            phrases.append(terms)
+    return phrases
+
+
+def find_phrase(connection, phrase, ep_start, ep_stop):
+    """
+    Finds every occurrence of a phrase (a list of terms) in the index.
+
+    Returns:
+        dict: episode: list of word positions where the phrase starts.
+    """
+    found = None # episode: set of possible start positions, narrowed down term by term
+    for term_number, term in enumerate(phrase):
+        rows = connection.execute("SELECT episode, positions FROM postings WHERE term = ? AND episode BETWEEN ? AND ?", (term, ep_start, ep_stop))
+        starts_for_term = {}
+        for episode, positions_blob in rows:
+            if found is not None and episode not in found:
+                continue
+            positions = array("I")
+            positions.frombytes(positions_blob)
+            starts_for_term[episode] = {position - term_number for position in positions}
+
+        if found is None:
+            found = starts_for_term
+        else:
+            found = {episode: found[episode] & starts for episode, starts in starts_for_term.items()}
+        found = {episode: starts for episode, starts in found.items() if starts}
+        if not found:
+            return {}
+    return {episode: sorted(starts) for episode, starts in found.items()}
+
+
+def search_transcripts(output_directory, query, ep_start=None, ep_stop=None, snippet_length=200):
+    """
+    Searches the indexed txt transcripts. Run update_search_index first to pick up newly downloaded transcripts.
+
+    Every word and every "quoted phrase" in the query must appear in an episode for it to be returned. Matching ignores case and punctuation.
+
+    Args:
+        output_directory (str): Directory holding the downloaded txt transcripts and their index.
+        query (str): e.g. 'spinrite' or '"three dumb routers"' or '"hard drive" recommend'.
+        ep_start (int): Optional. Only search from this episode onwards.
+        ep_stop (int): Optional. Only search up to and including this episode.
+        snippet_length (int): Characters of text returned around the first match of each episode. 0 to skip reading the transcripts at all.
+
+    Returns:
+        list: SearchResult tuples, one per matching episode, in episode order.
+    """
+    phrases = parse_query(query)
+    if not phrases:
+        return []
+    ep_start = 1 if ep_start is None else ep_start
+    ep_stop = 2**31 if ep_stop is None else ep_stop
+
+    connection = search_index_connect(output_directory)
+    matches_by_phrase = []
+    for phrase in sorted(phrases, key=len, reverse=True): # longest phrases first, they usually narrow the results quickest
+        matches = find_phrase(connection, phrase, ep_start, ep_stop)
+        matches_by_phrase.append(matches)
+        if not matches:
+            connection.close()
+            return []
+
+    episodes = set(matches_by_phrase[0])
+    for matches in matches_by_phrase[1:]:
+        episodes &= set(matches)
+
+    results = []
+    pack_index = load_pack_index(output_directory) if snippet_length else None
+    for episode in sorted(episodes):
+        filename, offsets_blob = connection.execute("SELECT filename, token_offsets FROM documents WHERE episode = ?", (episode,)).fetchone()
+        token_offsets = array("I")
+        token_offsets.frombytes(offsets_blob)
+        offsets = sorted({token_offsets[position] for matches in matches_by_phrase for position in matches[episode]})
+
+        snippet = ""
+        if snippet_length:
+            text = read_transcript(output_directory, filename, pack_index)
+            start = max(0, offsets[0] - snippet_length // 2)
+            snippet = " ".join(text[start:start + snippet_length].split()) # tidy line breaks for display
+        results.append(SearchResult(episode, filename, offsets, snippet))
+
+    connection.close()
+    return results
+
+
+def print_search_results(results):
+    """Prints search results from search_transcripts, one episode per paragraph."""
+    if not results:
+        print("No matching episodes found.\n")
+        return
+    for result in results:
+        print(f"Episode #{result.episode} ({result.filename}) - {len(result.offsets)} matches\n    ...{result.snippet}...\n")
+    print(f"{len(results)} matching episodes found.\n")
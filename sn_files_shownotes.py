@@ -0,0 +1,220 @@
+############## SECURITY NOW PODCAST FILES: SHOWNOTES TEXT ##############
+"""
+Extracts plain text from the downloaded shownotes (sn-xxx-notes.pdf and the historical sn-xxx-notes.htm), so they can be read, searched or analysed like the txt transcripts.
+
+PDF shownotes need pypdf, which the rest of the program doesn't: pip install pypdf. htm shownotes only need the standard library.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import unicodedata
+
+import sn_files_utils
+from sn_files_utils import log_file_write
+from sn_files_pack import archive_files, read_archive_file
+
+######################### GLOBAL VARIABLE #########################
+
+shownotes_text_directory_name = "sn_files_shownotes_text" # folder in the output directory holding the extracted text, see update_shownotes_text.
+
+# Shownotes files as saved by grab_sn_shownotes_pdfs and grab_sn_shownotes_htm. Group 1 is the episode number, group 2 the extension.
+shownotes_pattern = re.compile(r"sn-(\d+)-notes\.(pdf|htm)$")
+
+# htm tags that start a new line of text, and tags whose contents aren't text at all.
+block_tags = {"address", "blockquote", "br", "dd", "div", "dl", "dt", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "li", "ol", "p", "pre", "table", "td", "th", "tr", "ul"}
+skipped_tags = {"head", "script", "style", "title"}
+
+
+######################### EXTRACT TEXT #########################
+
+class ShownotesHTMLParser(HTMLParser):
+    """Collects the visible text of an htm page, starting a new line at each paragraph, list item, table cell etc."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True) # &amp; etc. are turned into the characters they stand for
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in skipped_tags:
+            self.skipping += 1
+        elif tag in block_tags:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in skipped_tags:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in block_tags:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+
+def extract_htm_text(raw):
+    """Returns the visible text of an htm shownotes page, given its bytes. The old pages aren't always valid UTF-8, so fall back to Windows-1252."""
+    try:
+        page = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        page = raw.decode("cp1252", errors="replace")
+    parser = ShownotesHTMLParser()
+    parser.feed(page)
+    parser.close()
+    return "".join(parser.parts)
+
+
+def extract_pdf_text(raw):
+    """Returns the text of a PDF shownotes file, given its bytes, page by page. Raises ImportError if pypdf isn't installed."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ImportError("Extracting text from PDF shownotes needs pypdf. Install it with: pip install pypdf") from None
+    logging.getLogger("pypdf").setLevel(logging.ERROR) # damaged files are reported by update_shownotes_text, not pypdf's own warnings
+    reader = PdfReader(io.BytesIO(raw))
+    return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def normalise_text(text):
+    """
+    Tidies extracted text so PDF and htm shownotes look alike: unicode compatibility forms folded (e.g. "ﬁ" to "fi", non-breaking spaces to spaces), runs of spaces and tabs made one space, lines trimmed, and no more than one blank line in a row.
+    """
+    text = unicodedata.normalize("NFKC", text).replace("\r\n", "\n").replace("\r", "\n")
+    lines = [re.sub(r"[ \t\f\v]+", " ", line).strip() for line in text.split("\n")]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip() + "\n"
+
+
+def extract_shownotes_file(output_directory, filename, text_directory):
+    """
+    Extracts the text of one shownotes file (loose, or htm shownotes only kept in the pack) into text_directory as <sha256 of the file>.txt, unless text for a file with the same contents is already there. May run in a worker process.
+
+    Returns:
+        tuple: (sha256 (str), "extracted", "cached", "damaged: <error>" if the file couldn't be read, or the ImportError message if pypdf isn't installed).
+    """
+    raw = read_archive_file(output_directory, filename)
+    sha256 = hashlib.sha256(raw).hexdigest()
+    text_path = os.path.join(text_directory, f"{sha256}.txt")
+    if os.path.exists(text_path):
+        return sha256, "cached"
+
+    try:
+        if filename.endswith(".pdf"):
+            text = extract_pdf_text(raw)
+        else:
+            text = extract_htm_text(raw)
+    except ImportError as error:
+        return sha256, str(error)
+    except Exception as error: # a damaged file shouldn't stop the rest being extracted
+        return sha256, f"damaged: {type(error).__name__}: {error}"
+
+    temporary_path = f"{text_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        file.write(normalise_text(text))
+    os.replace(temporary_path, text_path)
+    return sha256, "extracted"
+
+
+######################### BUILD / UPDATE TEXT #########################
+
+def shownotes_text_paths(output_directory):
+    """Returns (folder holding the extracted text, path of its index.json) for output_directory."""
+    directory = os.path.join(output_directory, shownotes_text_directory_name)
+    return directory, os.path.join(directory, "index.json")
+
+
+def load_shownotes_index(output_directory):
+    """Returns the index of extracted shownotes: dict of filename: [size, mtime_ns, sha256]. sha256 is None for damaged files text couldn't be extracted from."""
+    index_path = shownotes_text_paths(output_directory)[1]
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, encoding="utf-8") as index_file:
+        return json.load(index_file)
+
+
+def update_shownotes_text(output_directory, filenames=None, workers=1):
+    """
+    Extracts plain text from the shownotes in output_directory (including htm shownotes only kept in the pack, see sn_files_pack.py) that are new or changed since this last ran.
+
+    The text is kept in the sn_files_shownotes_text folder, named by the SHA-256 of the shownotes file it came from, so a file is only ever extracted once even if it is renamed or re-downloaded. Files whose size and modification time haven't changed aren't even re-hashed. With workers above 1, extraction is spread across a pool of processes.
+
+    Called automatically after each download run if extract_shownotes_after_download is set in sn_files_user_variables.py.
+
+    Args:
+        output_directory (str): Directory holding the downloaded shownotes.
+        filenames (list): Optional. Only look at these shownotes files, e.g. the ones just downloaded.
+        workers (int): Number of processes to extract with. 1 (the default) extracts in this process, as download_jobs does. Worker processes are started fresh ("spawn") rather than as copies of this one, so it is safe even with download threads running. Like all spawned processes they re-import the script that started them, which sn_files_cli.py and sn_files_main.py only run their commands from under `if __name__ == "__main__":`.
+
+    Returns:
+        int: The number of shownotes files newly extracted.
+    """
+    text_directory, index_path = shownotes_text_paths(output_directory)
+    os.makedirs(text_directory, exist_ok=True)
+    index = load_shownotes_index(output_directory)
+
+    on_disk = {filename: stamp for filename, stamp in archive_files(output_directory, shownotes_pattern).items() if filenames is None or filename in filenames}
+
+    to_extract = sorted(filename for filename, (size, mtime_ns) in on_disk.items()
+                        if index.get(filename, [None, None, None])[:2] != [size, mtime_ns] or (index[filename][2] and not os.path.exists(os.path.join(text_directory, f"{index[filename][2]}.txt"))))
+    if filenames is None:
+        for filename in set(index) - set(on_disk): # shownotes since deleted
+            del index[filename]
+
+    if workers > 1 and len(to_extract) > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            outcomes = list(executor.map(extract_shownotes_file, [output_directory] * len(to_extract), to_extract, [text_directory] * len(to_extract), chunksize=8))
+    else:
+        outcomes = [extract_shownotes_file(output_directory, filename, text_directory) for filename in to_extract]
+
+    extracted = 0
+    failed = []
+    for filename, (sha256, outcome) in zip(to_extract, outcomes):
+        if outcome in ("extracted", "cached"):
+            index[filename] = [on_disk[filename][0], on_disk[filename][1], sha256]
+            extracted += outcome == "extracted"
+        else:
+            if outcome.startswith("damaged"): # remembered, so it isn't tried again until the file changes (e.g. is re-downloaded)
+                index[filename] = [on_disk[filename][0], on_disk[filename][1], None]
+            else:
+                index.pop(filename, None) # tried again next time, e.g. once pypdf is installed
+            failed.append(f"{filename} ({outcome})")
+
+    if filenames is None: # tidy away text no longer used by any shownotes file
+        in_use = {f"{entry[2]}.txt" for entry in index.values() if entry[2]}
+        for name in os.listdir(text_directory):
+            if name.endswith(".txt") and name not in in_use:
+                os.remove(os.path.join(text_directory, name))
+
+    with open(index_path + ".tmp", "w", encoding="utf-8") as index_file:
+        json.dump(index, index_file)
+    os.replace(index_path + ".tmp", index_path)
+
+    msg = f"Shownotes text updated: {extracted} files extracted, {len(to_extract) - extracted - len(failed)} matched earlier extractions, {sum(1 for entry in index.values() if entry[2])} shownotes with text in total.\n"
+    log_file_write(msg, sn_files_utils.log_path)
+    if failed:
+        msg_failed = f"Text couldn't be extracted from {len(failed)} shownotes files: {', '.join(failed)}\n"
+        log_file_write(msg_failed, sn_files_utils.log_path, logging.WARNING)
+    return extracted
+
+
+######################### READ TEXT #########################
+
+def shownotes_text(output_directory, episode):
+    """
+    Returns the extracted text of an episode's shownotes, or None if there is none (run update_shownotes_text first). If an episode has both PDF and htm shownotes, the PDF's text is returned.
+    """
+    text_directory = shownotes_text_paths(output_directory)[0]
+    index = load_shownotes_index(output_directory)
+    for extension in ("pdf", "htm"):
+        entry = index.get(f"sn-{episode:03}-notes.{extension}")
+        if entry and entry[2]:
+            text_path = os.path.join(text_directory, f"{entry[2]}.txt")
+            if os.path.exists(text_path):
+                with open(text_path, encoding="utf-8") as file:
+                    return file.read()
+    return None
@@ -0,0 +1,243 @@
+############## SECURITY NOW PODCAST FILES: RELATED EPISODES ##############
+"""
+Finds episodes that cover similar topics, by comparing the words used in their txt transcripts (TF-IDF cosine similarity).
+
+Needs numpy and scipy, which the rest of the program doesn't: pip install numpy scipy
+"""
+from collections import Counter, namedtuple
+import json
+import os
+
+import sn_files_utils
+from sn_files_utils import log_file_write
+from sn_files_search import read_transcript, tokenise, txt_transcript_pattern
+from sn_files_pack import archive_files, load_pack_index
+
+try: # optional dependencies, only needed for this module
+    import numpy
+    import scipy.sparse
+except ImportError:
+    numpy = None
+
+######################### GLOBAL VARIABLE #########################
+
+similarity_directory_name = "sn_files_similarity" # folder in the output directory holding the word count matrix, see update_similarity_index.
+similarity_arrays = ("counts", "terms", "rows", "weights", "weight_rows", "weight_starts", "idf") # each saved as <name>-<version>.npy, where meta.json says which version is current. The word count matrix by episode (CSR sparse format), the same matrix as TF-IDF weights by word (CSC sparse format), and each word's IDF.
+
+# One related episode: its number and how similar it is (cosine similarity from 0, nothing in common, to 1, identical).
+RelatedEpisode = namedtuple("RelatedEpisode", ["episode", "score"])
+
+
+######################### HELPER FUNCTIONS #########################
+
+def require_numpy():
+    """Raises ImportError with installation instructions if numpy / scipy aren't installed."""
+    if numpy is None:
+        raise ImportError("Related episode search needs numpy and scipy. Install them with: pip install numpy scipy")
+
+
+def similarity_paths(output_directory, version=0):
+    """Returns (folder, path of meta.json, dict of array name: path of <name>-<version>.npy) for the similarity index in output_directory."""
+    directory = os.path.join(output_directory, similarity_directory_name)
+    return directory, os.path.join(directory, "meta.json"), {name: os.path.join(directory, f"{name}-{version}.npy") for name in similarity_arrays}
+
+
+def load_arrays(output_directory):
+    """
+    Loads the arrays saved by update_similarity_index. They are memory-mapped, so only the parts used are read from disk.
+
+    Returns:
+        tuple: (meta (dict), dict of array name: numpy array), or (None, None) if there is no index yet.
+    """
+    meta_path = similarity_paths(output_directory)[1]
+    if not os.path.exists(meta_path):
+        return None, None
+    with open(meta_path, encoding="utf-8") as meta_file:
+        meta = json.load(meta_file)
+    array_paths = similarity_paths(output_directory, meta.get("version"))[2]
+    if not all(os.path.exists(path) for path in array_paths.values()): # saved by an earlier version of this program, so build it again
+        return None, None
+    return meta, {name: numpy.load(path, mmap_mode="r") for name, path in array_paths.items()}
+
+
+def load_counts(output_directory):
+    """
+    Loads the word count matrix saved by update_similarity_index.
+
+    Returns:
+        tuple: (meta (dict), counts (scipy.sparse.csr_matrix, one row per episode in meta["episodes"], one column per word in meta["vocabulary"])), or (None, None) if there is no index yet.
+    """
+    meta, arrays = load_arrays(output_directory)
+    if meta is None:
+        return None, None
+    return meta, scipy.sparse.csr_matrix((arrays["counts"], arrays["terms"], arrays["rows"]), shape=(len(meta["episodes"]), len(meta["vocabulary"])), copy=False)
+
+
+def tfidf_weights(counts):
+    """
+    Turns a word count matrix into TF-IDF weights, with each episode's row scaled to length 1 so a dot product between rows is their cosine similarity.
+
+    TF (term frequency) is 1 + log(count), so a word said 100 times doesn't count 100 times as much as one said once. IDF (inverse document frequency) is log((1 + episodes) / (1 + episodes using the word)) + 1, so words used in every episode ("the", "Steve") count for little and rarer topic words count for more.
+
+    Returns:
+        tuple: (weights (scipy.sparse.csr_matrix), idf (numpy array, one value per word)).
+    """
+    episode_count = counts.shape[0]
+    document_frequency = numpy.bincount(counts.indices, minlength=counts.shape[1])
+    idf = numpy.log((1 + episode_count) / (1 + document_frequency)) + 1
+    weights = counts.astype(numpy.float32) # a copy, so the saved counts aren't touched
+    weights.data = (1 + numpy.log(weights.data)) * idf[weights.indices]
+    row_lengths = numpy.sqrt(numpy.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+    row_lengths[row_lengths == 0] = 1
+    return scipy.sparse.diags(1 / row_lengths) @ weights, idf
+
+
+######################### BUILD / UPDATE INDEX #########################
+
+def update_similarity_index(output_directory):
+    """
+    Brings the related episodes index up to date with the sn-xxx.txt transcripts in output_directory, including any only kept in the pack (see sn_files_pack.py).
+
+    The index is a matrix of how many times each word is used in each transcript, saved in the sn_files_similarity folder as numpy arrays. Only transcripts that are new, or whose size or modification time has changed, are read. New words are added to the end of the vocabulary so the rest of the matrix is kept as it is, and words no longer used by any transcript are dropped. The TF-IDF weights are worked out again from the counts and saved arranged by word, so a search only reads the weights of the words it looks for. Adding an episode never means re-reading the others.
+
+    Args:
+        output_directory (str): Directory holding the downloaded txt transcripts.
+
+    Returns:
+        int: The number of transcripts (re)indexed.
+    """
+    require_numpy()
+    meta, counts = load_counts(output_directory)
+    if meta is None:
+        meta = {"version": 0, "episodes": [], "files": {}, "vocabulary": []}
+        counts = scipy.sparse.csr_matrix((0, 0), dtype=numpy.int32)
+
+    pack_index = load_pack_index(output_directory)
+    on_disk = {int(txt_transcript_pattern.match(filename).group(1)): (filename, list(stamp)) for filename, stamp in archive_files(output_directory, txt_transcript_pattern, pack_index).items()}
+
+    # Keep the rows of unchanged transcripts, re-read the rest
+    kept_rows = [row for row, episode in enumerate(meta["episodes"]) if episode in on_disk and meta["files"].get(str(episode)) == on_disk[episode][1]]
+    kept_episodes = [meta["episodes"][row] for row in kept_rows]
+    to_read = sorted(set(on_disk) - set(kept_episodes))
+    if not to_read and len(kept_rows) == len(meta["episodes"]):
+        msg = f"Related episodes index is up to date: {len(kept_rows)} transcripts.\n"
+        log_file_write(msg, sn_files_utils.log_path)
+        return 0
+
+    vocabulary = list(meta["vocabulary"])
+    term_numbers = {term: number for number, term in enumerate(vocabulary)}
+    new_counts, new_terms, new_rows = [], [], [0]
+    for episode in to_read:
+        word_counts = Counter(tokenise(read_transcript(output_directory, on_disk[episode][0], pack_index))[0])
+        for term in word_counts:
+            if term not in term_numbers:
+                term_numbers[term] = len(vocabulary)
+                vocabulary.append(term)
+        new_terms.extend(term_numbers[term] for term in word_counts)
+        new_counts.extend(word_counts.values())
+        new_rows.append(len(new_terms))
+
+    kept = counts[kept_rows] if kept_rows else scipy.sparse.csr_matrix((0, counts.shape[1]), dtype=numpy.int32)
+    kept.resize((len(kept_rows), len(vocabulary)))
+    added = scipy.sparse.csr_matrix((numpy.array(new_counts, dtype=numpy.int32), numpy.array(new_terms, dtype=numpy.int32), numpy.array(new_rows, dtype=numpy.int64)), shape=(len(to_read), len(vocabulary)))
+    combined = scipy.sparse.vstack([kept, added], format="csr")
+    combined.sort_indices()
+
+    # Drop words no longer used by any transcript (e.g. from one deleted or re-read), so the vocabulary doesn't keep growing
+    used_terms = numpy.unique(combined.indices)
+    if len(used_terms) < len(vocabulary):
+        new_numbers = numpy.zeros(len(vocabulary), dtype=numpy.int32)
+        new_numbers[used_terms] = numpy.arange(len(used_terms), dtype=numpy.int32)
+        combined = scipy.sparse.csr_matrix((combined.data, new_numbers[combined.indices], combined.indptr), shape=(combined.shape[0], len(used_terms)))
+        vocabulary = [vocabulary[term] for term in used_terms]
+    weights, idf = tfidf_weights(combined)
+    weights = weights.tocsc() # arranged by word
+    weights.sort_indices()
+
+    # Save the arrays under a new version number, then switch meta.json over to it in one step. Until meta.json is replaced it still points at the old arrays, which are untouched, so an interrupted update leaves the old index readable.
+    version = meta["version"] + 1
+    directory, meta_path, array_paths = similarity_paths(output_directory, version)
+    os.makedirs(directory, exist_ok=True)
+    for name, values in zip(similarity_arrays, (combined.data.astype(numpy.int32), combined.indices.astype(numpy.int32), combined.indptr.astype(numpy.int64),
+                                                weights.data.astype(numpy.float32), weights.indices.astype(numpy.int32), weights.indptr.astype(numpy.int64), idf.astype(numpy.float32))):
+        numpy.save(array_paths[name], values)
+    episodes = kept_episodes + to_read
+    meta = {"version": version, "episodes": episodes, "files": {str(episode): on_disk[episode][1] for episode in episodes}, "vocabulary": vocabulary}
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(meta_path + ".tmp", meta_path)
+    del counts, kept # let go of the memory-mapped old arrays before deleting them
+
+    current = {os.path.basename(path) for path in array_paths.values()}
+    for filename in os.listdir(directory): # the old version, and anything left by an interrupted update
+        if filename.endswith(".npy") and filename not in current:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError: # e.g. on Windows, still memory-mapped by a search running at the same time - removed next update
+                pass
+
+    msg = f"Related episodes index updated: {len(to_read)} transcripts indexed, {len(episodes)} transcripts and {len(vocabulary)} different words in total.\n"
+    log_file_write(msg, sn_files_utils.log_path)
+    return len(to_read)
+
+
+######################### QUERY INDEX #########################
+
+def related_episodes(output_directory, episode=None, text=None, top_k=10):
+    """
+    Finds the episodes most similar to an episode, or to some text. Run update_similarity_index first to pick up newly downloaded transcripts.
+
+    Args:
+        output_directory (str): Directory holding the downloaded txt transcripts and their index.
+        episode (int): Find episodes similar to this one (its txt transcript must be indexed).
+        text (str): Or, find episodes about this text, e.g. "quantum computing and post-quantum cryptography".
+        top_k (int): The number of episodes to return.
+
+    Returns:
+        list: RelatedEpisode tuples, most similar first. Empty if there is no index, or the episode isn't indexed, or none of the text's words are in any transcript.
+    """
+    require_numpy()
+    if (episode is None) == (text is None):
+        raise ValueError("Give either an episode number or some text.")
+
+    meta, arrays = load_arrays(output_directory)
+    if meta is None or not meta["episodes"]:
+        return []
+    shape = (len(meta["episodes"]), len(meta["vocabulary"]))
+    weights = scipy.sparse.csc_matrix((arrays["weights"], arrays["weight_rows"], arrays["weight_starts"]), shape=shape, copy=False)
+    episodes = numpy.array(meta["episodes"])
+
+    # The query as word numbers and TF-IDF weights: the episode's own row, or the text weighted the same way
+    if episode is not None:
+        rows = numpy.flatnonzero(episodes == episode)
+        if not len(rows):
+            return []
+        counts = scipy.sparse.csr_matrix((arrays["counts"], arrays["terms"], arrays["rows"]), shape=shape, copy=False)
+        query = counts[rows[0]] # only this row is read
+        columns, word_counts = query.indices, query.data
+    else:
+        term_numbers = {term: number for number, term in enumerate(meta["vocabulary"])}
+        text_counts = Counter(term for term in tokenise(text)[0] if term in term_numbers)
+        if not text_counts:
+            return []
+        columns, word_counts = numpy.array([term_numbers[term] for term in text_counts]), numpy.array(list(text_counts.values()))
+    values = (1 + numpy.log(word_counts.astype(numpy.float32))) * arrays["idf"][columns]
+    values /= numpy.linalg.norm(values)
+
+    scores = weights[:, columns] @ values # only the weights of the query's words are read
+    if episode is not None:
+        scores[episodes == episode] = -1 # leave the episode itself out
+    top_k = min(top_k, len(scores))
+    best = numpy.argpartition(-scores, top_k - 1)[:top_k] # the top_k best, in no particular order, without sorting every episode
+    best = best[numpy.argsort(-scores[best])]
+    return [RelatedEpisode(int(episodes[row]), round(float(scores[row]), 4)) for row in best if scores[row] > 0]
+
+
+def print_related_episodes(results):
+    """Prints results from related_episodes, one episode per line."""
+    if not results:
+        print("No related episodes found.\n")
+        return
+    for result in results:
+        print(f"Episode #{result.episode}  (similarity {result.score})")
+    print()
@@ -0,0 +1,307 @@
+############## SECURITY NOW PODCAST FILES: TRANSCRIPT TURNS ##############
+"""
+Splits the txt transcripts into speaker turns ("STEVE:  ...", "LEO:  ...") and keeps them in a compact column store in the output directory, so questions like "how much does each speaker say?" or "what did Leo say in episode 950?" are answered from a few arrays instead of re-reading and re-splitting every transcript.
+"""
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import json
+import mmap
+import multiprocessing
+import os
+import re
+
+import sn_files_utils
+from sn_files_utils import log_file_write
+from sn_files_search import read_transcript, token_pattern, txt_transcript_pattern
+from sn_files_pack import archive_files
+
+######################### GLOBAL VARIABLE #########################
+
+turns_directory_name = "sn_files_turns" # folder in the output directory holding the column store, see update_turn_store.
+
+# The columns of the store, one value per turn, each saved as <name>.bin. Array typecodes: "I" unsigned int, "H" unsigned short, "Q" unsigned long long.
+turn_columns = {
+    "episode": "I",
+    "turn": "I", # turn number within the episode, from 0
+    "speaker": "H", # number of the speaker's name in the speakers list (meta.json)
+    "offset": "I", # character offset of the start of the turn's text within the transcript
+    "words": "I", # number of words in the turn
+    "text_start": "Q", # byte offset of the turn's text (UTF-8) within text.bin
+    "text_length": "I", # byte length of the turn's text
+}
+
+# A speaker turn starts a line with the speaker's name in capitals, a colon and (usually two) spaces, e.g. "STEVE:  So this week...". Group 1 is the name, group 2 the start of the text.
+speaker_pattern = re.compile(r"([A-Z][A-Z.'\- ]{0,40}?):[ \t]+(\S.*)")
+
+# Labels used in the header at the top of each transcript, which look like speaker turns but aren't.
+header_labels = {"SERIES", "EPISODE", "DATE", "TITLE", "HOSTS", "SPEAKERS", "SOURCE", "ARCHIVE", "FILE ARCHIVE", "DESCRIPTION", "SHOW TEASE"}
+
+# Full names used for the first turn or two, mapped to the short name used for the rest of the episode, so each person is one speaker.
+speaker_aliases = {"STEVE GIBSON": "STEVE", "LEO LAPORTE": "LEO"}
+
+# One speaker turn.
+Turn = namedtuple("Turn", ["episode", "turn", "speaker", "offset", "text"])
+
+
+######################### PARSE TRANSCRIPTS #########################
+
+def parse_transcript(output_directory, filename, episode):
+    """
+    Generator of the speaker turns in a txt transcript, in order. The header (SERIES:, EPISODE: etc.) and the copyright notice at the end are left out.
+
+    A turn's text runs on over following paragraphs until the next speaker's name; paragraphs are joined with a single line break.
+
+    Yields:
+        Turn: (episode, turn number, speaker, character offset, text).
+    """
+    text = read_transcript(output_directory, filename)
+    turn_number = 0
+    speaker, offset, paragraphs = None, 0, []
+    line_start = 0
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        match = speaker_pattern.match(line)
+        if match and match.group(1) not in header_labels:
+            if speaker is not None:
+                yield Turn(episode, turn_number, speaker, offset, "\n".join(paragraphs))
+                turn_number += 1
+            speaker = speaker_aliases.get(match.group(1), match.group(1))
+            offset = line_start + match.start(2)
+            paragraphs = [match.group(2).strip()]
+        elif stripped.startswith("Copyright (c)"):
+            break # end of the transcript
+        elif stripped and speaker is not None:
+            paragraphs.append(stripped)
+        line_start += len(line)
+    if speaker is not None:
+        yield Turn(episode, turn_number, speaker, offset, "\n".join(paragraphs))
+
+
+def transcript_columns(episode, output_directory, filename):
+    """
+    Parses one transcript into columns, ready to add to the store. Runs in a worker process, so it returns plain arrays and bytes.
+
+    Returns:
+        tuple: (episode, dict of column name: array with speaker names in place of speaker numbers (list), UTF-8 text of every turn joined together (bytes)).
+    """
+    columns = {name: array(typecode) for name, typecode in turn_columns.items() if name not in ("episode", "speaker")}
+    speakers = []
+    text_parts = []
+    text_position = 0
+    for turn in parse_transcript(output_directory, filename, episode):
+        encoded = turn.text.encode("utf-8")
+        speakers.append(turn.speaker)
+        columns["turn"].append(turn.turn)
+        columns["offset"].append(turn.offset)
+        columns["words"].append(sum(1 for _ in token_pattern.finditer(turn.text)))
+        columns["text_start"].append(text_position) # relative to this episode's text, moved along when added to the store
+        columns["text_length"].append(len(encoded))
+        text_parts.append(encoded)
+        text_position += len(encoded)
+    columns["speaker"] = speakers
+    return episode, columns, b"".join(text_parts)
+
+
+######################### BUILD / UPDATE STORE #########################
+
+def turn_store_paths(output_directory):
+    """Returns (folder, path of meta.json, path of text.bin, dict of column name: path of <name>.bin) for the column store in output_directory."""
+    directory = os.path.join(output_directory, turns_directory_name)
+    return directory, os.path.join(directory, "meta.json"), os.path.join(directory, "text.bin"), {name: os.path.join(directory, f"{name}.bin") for name in turn_columns}
+
+
+def read_column(path, typecode):
+    """Reads a whole column file into an array."""
+    values = array(typecode)
+    with open(path, 'rb') as file:
+        values.frombytes(file.read())
+    return values
+
+
+def update_turn_store(output_directory, workers=1):
+    """
+    Brings the transcript turn store up to date with the sn-xxx.txt transcripts in output_directory, including any only kept in the pack (see sn_files_pack.py).
+
+    Only transcripts that are new, or whose size or modification time has changed, are parsed, spread across a pool of processes if workers is above 1. Turns of unchanged transcripts are copied across from the existing store without re-reading their transcripts.
+
+    Args:
+        output_directory (str): Directory holding the downloaded txt transcripts.
+        workers (int): Number of processes to parse with. 1 (the default) parses in this process. Worker processes are started fresh ("spawn") rather than as copies of this one, so no lock held by another thread (e.g. the log file's) is copied into them, and like all spawned processes they re-import the script that started them, which sn_files_cli.py and sn_files_main.py only run their commands from under `if __name__ == "__main__":`.
+
+    Returns:
+        int: The number of transcripts (re)parsed.
+    """
+    directory, meta_path, text_path, column_paths = turn_store_paths(output_directory)
+    meta = {"files": {}, "rows": {}, "speakers": []}
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+
+    on_disk = {int(txt_transcript_pattern.match(filename).group(1)): (filename, list(stamp)) for filename, stamp in archive_files(output_directory, txt_transcript_pattern).items()}
+
+    to_parse = sorted(episode for episode in on_disk if meta["files"].get(str(episode)) != on_disk[episode][1])
+    removed = [episode for episode in map(int, meta["files"]) if episode not in on_disk]
+    if not to_parse and not removed:
+        msg = f"Transcript turn store is up to date: {len(on_disk)} transcripts.\n"
+        log_file_write(msg, sn_files_utils.log_path)
+        return 0
+
+    if workers > 1 and len(to_parse) > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            parsed = {episode: (columns, text) for episode, columns, text in executor.map(transcript_columns, to_parse, [output_directory] * len(to_parse), [on_disk[episode][0] for episode in to_parse], chunksize=16)}
+    else:
+        parsed = {episode: transcript_columns(episode, output_directory, on_disk[episode][0])[1:] for episode in to_parse}
+
+    # Write the new store alongside the old one, copying unchanged episodes across in episode order, then swap it in
+    old_columns = {name: read_column(path, turn_columns[name]) for name, path in column_paths.items()} if os.path.exists(meta_path) else None
+    old_text = open(text_path, 'rb') if old_columns else None
+    speakers = list(meta["speakers"])
+    speaker_numbers = {speaker: number for number, speaker in enumerate(speakers)}
+    columns = {name: array(typecode) for name, typecode in turn_columns.items()}
+    rows = {}
+    os.makedirs(directory, exist_ok=True)
+    with open(text_path + ".tmp", 'wb') as new_text:
+        for episode in sorted(on_disk):
+            first_row = len(columns["episode"])
+            text_position = new_text.tell()
+            if episode in parsed:
+                episode_columns, episode_text = parsed[episode]
+                for speaker in episode_columns["speaker"]:
+                    if speaker not in speaker_numbers:
+                        speaker_numbers[speaker] = len(speakers)
+                        speakers.append(speaker)
+                columns["episode"].extend([episode] * len(episode_columns["turn"]))
+                columns["speaker"].extend(speaker_numbers[speaker] for speaker in episode_columns["speaker"])
+                for name in ("turn", "offset", "words", "text_length"):
+                    columns[name].extend(episode_columns[name])
+                columns["text_start"].extend(start + text_position for start in episode_columns["text_start"])
+                new_text.write(episode_text)
+            else:
+                old_first, old_stop = meta["rows"][str(episode)]
+                for name in columns:
+                    columns[name].extend(old_columns[name][old_first:old_stop])
+                if old_stop > old_first:
+                    old_start = old_columns["text_start"][old_first]
+                    old_text.seek(old_start)
+                    new_text.write(old_text.read(old_columns["text_start"][old_stop - 1] + old_columns["text_length"][old_stop - 1] - old_start))
+                    shift = text_position - old_start
+                    for row in range(first_row, len(columns["episode"])):
+                        columns["text_start"][row] += shift
+            rows[str(episode)] = [first_row, len(columns["episode"])]
+    if old_text:
+        old_text.close()
+
+    for name, values in columns.items():
+        with open(column_paths[name] + ".tmp", 'wb') as file:
+            values.tofile(file)
+    for path in list(column_paths.values()) + [text_path]:
+        os.replace(path + ".tmp", path)
+    meta = {"files": {str(episode): on_disk[episode][1] for episode in sorted(on_disk)}, "rows": rows, "speakers": speakers}
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(meta_path + ".tmp", meta_path)
+
+    msg = f"Transcript turn store updated: {len(to_parse)} transcripts parsed, {len(columns['episode'])} turns from {len(on_disk)} transcripts in total.\n"
+    log_file_write(msg, sn_files_utils.log_path)
+    return len(to_parse)
+
+
+######################### QUERY STORE #########################
+
+def load_turn_store(output_directory):
+    """
+    Loads the column store saved by update_turn_store. The turns' text isn't read, it is memory-mapped and only the turns asked for are read from disk.
+
+    Returns:
+        tuple: (meta (dict), dict of column name: array, text (mmap, or b"" if empty)), or (None, None, None) if there is no store yet.
+    """
+    directory, meta_path, text_path, column_paths = turn_store_paths(output_directory)
+    if not os.path.exists(meta_path):
+        return None, None, None
+    with open(meta_path, encoding="utf-8") as meta_file:
+        meta = json.load(meta_file)
+    columns = {name: read_column(path, turn_columns[name]) for name, path in column_paths.items()}
+    text = b""
+    if os.path.getsize(text_path):
+        with open(text_path, 'rb') as file:
+            text = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return meta, columns, text
+
+
+def speaker_summary(output_directory, ep_start=None, ep_stop=None):
+    """
+    Counts the turns and words of each speaker, from the columns alone (no text is read).
+
+    Args:
+        output_directory (str): Directory holding the turn store.
+        ep_start (int): Optional. Only count from this episode onwards.
+        ep_stop (int): Optional. Only count up to and including this episode.
+
+    Returns:
+        dict: speaker: (turns, words, episodes spoken in), most words first.
+    """
+    meta, columns, text = load_turn_store(output_directory)
+    if meta is None:
+        return {}
+    ep_start = 1 if ep_start is None else ep_start
+    ep_stop = 2**31 if ep_stop is None else ep_stop
+
+    turns = [0] * len(meta["speakers"])
+    words = [0] * len(meta["speakers"])
+    episodes = [set() for _ in meta["speakers"]]
+    for episode, speaker, word_count in zip(columns["episode"], columns["speaker"], columns["words"]):
+        if ep_start <= episode <= ep_stop:
+            turns[speaker] += 1
+            words[speaker] += word_count
+            episodes[speaker].add(episode)
+    summary = {meta["speakers"][number]: (turns[number], words[number], len(episodes[number])) for number in range(len(meta["speakers"])) if turns[number]}
+    return dict(sorted(summary.items(), key=lambda item: item[1][1], reverse=True))
+
+
+def find_turns(output_directory, episode=None, speaker=None, ep_start=None, ep_stop=None):
+    """
+    Generator of the speaker turns matching an episode and / or speaker, in episode order. Only the matching turns' text is read.
+
+    Args:
+        output_directory (str): Directory holding the turn store.
+        episode (int): Optional. Only turns from this episode.
+        speaker (str): Optional. Only turns by this speaker, e.g. "STEVE" (case doesn't matter).
+        ep_start (int): Optional. Only turns from this episode onwards.
+        ep_stop (int): Optional. Only turns up to and including this episode.
+
+    Yields:
+        Turn: (episode, turn number, speaker, character offset, text).
+    """
+    meta, columns, text = load_turn_store(output_directory)
+    if meta is None:
+        return
+    if episode is not None:
+        rows = range(*meta["rows"].get(str(episode), (0, 0))) # an episode's turns are stored together
+    else:
+        ep_start = 1 if ep_start is None else ep_start
+        ep_stop = 2**31 if ep_stop is None else ep_stop
+        rows = (row for row, row_episode in enumerate(columns["episode"]) if ep_start <= row_episode <= ep_stop)
+
+    speaker_number = None
+    if speaker is not None:
+        speaker = speaker_aliases.get(speaker.upper(), speaker.upper())
+        if speaker not in meta["speakers"]:
+            return
+        speaker_number = meta["speakers"].index(speaker)
+
+    for row in rows:
+        if speaker_number is not None and columns["speaker"][row] != speaker_number:
+            continue
+        start = columns["text_start"][row]
+        yield Turn(columns["episode"][row], columns["turn"][row], meta["speakers"][columns["speaker"][row]], columns["offset"][row], text[start:start + columns["text_length"][row]].decode("utf-8"))
+
+
+def print_speaker_summary(summary):
+    """Prints the results of speaker_summary, one speaker per line."""
+    if not summary:
+        print("No speaker turns found.\n")
+        return
+    for speaker, (turns, words, episodes) in summary.items():
+        print(f"{speaker}: {words} words in {turns} turns across {episodes} episodes")
+    print()
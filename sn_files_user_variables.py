@@ -28,4 +28,100 @@ Choose where log files should be saved, if use_log_file = True.
 - Directory will be created if it doesn't exist.
 """
 
-path_to_logs = r"." # specify a directory path. Supply "." for program directory, or "/" for root directory. Can be set to output_directory. Do not use None.
\ No newline at end of file
+path_to_logs = r"." # specify a directory path. Supply "." for program directory, or "/" for root directory. Can be set to output_directory. Do not use None.
+
+
+""" 
+Connection settings for requests to grc.com.
+- http_pool_size: number of connections kept open (and re-used) to grc.com.
+- http_connect_timeout: seconds to wait for a connection to grc.com to be established.
+- http_read_timeout: seconds to wait for the server to send data before giving up on a request.
+"""
+
+http_pool_size = 10 # integer, 1 or more
+http_connect_timeout = 10 # seconds
+http_read_timeout = 30 # seconds
+
+
+""" 
+Choose how politely (and how quickly) files are fetched from grc.com.
+- requests_per_second: the maximum number of requests made to grc.com per second, shared across all download threads. 2 matches the original 0.5 second courtesy pause between requests. Please be polite to Steve's server!
+- max_workers: how many files may be in flight at once. 1 downloads one file at a time. Higher values overlap network waiting time but never exceed requests_per_second. Keep http_pool_size at least as large as max_workers.
+"""
+
+requests_per_second = 2 # number greater than 0
+max_workers = 1 # integer, 1 or more
+
+
+""" 
+Choose how long to remember that a file isn't available on grc.com (a 404 response).
+- Files that returned a 404 are not requested again until this many days have passed, saving a wasted round-trip on every run.
+- Except for the two newest episodes: their transcripts and shownotes are often published hours or days apart, so a 404 or missing catalog link for them is always checked again on the next run.
+- The same applies to files the episode catalog (python sn_files_cli.py catalog) shows grc.com doesn't link to: they are skipped for this many days after the catalog last read the episode's entry, then requested again in case they have been published since.
+- Episodes documented as never having a given format (e.g. no PDF shownotes for #592) are always skipped.
+"""
+
+negative_cache_days = 30 # number of days, 0 to always re-check
+
+
+""" 
+Choose how much detail is printed and written to the log file.
+- "INFO" shows downloads, failures and progress, but hides one-line-per-file messages for files that are skipped because they already exist.
+- "DEBUG" shows everything, including every skipped file.
+- "WARNING" or "ERROR" show only problems.
+"""
+
+log_level = "INFO" # "DEBUG", "INFO", "WARNING" or "ERROR"
+
+
+""" 
+Optionally save detailed measurements of each download run as JSON.
+- Every run prints a summary (throughput, latency, per-format totals). Set a file path here to also save the summary plus every individual request's timings, e.g. r"sn_files_metrics.json". The file is overwritten by each run.
+- None to not save.
+"""
+
+metrics_json_path = None # e.g. r"sn_files_metrics.json" or None
+
+
+""" 
+Choose how failed requests are retried.
+- Connection failures, timeouts and "busy, try later" responses from grc.com are retried up to retry_max_retries times, so a large back-catalogue run completes in one go.
+- The wait before each retry is random, up to retry_backoff_seconds and doubling with each retry, never more than retry_backoff_max_seconds. If grc.com says how long to wait (Retry-After), that is used instead.
+- If grc.com signals it is overloaded, the request rate is also reduced automatically and recovers gradually.
+"""
+
+retry_max_retries = 4 # integer, 0 for no retries
+retry_backoff_seconds = 1 # seconds
+retry_backoff_max_seconds = 60 # seconds
+
+
+""" 
+Choose how watch mode (python sn_files_cli.py watch) checks for new episodes.
+- It checks every watch_poll_seconds whether the next episode's txt transcript has been published (one small request). Each check that finds nothing new waits a little longer, up to watch_max_poll_seconds, and it goes back to watch_poll_seconds as soon as something new is downloaded.
+- Files for a new episode that aren't published yet (shownotes PDFs often appear after the transcripts) are re-checked at every poll for up to watch_late_file_hours.
+"""
+
+watch_poll_seconds = 900 # seconds, i.e. 15 minutes
+watch_max_poll_seconds = 3600 # seconds
+watch_late_file_hours = 72 # hours
+
+
+""" 
+Choose whether to keep a shared cache of downloaded files.
+- If you keep several output directories (e.g. a full archive and a txt-only copy), set cache_directory to a folder they can all share. Every downloaded file is kept there once, and filling another output directory with a file already in the cache is a local copy (a hard link where possible, which takes no extra disk space) instead of downloading it again. Once a cached file is more than cache_revalidate_days old (since it was downloaded, or last checked), grc.com is asked (one small request, headers only) whether it has changed before it is used, so republished files aren't missed.
+- The least recently used files are removed when the cache grows beyond cache_max_mb.
+- None to turn the cache off.
+"""
+
+cache_directory = None # e.g. r"sn_files_cache/" or None
+cache_max_mb = 2048 # megabytes
+cache_revalidate_days = 7 # number of days, 0 to always check
+
+
+""" 
+Choose whether to extract plain text from shownotes as soon as they are downloaded.
+- If True, every download run finishes by extracting the text of any shownotes it downloaded (see update_shownotes_text in sn_files_shownotes.py), so they can be read and searched like the txt transcripts.
+- PDF shownotes need pypdf (pip install pypdf). Without it, only htm shownotes are extracted.
+"""
+
+extract_shownotes_after_download = False # True or False
@@ -1,17 +1,108 @@
 ############## SECURITY NOW PODCAST FILES: UTILITY FUNCTIONS ##############
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt
+import atexit
+import hashlib
+import html
+import json
+import logging
+import logging.handlers
+import queue
 import re
-import requests
 import os
+import random
+import shutil
+import socket
+import sqlite3
 import sys
+import threading
 import time
+# requests (and urllib3, which it is built on) are slow to import, so they are only imported the first time a request is made, by load_http_modules. Commands that never go online (e.g. search, verify) start faster without them.
 
-from sn_files_user_variables import use_log_file
+from sn_files_user_variables import use_log_file, log_level, http_pool_size, http_connect_timeout, http_read_timeout, max_workers, requests_per_second, negative_cache_days, metrics_json_path, retry_max_retries, retry_backoff_seconds, retry_backoff_max_seconds, watch_poll_seconds, watch_max_poll_seconds, watch_late_file_hours, cache_directory, cache_max_mb, cache_revalidate_days, extract_shownotes_after_download
 
 ######################### GLOBAL VARIABLE #########################
 
+grc_base_url = "https://www.grc.com" # every Security Now URL is built from this. Only changed to point the program at a local stand-in server, e.g. by sn_files_benchmark.py.
+
 log_path = "" # this is returned by the log_file_setup function. If use_log_file is set to True in sn_files_user_variables.py, log_path will be required by all functions that write to the log file. Thus, easier to provide global access.
 
+logger = logging.getLogger("sn_files") # all log file writes go through this logger, see log_file_setup.
+log_listener = None # background thread which writes queued log messages to the log file, started by log_file_setup.
+log_buffer_size = 100 # log messages held in memory before being written to the log file in one go. Errors are written straight away, and everything left is written when the program exits.
+
+requests = None # the requests module, imported on first use by load_http_modules
+urllib3 = None # the urllib3 module, imported on first use by load_http_modules
+TimedHTTPAdapter = None # requests transport adapter class, built on first use by load_http_modules
+
+http_session = None # shared requests.Session, created on first use by get_http_session(). Every request to grc.com goes through it so that connections are kept alive and re-used rather than paying a fresh TCP + TLS handshake per file.
+
+success_status_codes = (200, 206) # a file was downloaded: in full, or the rest of a resumed download
+retry_status_codes = (429, 500, 502, 503, 504) # responses meaning "try again later" rather than "this file doesn't exist".
+overload_status_codes = (429, 503) # responses meaning the server wants fewer requests, so the shared request rate is reduced.
+watch_page_check_seconds = 6 * 3600 # in watch mode, also re-check securitynow.htm this often (a cheap conditional request) in case episodes are published without a txt transcript.
+retry_after_max_seconds = 600 # longest Retry-After wait honoured. If the server asks for longer, the request is given up for this run.
+late_file_episodes = 2 # the newest episodes, whose files may still be published late (transcripts and shownotes often appear hours or days apart), so a 404 for them is never trusted. See late_file_first_episode.
+
+rate_limiter = None # shared TokenBucket, created on first use by get_rate_limiter(). Enforces the global requests_per_second cap across all download threads.
+
+download_chunk_size = 64 * 1024 # bytes read from the network and written to disk at a time when streaming a download, so memory use stays the same whatever the file size.
+
+manifest_filename = "sn_files_manifest.db" # SQLite index of the downloaded archive, kept in the output directory. See the ARCHIVE MANIFEST section.
+manifest_connections = {} # open manifest connections, one per output directory, re-used for the whole run.
+manifest_lock = threading.RLock() # the manifest connections are shared between download threads, so only one thread may use them at a time.
+
+cache_filename = "sn_files_cache.db" # index of the shared file cache, kept in cache_directory (see sn_files_user_variables.py).
+cache_connection = None # open connection to the cache index, see cache_connect.
+cache_lock = threading.RLock() # the cache index connection is shared by all download threads.
+
+claims_directory_name = ".sn_files_claims" # folder in the output directory holding claim and lease files, so that several processes (e.g. overlapping cron runs) never download the same file at once. See try_claim.
+file_claim_max_age_seconds = 3600 # a file claim older than this is assumed abandoned (no single download takes this long).
+shard_lease_max_age_seconds = 6 * 3600 # a shard lease older than this is assumed abandoned.
+takeover_lock_max_age_seconds = 60 # taking over an abandoned claim takes a moment, so a takeover lock older than this was left by a crash.
+
+# Episode catalog (see update_catalog): the header starting an episode's entry on grc.com, "Episode&nbsp;#1000 | 22 Oct 2024 | ..." (an "Episode&nbsp;#950" mentioned in a description isn't followed by "|"), the date in it, and links to an episode's files, e.g. href="/sn/sn-1000-notes.pdf". Episode 3's and 23's htm shownotes are at /nat/nat.htm and /wmf/wmf.htm.
+catalog_entry_pattern = re.compile(r"Episode&nbsp;#(\d+)(?=(?:\s|&nbsp;)*\|)")
+catalog_date_pattern = re.compile(r"(\d{1,2} [A-Z][a-z]{2} \d{4})")
+catalog_link_pattern = re.compile(r"""href=["']?[^"'>\s]*?(?:sn-(\d+)(\.pdf|\.txt|-notes\.pdf)|notes-(\d+)\.htm|(nat/nat|wmf/wmf)\.htm)""", re.IGNORECASE)
+catalog_link_formats = {".pdf": "pdf_transcript", ".txt": "txt_transcript", "-notes.pdf": "pdf_shownotes"}
+
+# Matches every Security Now filename this program saves, e.g. sn-001.pdf, sn-001.txt, sn-432-notes.pdf, sn-001-notes.htm. Group 1 is the episode number, group 2 is "-notes" for shownotes, group 3 is the extension.
+sn_filename_pattern = re.compile(r"sn-(\d+)(-notes)?\.(pdf|txt|htm)$")
+
+# Each file format grc.com publishes: (description used in log messages, first available episode, last available episode). None as the last episode means "up to latest_episode".
+file_formats = {
+    "pdf_transcript": ("PDF transcript", 1, None),
+    "txt_transcript": ("text transcript", 1, None),
+    "pdf_shownotes": ("PDF shownotes", 432, None),
+    "htm_shownotes": ("htm shownotes", 1, 177),
+}
+
+# Episodes grc.com never published in a format (see the grab_sn_shownotes_pdfs and grab_sn_shownotes_htm docstrings). These are seeded into the manifest's negative cache so they are never requested.
+known_missing_episodes = {
+    "pdf_shownotes": [592, 643, 747, 851, 954],
+    "htm_shownotes": [138, 139, 140, 146, 148, 149, 150, 151, 152, 154, 156, 158, 159, 160, 161, 162, 163, 165, 166, 167, 168, 169, 170, 171, 172, 173, 174, 175],
+}
+
+fetch_timing = threading.local() # timings of the request currently being made by this thread (connection set-up, time to first byte), read by download_file for the run metrics.
+run_metrics = [] # one FetchRecord per request made since the last metrics_reset.
+metrics_lock = threading.Lock()
+run_history_length = 20 # number of previous runs' measured throughput kept in the manifest, used by request_time_est.
+
+# Measurements for one request: url, file format, HTTP status (None if the request failed), bytes received, seconds spent opening a new connection (0 if a kept-alive connection was re-used), seconds to first byte, total seconds, and number of retries.
+FetchRecord = namedtuple("FetchRecord", ["url", "file_format", "status", "bytes", "connect", "ttfb", "total", "retries"])
+cache_check_format = "cache_check" # file_format of the FetchRecord for a HEAD request checking a cached file is still current (see cache_entry_is_current). Counted as a request, but not as a download.
+
+# A single file to be downloaded: episode number, format key (see grab_* functions), source url, target filename and a human-readable description for log messages.
+DownloadJob = namedtuple("DownloadJob", ["episode", "file_format", "url", "filename", "description"])
+
+# Result of checking one archive file: its filename, size on disk, SHA-256 hash (None if not re-hashed) and what's wrong with it (None if nothing).
+VerifyResult = namedtuple("VerifyResult", ["filename", "size", "sha256", "problem"])
+
+# One episode in the catalog (see update_catalog): episode number, title, date (YYYY-MM-DD), and the set of file_formats keys grc.com links to for it.
+CatalogEntry = namedtuple("CatalogEntry", ["episode", "title", "date", "formats"])
+
 
 ######################### SETUP OUTPUT DIRECTORY #########################
 
@@ -70,11 +161,11 @@ def log_file_setup(use_log_file, path_to_logs):
             sys.exit(1)
     try:    
         if os.path.exists(log_path):
+            start_log_listener(log_path)
             return True
         if not os.path.exists(log_path):
             os.makedirs(path_to_logs, exist_ok=True)
-            with open(log_path, 'a'):
-                pass
+            start_log_listener(log_path)
             msg_success = ("Log File Setup - Successful.\n")
             log_file_write(msg_success, log_path)
             return True
@@ -87,117 +178,990 @@ def log_file_setup(use_log_file, path_to_logs):
             sys.exit(1)
 
 
+def start_log_listener(log_path):
+    """
+    Opens the log file once and starts a background thread that writes log messages to it.
+
+    log_file_write only puts messages on a queue, so downloads never wait for the log file. The background thread collects them in a buffer of log_buffer_size messages and writes them in batches, keeping the file open for the whole run rather than re-opening it for every message. Anything still buffered is written when the program exits (see stop_log_listener).
+
+    Args:
+        log_path (str): Full path of the log file.
+    """
+    global log_listener
+    if log_listener is not None:
+        return
+
+    file_handler = logging.FileHandler(log_path, mode="a")
+    file_handler.terminator = "" # messages already end with a newline
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s", datefmt="%Y-%m-%d_%H-%M-%S"))
+    buffered_handler = logging.handlers.MemoryHandler(log_buffer_size, flushLevel=logging.ERROR, target=file_handler)
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(getattr(logging, log_level))
+    logger.propagate = False # messages are printed by log_file_write, not by the logging module
+
+    log_listener = logging.handlers.QueueListener(log_queue, buffered_handler)
+    log_listener.buffered_handler = buffered_handler
+    log_listener.start()
+    atexit.register(stop_log_listener)
+
+
+def stop_log_listener():
+    """Writes any messages still queued or buffered to the log file and closes it. Runs automatically when the program exits."""
+    global log_listener
+    if log_listener is None:
+        return
+    log_listener.stop() # waits for the queue to empty
+    log_listener.buffered_handler.close() # flushes the buffer to the file and closes it
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    log_listener = None
+
+
 ######################### HELPER FUNCTIONS #########################
 
-def log_file_write(msg, log_path):
+def log_file_write(msg, log_path, level=logging.INFO):
     """
     Supplied message is printed to screen and written to the log file, prepended with a timestamp. If use_log_file is set to False, the message is only printed to screen.
 
+    Messages below log_level (sn_files_user_variables.py) are neither printed nor logged, e.g. the "already exists. Skipping." messages are logging.DEBUG so are hidden unless log_level is "DEBUG".
+
     Args:
         msg (str): Message to be written to log file.
-        log_path (str): Full path of log file to which status messages are written.
+        log_path (str): Full path of log file to which status messages are written. The log file is opened once by log_file_setup, so this is only kept so existing calls still work.
+        level (int): Importance of the message: logging.DEBUG, logging.INFO (default), logging.WARNING or logging.ERROR.
     
     Note:
         'use_log_file' (bool): set in sn_files_user_variables.py, should be a True or False to control whether logging to file is enabled.
     
     Returns: None
     """
+    if level < getattr(logging, log_level):
+        return
     print(msg)
-    if use_log_file == False:
+    if use_log_file == False or log_listener is None:
         return
     else:
-        formatted_timestamp = dt.now().strftime("%Y-%m-%d_%H-%M-%S")
-        msg_timestamped = f"{formatted_timestamp} - " + msg
-        with open(log_path, "a") as log_file:
-            log_file.write(msg_timestamped)
+        logger.log(level, msg) # queued, and written to the log file by the background thread
+
+
+def request_time_est(ep_start, ep_stop, output_directory=None, request_count=None):
+    """
+    Calculates and prints/logs the expected time to run.
 
+    If output_directory is given and previous runs have been measured (see metrics_report), the estimate uses the median requests per second actually achieved on those runs. Otherwise, or if that is faster than the requests_per_second courtesy limit set in sn_files_user_variables.py, the courtesy limit is used.
 
-def request_time_est(ep_start, ep_stop):
-    """Calculates and prints/logs the expected time to run based on a 0.5 second pause between requests."""
-    seconds = (((int(ep_stop)+1)-int(ep_start))*0.5)
+    Args:
+        ep_start, ep_stop (int): Episode range to be requested.
+        output_directory (str): Optional. Directory whose manifest holds the measured throughput of previous runs.
+        request_count (int): Optional. Number of requests, if not one per episode in the range.
+    """
+    if request_count is None:
+        request_count = (int(ep_stop)+1)-int(ep_start)
+
+    rate = requests_per_second
+    basis = f"a courtesy limit of {requests_per_second} requests per second"
+    history = manifest_state_get(output_directory, "run_history", []) if output_directory else []
+    if history:
+        measured_rates = sorted(run["requests_per_second"] for run in history)
+        measured_rate = measured_rates[len(measured_rates) // 2]
+        if measured_rate < rate:
+            rate = measured_rate
+            basis = f"the {round(rate, 2)} requests per second measured over the last {len(history)} runs"
+
+    seconds = round(request_count/rate, 1)
     minutes = round(seconds/60, 2)
-    msg_time = f"It is expected that this function will take at least {seconds} seconds to run ({minutes} minutes) to run based on a 0.5 second courtesy pause between requests, if all files in the range are available.\n"
+    msg_time = f"It is expected that this function will take at least {seconds} seconds to run ({minutes} minutes) based on {basis}, if all files in the range are available.\n"
     log_file_write(msg_time, log_path)
 
 
+######################### RUN METRICS #########################
+
+def metrics_reset():
+    """Clears the measurements of previous requests, ready to measure a new run."""
+    with metrics_lock:
+        run_metrics.clear()
+
+
+def record_fetch(fetch_record):
+    """Adds the measurements of one request (a FetchRecord) to the current run's metrics."""
+    with metrics_lock:
+        run_metrics.append(fetch_record)
+
+
+def percentile(values, fraction):
+    """Returns the value below which the given fraction (e.g. 0.95) of the sorted values fall (nearest-rank method)."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def metrics_report(output_directory, elapsed_seconds):
+    """
+    Summarises the requests made since metrics_reset: throughput, latency percentiles and per-format totals. The summary is printed / logged, saved as JSON to metrics_json_path if that is set in sn_files_user_variables.py, and the measured request rate is added to the run history used by request_time_est.
+
+    Args:
+        output_directory (str): Directory whose manifest stores the run history.
+        elapsed_seconds (float): Wall-clock duration of the run.
+
+    Returns:
+        dict: The summary, or None if no requests were made.
+    """
+    with metrics_lock:
+        records = list(run_metrics)
+    if not records:
+        return None
+
+    elapsed_seconds = max(elapsed_seconds, 0.001)
+    cache_checks = [record for record in records if record.file_format == cache_check_format]
+    downloaded = [record for record in records if record.status in success_status_codes and record.file_format != cache_check_format]
+    total_bytes = sum(record.bytes for record in records)
+    new_connections = [record.connect for record in records if record.connect > 0]
+
+    per_format = {}
+    for record in records:
+        if record.file_format == cache_check_format:
+            continue
+        totals = per_format.setdefault(record.file_format, {"requests": 0, "downloaded": 0, "failed": 0, "bytes": 0})
+        totals["requests"] += 1
+        totals["bytes"] += record.bytes
+        if record.status in success_status_codes:
+            totals["downloaded"] += 1
+        else:
+            totals["failed"] += 1
+
+    status_counts = {}
+    for record in records:
+        status_counts[str(record.status)] = status_counts.get(str(record.status), 0) + 1
+
+    summary = {
+        "finished_at": dt.now().strftime("%Y-%m-%d_%H-%M-%S"),
+        "elapsed_seconds": round(elapsed_seconds, 3),
+        "requests": len(records),
+        "files_downloaded": len(downloaded),
+        "cache_checks": len(cache_checks),
+        "bytes": total_bytes,
+        "megabytes_per_second": round(total_bytes / elapsed_seconds / 1_000_000, 3),
+        "files_per_second": round(len(downloaded) / elapsed_seconds, 3),
+        "requests_per_second": round(len(records) / elapsed_seconds, 3),
+        "latency_p50_seconds": round(percentile([record.total for record in records], 0.5), 3),
+        "latency_p95_seconds": round(percentile([record.total for record in records], 0.95), 3),
+        "ttfb_p50_seconds": round(percentile([record.ttfb for record in records], 0.5), 3),
+        "ttfb_p95_seconds": round(percentile([record.ttfb for record in records], 0.95), 3),
+        "new_connections": len(new_connections),
+        "connect_mean_seconds": round(sum(new_connections) / len(new_connections), 3) if new_connections else 0,
+        "retries": sum(record.retries for record in records),
+        "status_codes": status_counts,
+        "per_format": per_format,
+    }
+
+    msg_summary = (f"Run summary: {summary['files_downloaded']} files downloaded from {summary['requests']} requests in {summary['elapsed_seconds']} seconds. "
+                   f"{summary['megabytes_per_second']} MB/s, {summary['files_per_second']} files/s. "
+                   f"Latency p50 {summary['latency_p50_seconds']}s, p95 {summary['latency_p95_seconds']}s (time to first byte p50 {summary['ttfb_p50_seconds']}s). "
+                   f"{summary['new_connections']} new connections (mean set-up {summary['connect_mean_seconds']}s), {summary['retries']} retries."
+                   f"{f' {len(cache_checks)} of the requests checked that cached files were still current (see cache_revalidate_days).' if cache_checks else ''}\n")
+    log_file_write(msg_summary, log_path)
+    for file_format, totals in per_format.items():
+        msg_format = f"    {file_format}: {totals['downloaded']} downloaded, {totals['failed']} failed, {round(totals['bytes'] / 1_000_000, 2)} MB.\n"
+        log_file_write(msg_format, log_path)
+
+    if metrics_json_path:
+        try:
+            with open(metrics_json_path, "w") as metrics_file:
+                json.dump({"summary": summary, "requests": [record._asdict() for record in records]}, metrics_file, indent=2)
+        except OSError as e:
+            msg_error = f"Error, unable to save run metrics to {metrics_json_path} - {e}\n"
+            log_file_write(msg_error, log_path, logging.ERROR)
+
+    # Remember the measured rate for future time estimates
+    history = manifest_state_get(output_directory, "run_history", [])
+    history.append({"finished_at": summary["finished_at"], "requests": summary["requests"], "requests_per_second": summary["requests_per_second"], "files_per_second": summary["files_per_second"]})
+    manifest_state_set(output_directory, "run_history", history[-run_history_length:])
+    return summary
+
+
+######################### RATE LIMITING #########################
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter, shared by every download thread.
+
+    Tokens are added at 'rate' per second, up to 'capacity'. Each request takes one token, waiting if none are available, so however many threads are running the program never exceeds 'rate' requests per second to grc.com.
+
+    Args:
+        rate (float): Tokens added per second, i.e. the maximum sustained requests per second.
+        capacity (int): Maximum tokens that can be saved up. 1 means no bursts at all.
+    """
+
+    def __init__(self, rate, capacity=1):
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        self.rate = rate
+        self.max_rate = rate # slow_down / speed_up move the rate between max_rate and min_rate
+        self.min_rate = rate / 16
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Takes one token, sleeping until one is available if necessary."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait) # sleep outside the lock so other threads can check in
+
+    def slow_down(self):
+        """Halves the request rate (down to min_rate). Called when the server signals it is overloaded (429 / 503).
+
+        Returns:
+            float: The new rate.
+        """
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            return self.rate
+
+    def speed_up(self):
+        """Creeps the request rate back up by a tenth of max_rate after a successful request, so a reduced rate recovers gradually once the server is happy again."""
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+def get_rate_limiter():
+    """Returns the shared TokenBucket, creating it on first use with the requests_per_second value from sn_files_user_variables.py."""
+    global rate_limiter
+    if rate_limiter is None:
+        rate_limiter = TokenBucket(requests_per_second)
+    return rate_limiter
+
+
+######################### RETRIES #########################
+
+def backoff_delay(retry_number):
+    """
+    Seconds to wait before retry number retry_number (0 for the first retry): a random time between 0 and retry_backoff_seconds * 2^retry_number, capped at retry_backoff_max_seconds.
+
+    The randomness ("jitter") stops several download threads that failed together from all retrying at the same moment.
+    """
+    return random.uniform(0, min(retry_backoff_max_seconds, retry_backoff_seconds * 2 ** retry_number))
+
+
+def retry_after_seconds(response):
+    """
+    Reads a response's Retry-After header, which may be a number of seconds or an HTTP date.
+
+    Returns:
+        float: Seconds the server asked us to wait, or None if the header is missing or can't be understood.
+    """
+    from email.utils import parsedate_to_datetime # only needed here, and rarely, so not imported at start-up
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    if retry_after.strip().isdigit():
+        return float(retry_after)
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+######################### HTTP SESSION #########################
+
+def load_http_modules():
+    """
+    Imports requests and urllib3 the first time a request is about to be made, and builds TimedHTTPAdapter on top of them. Does nothing after the first call.
+
+    Every function which makes requests, or catches their errors (requests.RequestException), calls this first.
+    """
+    global requests, urllib3, TimedHTTPAdapter
+    if TimedHTTPAdapter is not None:
+        return
+    import requests
+    import urllib3
+
+    class TimedHTTPConnection(urllib3.connection.HTTPConnection):
+        """urllib3 connection which records how long it took to open (DNS lookup + TCP connect) in fetch_timing, for the run metrics."""
+
+        def connect(self):
+            started = time.perf_counter()
+            super().connect()
+            fetch_timing.connect = getattr(fetch_timing, "connect", 0) + time.perf_counter() - started
+
+    class TimedHTTPSConnection(urllib3.connection.HTTPSConnection):
+        """urllib3 connection which records how long it took to open (DNS lookup + TCP connect + TLS handshake) in fetch_timing, for the run metrics."""
+
+        def connect(self):
+            started = time.perf_counter()
+            super().connect()
+            fetch_timing.connect = getattr(fetch_timing, "connect", 0) + time.perf_counter() - started
+
+    class TimedHTTPConnectionPool(urllib3.connectionpool.HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+    class TimedHTTPSConnectionPool(urllib3.connectionpool.HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+    class TimedAdapter(requests.adapters.HTTPAdapter):
+        """requests transport adapter whose pooled connections record their set-up time (see TimedHTTPConnection)."""
+
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+    TimedHTTPAdapter = TimedAdapter
+
+
+def get_http_session():
+    """
+    Returns the shared requests.Session used for every request to grc.com, creating it on first use.
+
+    The session's connection pool keeps connections to grc.com alive between requests (HTTP keep-alive), so only the first request of a run pays for the TCP + TLS handshake.
+
+    Note:
+        'http_pool_size' (int): set in sn_files_user_variables.py, the maximum number of pooled connections kept open per host.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global http_session
+    if http_session is None:
+        load_http_modules()
+        http_session = requests.Session()
+        adapter = TimedHTTPAdapter(pool_connections=http_pool_size, pool_maxsize=http_pool_size)
+        http_session.mount("https://", adapter)
+        http_session.mount("http://", adapter)
+    return http_session
+
+
+def http_request(method, url, **kwargs):
+    """
+    Sends a request through the shared session, after waiting for the shared rate limiter. All fetches in this program should use this (usually via http_get or http_head) instead of a bare requests.get.
+
+    Connection failures, timeouts and "try again later" responses (429, 500, 502, 503, 504) are retried up to retry_max_retries times, waiting for the server's Retry-After time if it gives one, otherwise an exponentially increasing random delay (see backoff_delay). A 429 or 503 also halves the shared request rate for every thread, which then recovers gradually as requests succeed.
+
+    Args:
+        method (str): HTTP method, e.g. "GET" or "HEAD".
+        url (str): URL to request.
+        **kwargs: Any further keyword arguments accepted by requests.Session.request (e.g. stream=True, headers={...}).
+
+    Note:
+        'http_connect_timeout' and 'http_read_timeout' (int or float, seconds): set in sn_files_user_variables.py, used unless a timeout is passed explicitly.
+        'retry_max_retries', 'retry_backoff_seconds' and 'retry_backoff_max_seconds': set in sn_files_user_variables.py.
+        After the call, fetch_timing holds this thread's measurements for the final attempt: 'started' (time.perf_counter() when the request was sent, after any rate limiter wait), 'connect' (seconds opening a new connection, 0 if one was re-used), 'ttfb' (seconds until the response headers arrived) and 'retries' (number of earlier attempts that failed).
+
+    Returns:
+        requests.Response: The server's response. This may still be a 429 / 5xx if every retry failed.
+
+    Raises:
+        requests.RequestException: If the request still fails or times out after every retry.
+    """
+    load_http_modules()
+    kwargs.setdefault("timeout", (http_connect_timeout, http_read_timeout))
+    limiter = get_rate_limiter()
+    retries = 0
+    while True:
+        limiter.acquire()
+        fetch_timing.connect = 0
+        fetch_timing.retries = retries
+        fetch_timing.started = time.perf_counter()
+        try:
+            response = get_http_session().request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if retries >= retry_max_retries:
+                raise
+            delay = backoff_delay(retries)
+            msg_retry = f"Request for {url} failed ({e}). Retrying in {round(delay, 1)} seconds.\n"
+        else:
+            fetch_timing.ttfb = time.perf_counter() - fetch_timing.started # with stream=True the body hasn't been read yet, so this is time to first byte
+            if response.status_code not in retry_status_codes:
+                limiter.speed_up()
+                return response
+            if response.status_code in overload_status_codes:
+                new_rate = limiter.slow_down()
+                msg_slow = f"grc.com responded {response.status_code} (overloaded). Reducing request rate to {round(new_rate, 2)} requests per second.\n"
+                log_file_write(msg_slow, log_path, logging.WARNING)
+            delay = retry_after_seconds(response)
+            if delay is None:
+                delay = backoff_delay(retries)
+            if retries >= retry_max_retries or delay > retry_after_max_seconds:
+                return response # give up, the caller reports the status code
+            response.close()
+            msg_retry = f"Request for {url} returned status code {response.status_code}. Retrying in {round(delay, 1)} seconds.\n"
+        log_file_write(msg_retry, log_path, logging.WARNING)
+        time.sleep(delay)
+        retries += 1
+
+
+def http_get(url, **kwargs):
+    """Sends a GET request with http_request (rate limited, with retries). Takes the same keyword arguments as requests.get."""
+    return http_request("GET", url, **kwargs)
+
+
+def http_head(url, **kwargs):
+    """Sends a HEAD request (headers only, no file body) with http_request (rate limited, with retries). Takes the same keyword arguments as requests.head."""
+    return http_request("HEAD", url, **kwargs)
+
+
+def close_http_session():
+    """Closes the shared session and its pooled connections. A new session will be created if another request is made afterwards."""
+    global http_session
+    if http_session is not None:
+        http_session.close()
+        http_session = None
+
+
 ################ DETERMINE LATEST AVAILABLE EPISODE NUMBER ################
 
-def latest_episode_number():
+def scan_episode_numbers(chunks):
+    """
+    Generator which yields each 'Episode&nbsp;#___' number on the Security Now webpage, in page order, as soon as it has been read.
+
+    Works on the page as a stream of byte chunks, keeping only a few bytes between chunks in case a match is split across two of them. The caller can therefore stop reading the page (and close the connection) as soon as it has the number it needs.
+
+    Args:
+        chunks (iterable): Byte chunks of the page, e.g. response.iter_content(...).
+
+    Yields:
+        int: Each episode number found.
+    """
+    prefix = b"Episode&nbsp;#"
+    episode_pattern = re.compile(rb"Episode&nbsp;#(\d+)")
+    carry_over = b""
+    for chunk in chunks:
+        buffer = carry_over + chunk
+        scanned_up_to = 0
+        unfinished_match_start = None
+        for match in episode_pattern.finditer(buffer):
+            if match.end() == len(buffer): # the digits may carry on in the next chunk, so wait for it
+                unfinished_match_start = match.start()
+                break
+            yield int(match.group(1))
+            scanned_up_to = match.end()
+        if unfinished_match_start is not None:
+            carry_over = buffer[unfinished_match_start:]
+        else:
+            # keep just enough of the end of the buffer to complete a prefix (or a prefix still waiting for its digits) cut off by the chunk boundary
+            carry_over = buffer[max(scanned_up_to, len(buffer) - len(prefix)):]
+    for match in episode_pattern.finditer(carry_over): # end of page, so any match left is complete
+        yield int(match.group(1))
+
+
+def latest_episode_number(output_directory=None):
     """Determines the latest episode number by scraping the Security Now podcast webpage at grc.com.
+
+    The page is read as a stream and the download stops as soon as the first 'Episode&nbsp;#' is found, so usually only the top of the page is transferred.
+
+    If output_directory is given, the page's ETag / Last-Modified validators and the episode number found are saved in that directory's manifest. The next call then makes a conditional request, and if the server answers 304 Not Modified the saved episode number is used without downloading or parsing the page again.
+
+    Args:
+        output_directory (str): Optional. Directory whose manifest stores the page validators between runs.
     
     Returns:
         int: The latest episode number, if found.
-
-    Raises:
-        requests.RequestException or ValueError: If the request to the webpage fails.
-        Exception: If the webpage parse is unsuccessful.
+        None: If the request or the parse was unsuccessful (the error is logged).
 
     """
-    base_url = "https://www.grc.com/securitynow.htm"
+    load_http_modules()
+    base_url = f"{grc_base_url}/securitynow.htm"
+    global latest_episode
+
+    # Validators from the last successful check, if any, so the server can tell us the page hasn't changed
+    cached_page = manifest_state_get(output_directory, "securitynow_htm") if output_directory else None
+    conditional_headers = {}
+    if cached_page and cached_page.get("etag"):
+        conditional_headers["If-None-Match"] = cached_page["etag"]
+    if cached_page and cached_page.get("last_modified"):
+        conditional_headers["If-Modified-Since"] = cached_page["last_modified"]
+
     try: 
-        response = requests.get(base_url)
-        if response.status_code == 200:
-            html_content = response.text
-            # Remove this after tested
-            # with open("security_now_webpage.txt", "w") as sn_html_file:
-            #     sn_html_file.write(html_content)
+        with http_get(base_url, headers=conditional_headers, stream=True) as response: # leaving the 'with' block closes the connection, even if the rest of the page hasn't been read
+            if response.status_code == 304 and cached_page:
+                latest_episode = cached_page["latest_episode"]
+                msg_success = f"{base_url} unchanged since last checked. The most recent Security Now episode to be published at grc.com is: Episode #{latest_episode}.\n"
+                log_file_write(msg_success, log_path)
+                return latest_episode
+            elif response.status_code != 200:
+                raise ValueError(f"Unexpected status code: {response.status_code}")
+
             msg_success = f"Successfully requested {base_url}.\n"
             log_file_write(msg_success, log_path)
-        else:
-            raise ValueError(f"Unexpected status code: {response.status_code}") 
+
+            episode_numbers = scan_episode_numbers(response.iter_content(chunk_size=8 * 1024))
+
+            # Method 1: Take the first instance of the pattern (in current webpage format this will be the latest episode) and stop reading
+            found_episode = next(episode_numbers, None)
+            if found_episode is None:
+                msg_error = f"Error, could not find latest episode number on Security Now webpage. URL queried: {base_url}.\n"
+                log_file_write(msg_error, log_path, logging.ERROR)
+                return None
+
+            # Method 2: If the first number is lower than the latest episode seen on a previous run, the page layout has probably changed, so carry on through the rest of the same stream keeping the highest number. This will only be attempted if Method 1 looks wrong.
+            previous_latest = cached_page["latest_episode"] if cached_page else None
+            if previous_latest is not None and found_episode < previous_latest:
+                msg_error = f"First episode number on the Security Now webpage (#{found_episode}) is lower than previously seen (#{previous_latest}). Scanning the whole page for the highest number instead.\n"
+                log_file_write(msg_error, log_path, logging.WARNING)
+                for episode in episode_numbers:
+                    found_episode = max(found_episode, episode)
+
+            latest_episode = found_episode
+            msg_success = f"The most recent Security Now episode to be published at grc.com is: Episode #{latest_episode}.\n"
+            log_file_write(msg_success, log_path)
+
+            # Save the page validators with the episode number found, for the next conditional request
+            if output_directory:
+                manifest_state_set(output_directory, "securitynow_htm", {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified"), "latest_episode": latest_episode})
+            return latest_episode
+
     except requests.RequestException as e:
         msg_error = f"Error, request failed for {base_url} - {e}\n"
-        log_file_write(msg_error, log_path)
+        log_file_write(msg_error, log_path, logging.ERROR)
     except Exception as e:
         msg_error = f"Error, request failed for {base_url} - {e}\n"
-        log_file_write(msg_error, log_path)
-         
-    # Regex to find the latest 'Episode #___', formatted in html
-    episode_pattern = re.compile(r"Episode&nbsp;#(\d+)")
-    
-    try: 
-        # Method 1: Find first instance of the pattern (in current webpage format this will be the latest episode)
-        first_episode_match = episode_pattern.search(html_content)
-        if first_episode_match:
-            global latest_episode
-            latest_episode = int(first_episode_match.group(1))
-            msg_success = f"The most recent Security Now episode to be published at grc.com is: Episode #{latest_episode}.\n"
-            log_file_write(msg_success, log_path)
-            return latest_episode
+        log_file_write(msg_error, log_path, logging.ERROR)
+
+
+########################## ARCHIVE MANIFEST ############################
+
+def classify_filename(filename):
+    """
+    Works out the episode number and file format of a Security Now filename in the original naming convention.
+
+    Args:
+        filename (str): A filename such as "sn-001.pdf", "sn-001.txt", "sn-432-notes.pdf" or "sn-001-notes.htm".
+
+    Returns:
+        tuple: (episode (int), file_format (str)) where file_format is one of "pdf_transcript", "txt_transcript", "pdf_shownotes", "htm_shownotes".
+        None: If the filename isn't a Security Now file.
+    """
+    match = sn_filename_pattern.match(filename)
+    if not match:
+        return None
+    episode = int(match.group(1))
+    is_notes = match.group(2) is not None
+    extension = match.group(3)
+    if is_notes and extension == "pdf":
+        return episode, "pdf_shownotes"
+    if is_notes and extension == "htm":
+        return episode, "htm_shownotes"
+    if not is_notes and extension == "pdf":
+        return episode, "pdf_transcript"
+    if not is_notes and extension == "txt":
+        return episode, "txt_transcript"
+    return None # e.g. sn-001-notes.txt or sn-001.htm are not files grc.com publishes
+
+
+def manifest_connect(output_directory):
+    """
+    Returns the open connection to the archive manifest in output_directory, creating the manifest if needed.
+
+    The manifest is a small SQLite database (sn_files_manifest.db) recording, for every downloaded file: episode, format, size, SHA-256 hash and fetch time. It lets the program know what is already downloaded without listing or probing the output directory file by file, which is slow on network drives.
+
+    If the manifest doesn't exist yet (e.g. first run against an existing archive), it is built straight away by manifest_reconcile.
+
+    Args:
+        output_directory (str): Directory holding the downloaded Security Now files.
+
+    Returns:
+        sqlite3.Connection: Connection to the manifest. Use with manifest_lock held.
+    """
+    key = os.path.abspath(output_directory)
+    if key in manifest_connections:
+        return manifest_connections[key]
+
+    db_path = os.path.join(output_directory, manifest_filename)
+    is_new = not os.path.exists(db_path)
+    connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    connection.execute("""CREATE TABLE IF NOT EXISTS files (
+        filename TEXT PRIMARY KEY,
+        episode INTEGER NOT NULL,
+        file_format TEXT NOT NULL,
+        size INTEGER,
+        sha256 TEXT,
+        fetched_at TEXT)""")
+    connection.execute("CREATE INDEX IF NOT EXISTS files_by_format ON files (file_format, episode)")
+    # Negative cache: files grc.com answered 404 for. 'permanent' rows are the documented gaps and never expire.
+    connection.execute("""CREATE TABLE IF NOT EXISTS missing_files (
+        filename TEXT PRIMARY KEY,
+        episode INTEGER NOT NULL,
+        file_format TEXT NOT NULL,
+        status_code INTEGER,
+        checked_at REAL,
+        permanent INTEGER NOT NULL DEFAULT 0)""")
+    # Partly downloaded files (<filename>.part) that can be resumed with a Range request, with the validator (ETag / Last-Modified) and full size the server gave when the download started
+    connection.execute("""CREATE TABLE IF NOT EXISTS partial_files (
+        filename TEXT PRIMARY KEY,
+        url TEXT NOT NULL,
+        validator TEXT NOT NULL,
+        expected_size INTEGER,
+        updated_at REAL)""")
+    # Episode catalog from grc.com's episode pages, see update_catalog. formats is a JSON list of file_formats keys linked for the episode.
+    connection.execute("""CREATE TABLE IF NOT EXISTS catalog (
+        episode INTEGER PRIMARY KEY,
+        title TEXT,
+        date TEXT,
+        formats TEXT NOT NULL,
+        updated_at REAL)""")
+    # Small key/value store (values saved as JSON) for anything else worth remembering between runs, e.g. validators for the securitynow.htm page
+    connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+    for file_format, episodes in known_missing_episodes.items():
+        for episode in episodes:
+            filename = episode_url_and_filename(episode, file_format)[1]
+            connection.execute("INSERT OR IGNORE INTO missing_files (filename, episode, file_format, status_code, checked_at, permanent) VALUES (?, ?, ?, 404, ?, 1)", (filename, episode, file_format, time.time()))
+    connection.commit()
+    manifest_connections[key] = connection
+
+    if is_new:
+        manifest_reconcile(output_directory)
+    return connection
+
+
+def manifest_record(output_directory, filename, episode, file_format, size, sha256):
+    """Adds (or updates) one downloaded file in the manifest. Called by download_file after every successful download."""
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        fetched_at = dt.now().strftime("%Y-%m-%d_%H-%M-%S")
+        connection.execute("INSERT OR REPLACE INTO files (filename, episode, file_format, size, sha256, fetched_at) VALUES (?, ?, ?, ?, ?, ?)", (filename, episode, file_format, size, sha256, fetched_at))
+        connection.execute("DELETE FROM missing_files WHERE filename = ?", (filename,)) # it exists after all
+        connection.commit()
+
+
+def manifest_filenames(output_directory):
+    """Returns the set of filenames recorded in the manifest, i.e. the files already downloaded to output_directory."""
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        return {row[0] for row in connection.execute("SELECT filename FROM files")}
+
+
+def manifest_has_file(output_directory, filename):
+    """Whether a file is recorded in the manifest right now. Unlike manifest_filenames, which is read once per run, this sees files just downloaded by other processes."""
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        return connection.execute("SELECT 1 FROM files WHERE filename = ?", (filename,)).fetchone() is not None
+
+
+def manifest_state_get(output_directory, key, default=None):
+    """Returns the value saved under key by manifest_state_set, or default if nothing has been saved."""
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        row = connection.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else default
+
+
+def manifest_state_set(output_directory, key, value):
+    """Saves any JSON-serialisable value in the manifest under key, to be read back on a later run with manifest_state_get."""
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+        connection.commit()
+
+
+def negative_cache_record(output_directory, job, status_code):
+    """Records in the manifest's negative cache that grc.com doesn't have this file (e.g. a 404), so it isn't requested again until negative_cache_days have passed."""
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        connection.execute("INSERT OR REPLACE INTO missing_files (filename, episode, file_format, status_code, checked_at, permanent) VALUES (?, ?, ?, ?, ?, COALESCE((SELECT permanent FROM missing_files WHERE filename = ?), 0))", (job.filename, job.episode, job.file_format, status_code, time.time(), job.filename))
+        connection.commit()
+
+
+def late_file_first_episode(output_directory):
+    """
+    Returns the first of the newest late_file_episodes episodes known to this archive, going by the latest episode number last read from grc.com, the manifest, the negative cache and the catalog. Files for these episodes may not be published yet, so their absence is never trusted.
+    """
+    latest = (manifest_state_get(output_directory, "securitynow_htm") or {}).get("latest_episode") or 0
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        for query in ("SELECT MAX(episode) FROM files", "SELECT MAX(episode) FROM missing_files WHERE permanent = 0", "SELECT MAX(episode) FROM catalog"): # not the documented gaps, which are always there
+            latest = max(latest, connection.execute(query).fetchone()[0] or 0)
+    return latest - late_file_episodes + 1
+
 
+def negative_cache_filenames(output_directory):
+    """
+    Returns the set of filenames known to be missing from grc.com: the documented gaps, plus any file that returned a 404 within the last negative_cache_days (sn_files_user_variables.py).
+
+    A 404 for one of the newest episodes (see late_file_first_episode) isn't included, as grc.com often publishes an episode's files hours or days apart, so the next run asks again. Once newer episodes are out, the 404 counts like any other, for negative_cache_days after it was last seen.
+    """
+    oldest_valid = time.time() - negative_cache_days * 24 * 60 * 60
+    first_late_episode = late_file_first_episode(output_directory)
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        return {row[0] for row in connection.execute("SELECT filename FROM missing_files WHERE permanent = 1 OR (checked_at >= ? AND episode < ?)", (oldest_valid, first_late_episode))}
+
+
+def negative_cache_clear(output_directory, include_permanent=False):
+    """Forgets recorded 404s so those files are requested again on the next run. The documented gaps are kept unless include_permanent is True."""
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        if include_permanent:
+            connection.execute("DELETE FROM missing_files")
         else:
-            msg_error = f"Error, could not find latest episode number on Security Now webpage using Method 1. URL queried: {base_url}.\n"
-            log_file_write(msg_error, log_path)
-            # should go on to try the other method
-
-            try:       
-                # Method 2: find all instances and extract the highest number. This will only be attempted if Method 1 fails.
-                all_episode_matches = episode_pattern.findall(html_content)
-                if all_episode_matches:
-                    highest_episode_number = max(map(int, all_episode_matches))
-                    msg_success = f"Latest episode number found: Episode #{highest_episode_number}.\n"
-                    log_file_write(msg_success, log_path)
-                    return highest_episode_number
-                else:
-                    msg_error = f"Error, could not find latest episode number on Security Now webpag using Method 2. URL queried: {base_url}.\n"
-                    log_file_write(msg_error, log_path)
-                    raise Exception("Webpage requested but parse of content unsuccessful.")
-            except Exception as e:
-                raise Exception   
+            connection.execute("DELETE FROM missing_files WHERE permanent = 0")
+        connection.commit()
 
-    except Exception as e:
-        msg_error = f"Error, could not find latest episode number on Security Now webpage. URL queried: {base_url}. Error: {e}.\n"
-        log_file_write(msg_error, log_path)
 
+def partial_record(output_directory, filename, url, validator, expected_size):
+    """Remembers that <filename>.part holds the start of a download that can be resumed later. validator is the ETag or Last-Modified value the server sent with it."""
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        connection.execute("INSERT OR REPLACE INTO partial_files (filename, url, validator, expected_size, updated_at) VALUES (?, ?, ?, ?, ?)", (filename, url, validator, expected_size, time.time()))
+        connection.commit()
+
+
+def partial_get(output_directory, filename):
+    """Returns (url, validator, expected_size) recorded for a resumable <filename>.part, or None."""
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        return connection.execute("SELECT url, validator, expected_size FROM partial_files WHERE filename = ?", (filename,)).fetchone()
+
+
+def partial_clear(output_directory, filename):
+    """Forgets a partial download, e.g. once it has completed or can't be resumed."""
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        connection.execute("DELETE FROM partial_files WHERE filename = ?", (filename,))
+        connection.commit()
+
+
+def manifest_last_episodes(output_directory):
+    """Returns a dict of file_format: highest episode number recorded in the manifest, for each format that has at least one file."""
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        return dict(connection.execute("SELECT file_format, MAX(episode) FROM files GROUP BY file_format"))
+
+
+def manifest_reconcile(output_directory):
+    """
+    Rebuilds the manifest from what is actually in output_directory, using a single os.scandir pass.
+
+    Run this if files have been added, renamed or deleted by hand, since the program otherwise trusts the manifest rather than checking the directory. Files already in the manifest with an unchanged size keep their recorded hash and fetch time. Files no longer on disk (or in the packed archive, see sn_files_pack.py) are removed from the manifest.
+
+    Args:
+        output_directory (str): Directory holding the downloaded Security Now files.
+
+    Returns:
+        int: The number of Security Now files found.
+    """
+    found = {}
+    with os.scandir(output_directory) as entries:
+        for entry in entries:
+            classified = classify_filename(entry.name)
+            if classified and entry.is_file():
+                found[entry.name] = (classified[0], classified[1], entry.stat().st_size)
+
+    from sn_files_pack import packed_filenames # imported here, as sn_files_pack imports this module
+    packed = packed_filenames(output_directory)
+    for filename, (size, sha256) in packed.items(): # files kept only in the packed archive (see pack_files) are still part of the archive
+        classified = classify_filename(filename)
+        if classified and filename not in found:
+            found[filename] = (classified[0], classified[1], size)
+
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        known = {row[0]: row[1:] for row in connection.execute("SELECT filename, size, sha256, fetched_at FROM files")}
+        rows = []
+        for filename, (episode, file_format, size) in found.items():
+            old_size, sha256, fetched_at = known.get(filename, (None, None, None))
+            if old_size != size: # new or changed file, so any recorded hash no longer applies
+                sha256, fetched_at = None, None
+            rows.append((filename, episode, file_format, size, sha256, fetched_at))
+        connection.execute("DELETE FROM files")
+        connection.executemany("INSERT INTO files (filename, episode, file_format, size, sha256, fetched_at) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        connection.commit()
+
+    msg = f"Manifest reconciled with {output_directory}: {len(found)} Security Now files found.\n"
+    log_file_write(msg, log_path)
+    return len(found)
+
+
+########################## EPISODE CATALOG ############################
+
+def parse_catalog_page(page_html):
+    """
+    Reads every episode listed on a grc.com Security Now page (securitynow.htm or one of the yearly archive pages, /sn/past/YYYY.htm).
+
+    Each episode's entry starts with a header, "Episode&nbsp;#NNN | DD Mon YYYY | ...", followed by its title in bold and its links. So the page is cut at each header (not at other mentions of "Episode&nbsp;#NNN", e.g. in a description), and each piece is searched for the date, the first bold text and links to the episode's files.
+
+    Args:
+        page_html (str): The page.
+
+    Returns:
+        list: CatalogEntry tuples, one per episode found.
+    """
+    starts = list(catalog_entry_pattern.finditer(page_html))
+    entries = []
+    for index, match in enumerate(starts):
+        episode = int(match.group(1))
+        end = starts[index+1].start() if index + 1 < len(starts) else len(page_html)
+        entry_html = page_html[match.end():end]
+
+        date = None
+        date_match = catalog_date_pattern.search(entry_html[:200])
+        if date_match:
+            try:
+                date = dt.strptime(date_match.group(1), "%d %b %Y").strftime("%Y-%m-%d")
+            except ValueError:
+                date = date_match.group(1)
+
+        title = None
+        title_match = re.search(r"<b>(.*?)</b>", entry_html, re.IGNORECASE | re.DOTALL)
+        if title_match:
+            title = " ".join(html.unescape(re.sub(r"<[^>]+>", "", title_match.group(1))).split()) or None
+
+        formats = set()
+        for link_match in catalog_link_pattern.finditer(entry_html):
+            transcript_episode, kind, htm_episode, special_page = link_match.groups()
+            if transcript_episode:
+                link_episode, file_format = int(transcript_episode), catalog_link_formats[kind.lower()]
+            elif htm_episode:
+                link_episode, file_format = int(htm_episode), "htm_shownotes"
+            else:
+                link_episode, file_format = (3 if special_page.lower() == "nat/nat" else 23), "htm_shownotes"
+            if link_episode == episode: # ignore links to other episodes, e.g. "see also episode 42"
+                formats.add(file_format)
+        entries.append(CatalogEntry(episode, title, date, frozenset(formats)))
+    return entries
+
+
+def fetch_catalog_page(output_directory, url, state_key):
+    """
+    Fetches a grc.com page for the catalog, asking the server to send it only if it has changed since the validators saved under state_key in the manifest.
+
+    Returns:
+        str: The page, or None if it hasn't changed, doesn't exist or couldn't be fetched (errors are logged).
+    """
+    load_http_modules()
+    cached_page = manifest_state_get(output_directory, state_key, {})
+    conditional_headers = {}
+    if cached_page.get("etag"):
+        conditional_headers["If-None-Match"] = cached_page["etag"]
+    if cached_page.get("last_modified"):
+        conditional_headers["If-Modified-Since"] = cached_page["last_modified"]
+    try:
+        with http_get(url, headers=conditional_headers) as response:
+            if response.status_code == 304:
+                return None
+            if response.status_code != 200:
+                msg_error = f"Couldn't fetch {url} for the episode catalog. Status code: {response.status_code}.\n"
+                log_file_write(msg_error, log_path, logging.WARNING)
+                return None
+            manifest_state_set(output_directory, state_key, {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")})
+            return response.text
+    except requests.RequestException as e:
+        msg_exception = f"Couldn't fetch {url} for the episode catalog - {e}\n"
+        log_file_write(msg_exception, log_path, logging.WARNING)
+        return None
+
+
+def catalog_store(output_directory, entries):
+    """Adds or updates catalog entries in the manifest. Details already known are kept if a page leaves them out."""
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        for entry in entries:
+            known = connection.execute("SELECT title, date, formats FROM catalog WHERE episode = ?", (entry.episode,)).fetchone()
+            title, date, formats = entry.title, entry.date, set(entry.formats)
+            if known: # an episode can be listed on two pages (e.g. securitynow.htm and its year's page), so combine what they say
+                title = title or known[0]
+                date = date or known[1]
+                formats |= set(json.loads(known[2]))
+            connection.execute("INSERT OR REPLACE INTO catalog (episode, title, date, formats, updated_at) VALUES (?, ?, ?, ?, ?)", (entry.episode, title, date, json.dumps(sorted(formats)), time.time()))
+        connection.commit()
+
+
+def update_catalog(output_directory, rebuild=False):
+    """
+    Builds or refreshes the episode catalog: a table in the manifest of every published episode's number, title, date and which file formats grc.com links to for it.
+
+    The first time (or with rebuild=True), securitynow.htm and every yearly archive page it links to (/sn/past/YYYY.htm) are read, about 20 requests in all. After that only securitynow.htm is re-read (with a conditional request, so usually nothing is downloaded), plus the archive page for the current year, as past years never change.
+
+    With a catalog, download_jobs and plan_missing_files skip files grc.com doesn't link to, rather than requesting each one to find it is missing.
+
+    Args:
+        output_directory (str): Directory holding the downloaded Security Now files (and the manifest).
+        rebuild (bool): If True, re-read every archive page.
+
+    Returns:
+        int: The number of episodes in the catalog.
+    """
+    main_page = fetch_catalog_page(output_directory, f"{grc_base_url}/securitynow.htm", "catalog_securitynow_htm")
+    if main_page is not None:
+        catalog_store(output_directory, parse_catalog_page(main_page))
+
+    years_done = set() if rebuild else set(manifest_state_get(output_directory, "catalog_years_done", []))
+    if main_page is not None:
+        years = sorted({int(year) for year in re.findall(r"past/(\d{4})\.htm", main_page)})
+    else:
+        years = manifest_state_get(output_directory, "catalog_years", [])
+    this_year = dt.now().year
+    for year in years:
+        if year in years_done:
+            continue
+        state_key = f"catalog_{year}_htm"
+        if rebuild:
+            manifest_state_set(output_directory, state_key, {})
+        year_page = fetch_catalog_page(output_directory, f"{grc_base_url}/sn/past/{year}.htm", state_key)
+        if year_page is not None:
+            catalog_store(output_directory, parse_catalog_page(year_page))
+        if year < this_year and year_page is not None:
+            years_done.add(year)
+    manifest_state_set(output_directory, "catalog_years", years)
+    manifest_state_set(output_directory, "catalog_years_done", sorted(years_done))
+
+    with manifest_lock:
+        episode_count = manifest_connect(output_directory).execute("SELECT COUNT(*) FROM catalog").fetchone()[0]
+    msg = f"Episode catalog updated: {episode_count} episodes listed.\n"
+    log_file_write(msg, log_path)
+    return episode_count
+
+
+def catalog_entries(output_directory, ep_start=None, ep_stop=None):
+    """Returns the catalog as a list of CatalogEntry tuples, in episode order, optionally limited to an episode range."""
+    ep_start = 1 if ep_start is None else ep_start
+    ep_stop = 2**31 if ep_stop is None else ep_stop
+    with manifest_lock:
+        rows = manifest_connect(output_directory).execute("SELECT episode, title, date, formats FROM catalog WHERE episode BETWEEN ? AND ? ORDER BY episode", (ep_start, ep_stop)).fetchall()
+    return [CatalogEntry(episode, title, date, frozenset(json.loads(formats))) for episode, title, date, formats in rows]
+
+
+def catalog_unavailable_filenames(output_directory):
+    """
+    Returns the set of filenames the catalog shows grc.com doesn't publish: for each catalogued episode, the formats in their available range (see file_formats) it has no link for.
+
+    A format is only judged this way if the catalog has found links for it on at least one episode, so a change in grc.com's page layout that hides every link of a format can't stop that format being downloaded. Like the negative cache, an absence is only trusted for negative_cache_days (sn_files_user_variables.py) after the episode's catalog entry was last updated, so a file published later is still requested even if the catalog isn't refreshed. Absences for the newest episodes (see late_file_first_episode) aren't trusted at all, as their transcripts and shownotes are often published hours or days apart. Empty if there is no catalog.
+    """
+    oldest_valid = time.time() - negative_cache_days * 24 * 60 * 60
+    first_late_episode = late_file_first_episode(output_directory)
+    with manifest_lock:
+        rows = manifest_connect(output_directory).execute("SELECT episode, formats, updated_at FROM catalog").fetchall()
+    seen_formats = set().union(*(json.loads(formats) for episode, formats, updated_at in rows)) if rows else set()
+    unavailable = set()
+    for episode, formats, updated_at in rows:
+        if updated_at < oldest_valid or episode >= first_late_episode:
+            continue # too long since grc.com's pages were read for this episode, or its files may still be on their way, so ask grc.com instead
+        for file_format in seen_formats - set(json.loads(formats)):
+            first_episode, last_episode = file_formats[file_format][1:]
+            if episode >= first_episode and (last_episode is None or episode <= last_episode):
+                unavailable.add(episode_url_and_filename(episode, file_format)[1])
+    return unavailable
 
 
 ################### DETERMINE LAST DOWNLOADED EPISODE ####################
         
 def last_downloaded_episode(output_directory):
-    """Determines the latest episode number downloaded by checking the output directory for the highest episode number file across the three current formats of transcript / shownotes. 
+    """Determines the latest episode number downloaded by checking the archive manifest for the highest episode number file across the three current formats of transcript / shownotes. 
     
     Dependency: 
         Relies upon the previously downloaded files being named in the original format "sn-xxx.pdf" or "sn-xxxx.txt" for transcripts or "sn-xxx-notes.pdf" for shownotes. If the files are named differently, the function will assess that no Security Now files are present in the folder and abandon any download attempts.
+        The manifest is built from the output directory the first time it is used. If files have since been added or removed by hand, run manifest_reconcile first.
     
     Returns:
         int: The highest downloaded episode number for each of the three formats (pdf transcript, txt transcript, pdf shownotes), if the specified directory contains filenames in the correct format.
@@ -205,16 +1169,13 @@ def last_downloaded_episode(output_directory):
         "skip" (str): If no relevant files are found in the specified directory, the function will return "skip" to prevent mass downloading of the entire back catalogue.
     
     """
-    # Get a list of all files in the output directory
-    all_files = os.listdir(output_directory)
-    
-    # Filter the list to only include files that are a matching filename format and type
+    # Highest episode number of each format already downloaded, from the manifest (no directory listing needed)
+    last_episodes = manifest_last_episodes(output_directory)
 
     # For transcripts in pdf format
-    pdf_transcripts = [file for file in all_files if re.match(r'sn-\d+\.pdf$', file)]
+    pdf_transcripts = "pdf_transcript" in last_episodes
     if pdf_transcripts:
-        pdf_transcript_numbers = [int(file.split("-")[1].split(".")[0]) for file in pdf_transcripts]
-        last_downloaded_pdf_transcript = max(pdf_transcript_numbers)
+        last_downloaded_pdf_transcript = last_episodes["pdf_transcript"]
         msg = f"The most recent downloaded pdf transcript in your download folder is Episode: #{last_downloaded_pdf_transcript}.\nRun grab_sn_transcripts_pdfs to download episodes between this and the latest published episode.\n"
         log_file_write(msg, log_path)
 
@@ -223,13 +1184,11 @@ def last_downloaded_episode(output_directory):
         log_file_write(msg, log_path)
         last_downloaded_pdf_transcript = "skip"
 
-    txt_transcripts = [file for file in all_files if re.match(r'sn-\d+\.txt$', file)]
-
     # For transcripts in txt format
+    txt_transcripts = "txt_transcript" in last_episodes
     if txt_transcripts:
-        txt_transcript_numbers = [int(file.split("-")[1].split(".")[0]) for file in txt_transcripts]
-        last_downloaded_txt_transcript = max(txt_transcript_numbers)
-        msg = f"The most recent downloaded pdf transcript in your download folder is Episode: #{last_downloaded_txt_transcript}.\nRun grab_sn_transcripts_txts to download episodes between this and the latest published episode.\n"
+        last_downloaded_txt_transcript = last_episodes["txt_transcript"]
+        msg = f"The most recent downloaded txt transcript in your download folder is Episode: #{last_downloaded_txt_transcript}.\nRun grab_sn_transcripts_txts to download episodes between this and the latest published episode.\n"
         log_file_write(msg, log_path)
 
     else:
@@ -238,11 +1197,10 @@ def last_downloaded_episode(output_directory):
         last_downloaded_txt_transcript = "skip"
 
     # For shownotes in pdf format
-    pdf_shownotes = [file for file in all_files if re.match(r'sn-\d+-notes\.pdf$', file)]
+    pdf_shownotes = "pdf_shownotes" in last_episodes
     if pdf_shownotes:
-        pdf_shownotes_numbers = [int(file.split("-")[1].split(".")[0]) for file in pdf_shownotes]
-        last_downloaded_pdf_shownotes = max(pdf_shownotes_numbers)
-        msg = f"The most recent downloaded pdf transcript in your download folder is Episode: #{last_downloaded_pdf_shownotes}.\nRun grab_sn_shownotes_pdfs to download episodes between this and the latest published episode.\n"
+        last_downloaded_pdf_shownotes = last_episodes["pdf_shownotes"]
+        msg = f"The most recent downloaded pdf shownotes in your download folder is Episode: #{last_downloaded_pdf_shownotes}.\nRun grab_sn_shownotes_pdfs to download episodes between this and the latest published episode.\n"
         log_file_write(msg, log_path)
 
     else:
@@ -253,157 +1211,1028 @@ def last_downloaded_episode(output_directory):
     # If there are no matching filenames for any of the file formats, the program assumes an incorrect directory path has been supplied or that the back-catalogue function(s) would be more appropriate - so exits. 
     if not pdf_transcripts and not txt_transcripts and not pdf_shownotes: 
         msg_error = "No matching .txt or .pdf files found in the output directory. Either no episodes have been downloaded (in which case, use the back-catalogue functions), or an incorrect output_directory has been selected. Exiting program.\n"
-        log_file_write(msg_error, log_path)
+        log_file_write(msg_error, log_path, logging.WARNING)
         sys.exit
 
     return last_downloaded_pdf_transcript, last_downloaded_txt_transcript, last_downloaded_pdf_shownotes               
 
 
-########################## FILE GRAB FUNCTIONS ############################
+########################## SHARED FILE CACHE ############################
 
-def grab_sn_shownotes_htm(output_directory, ep_start=1, ep_stop=177):
+def cache_connect():
     """
-    Downloads original htm shownotes, for given episode range.
-    Htm shownotes were only produced for episodes 001 - 177.
-    No shownotes at all 2011, '12, half '13, then pdf from 432.
-    Shows missing htm notes: 138, 139, 140, 146, 148-152, 154, 156, 158-163, 165-168, 169-175, these will simply be passed over.
+    Returns the open connection to the shared file cache index in cache_directory (sn_files_user_variables.py), creating it if needed, or None if the cache is turned off.
+
+    The cache keeps one copy of every downloaded file, stored under its SHA-256 hash (objects/ab/abcd...), so the same file is only stored once however many output directories it is in. The index records, for each URL, the validator (ETag or Last-Modified) grc.com sent with it, its hash and size, when grc.com last confirmed that validator (checked_at) and when it was last used. A cached copy is used as it is for cache_revalidate_days after checked_at, and after that only while grc.com still reports the same validator for its URL (see cache_entry_is_current).
 
-    Args:
-        ep_start: episode number to start range, defaults to 1.
-        ep_stop: episode number to end range, defaults to 177. 
-        
-    Available range: 001 - 177.
-        
-    Syntax examples:
-        https://www.grc.com/sn/notes-001.htm
-        https://www.grc.com/sn/notes-177.htm
-    
     Returns:
-        False: if last_downloaded_episode function found no existing files of the sn-xxx or sn-xxx-notes format in the specified directory, it will have returned "skip" to prevent mass downloading via this function.
+        sqlite3.Connection: Connection to the cache index. Use with cache_lock held.
+    """
+    global cache_connection
+    if not cache_directory:
+        return None
+    if cache_connection is None:
+        os.makedirs(os.path.join(cache_directory, "objects"), exist_ok=True)
+        cache_connection = sqlite3.connect(os.path.join(cache_directory, cache_filename), timeout=30, check_same_thread=False)
+        cache_connection.execute("""CREATE TABLE IF NOT EXISTS entries (
+            url TEXT PRIMARY KEY,
+            validator TEXT,
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL,
+            checked_at REAL NOT NULL DEFAULT 0)""")
+        if "checked_at" not in {row[1] for row in cache_connection.execute("PRAGMA table_info(entries)")}: # a cache made before checked_at was recorded: its files are checked once, then trusted as usual
+            cache_connection.execute("ALTER TABLE entries ADD COLUMN checked_at REAL NOT NULL DEFAULT 0")
+        cache_connection.execute("CREATE INDEX IF NOT EXISTS entries_by_sha256 ON entries (sha256)")
+        cache_connection.commit()
+    return cache_connection
+
+
+def cache_object_path(sha256):
+    """Path of the cached copy of the file with this SHA-256 hash."""
+    return os.path.join(cache_directory, "objects", sha256[:2], sha256)
+
+
+def link_or_copy(source_path, file_path):
+    """
+    Puts a copy of source_path at file_path, as a hard link if possible (no extra disk space, instant) or else a real copy. Like stream_to_file, the copy is made as <file_path>.part and renamed, so file_path is never left half-written.
+    """
+    part_path = file_path + ".part"
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    try:
+        os.link(source_path, part_path)
+    except OSError: # e.g. different drives, or a file system without hard links
+        shutil.copyfile(source_path, part_path)
+    os.replace(part_path, file_path)
 
+
+def cache_entry_is_current(job, validator):
     """
-    if ep_start == "skip": # This string is returned by the last_downloaded_episode function if it finds no existing files of the sn-xxx or sn-xxx-notes format in the specified directory. This is to prevent mass downloading of entire back catalogue via that function, or by accident.
+    Checks with a HEAD request (headers only, no file) that grc.com still serves the version of a file the cache holds, by comparing its ETag (or Last-Modified date) with the one recorded when it was cached. So a file grc.com has since republished (e.g. a corrected transcript) is downloaded again rather than copied from the cache. The request is counted in the run metrics as a cache check.
+
+    Returns:
+        bool: True if the cached copy is the current version. False if it has changed, no validator was recorded, or grc.com couldn't be asked.
+    """
+    if not validator:
         return False
+    load_http_modules()
+    fetch_timing.connect, fetch_timing.ttfb, fetch_timing.retries = 0, 0, 0
+    check_started = time.perf_counter()
+    status, current = None, False
+    try:
+        with http_head(job.url) as response:
+            status = response.status_code
+            current = status == 200 and (response.headers.get("ETag") or response.headers.get("Last-Modified")) == validator
+    except requests.RequestException as e:
+        msg_exception = f"Couldn't check the cached copy of {job.filename} against grc.com, downloading it instead - {e}\n"
+        log_file_write(msg_exception, log_path, logging.DEBUG)
+    record_fetch(FetchRecord(job.url, cache_check_format, status, 0, fetch_timing.connect, fetch_timing.ttfb, time.perf_counter() - check_started, fetch_timing.retries))
+    return current
 
-    # Sanitise episode range values
-    if ep_start < 1 or ep_start > 177:
-        ep_start = 1
-        msg_error = "invalid episode start value entered, 001 used"
-        log_file_write(msg_error, log_path)
-        
-    if ep_stop > 177:
-        ep_stop = 177
-        msg_error = "invalid episode stop value entered, 177 used"
-        log_file_write(msg_error, log_path)
-        
 
-    request_time_est(ep_start, ep_stop) # prints & logs expected time to run based on 0.5 second pause between requests
+def cache_fetch(job, file_path):
+    """
+    Copies a file from the shared cache to file_path, if the cache has it and it is still the version grc.com serves, so it needn't be downloaded. A file grc.com confirmed within the last cache_revalidate_days (sn_files_user_variables.py) is copied without asking again, otherwise it is checked first (see cache_entry_is_current).
 
-    episodes_to_grab = range(ep_start, ep_stop+1)
-    for episode in episodes_to_grab:
-        # Format episode number with leading zeros to make it three digits long
-        formatted_episode = f"{episode:03}"   
-        url_shownotes_htm = f"https://www.grc.com/sn/notes-{formatted_episode}.htm"
+    Returns:
+        tuple: (size (int), SHA-256 hex digest (str)) of the file, or None if it isn't in the cache, is out of date (or the cache is turned off).
+    """
+    with cache_lock:
+        connection = cache_connect()
+        if connection is None:
+            return None
+        row = connection.execute("SELECT sha256, size, validator, checked_at FROM entries WHERE url = ?", (job.url,)).fetchone()
+    if row is None:
+        return None
+    sha256, size, validator, checked_at = row
+    checked_now = checked_at < time.time() - cache_revalidate_days * 24 * 60 * 60
+    if checked_now and not cache_entry_is_current(job, validator): # checked without holding cache_lock, so other download threads aren't kept waiting on the request
+        msg_stale = f"Cached copy of {job.filename} is out of date (or can't be checked), downloading it instead.\n"
+        log_file_write(msg_stale, log_path, logging.DEBUG)
+        return None
+
+    with cache_lock:
+        object_path = cache_object_path(sha256)
+        try:
+            if os.path.getsize(object_path) != size:
+                raise OSError(f"{object_path} is the wrong size")
+            link_or_copy(object_path, file_path)
+        except OSError as e: # cached copy missing or damaged, forget it and download instead
+            connection.execute("DELETE FROM entries WHERE sha256 = ?", (sha256,))
+            connection.commit()
+            msg_error = f"Cached copy of {job.filename} unusable, downloading it instead - {e}\n"
+            log_file_write(msg_error, log_path, logging.WARNING)
+            return None
+        connection.execute("UPDATE entries SET last_used = ? WHERE sha256 = ?", (time.time(), sha256))
+        if checked_now:
+            connection.execute("UPDATE entries SET checked_at = ? WHERE url = ?", (time.time(), job.url))
+        connection.commit()
+    return size, sha256
+
+
+def cache_store(job, validator, file_path, size, sha256):
+    """Adds a newly downloaded file to the shared cache (if it is turned on), then removes the least recently used files if the cache is over cache_max_mb."""
+    with cache_lock:
+        connection = cache_connect()
+        if connection is None:
+            return
+        object_path = cache_object_path(sha256)
+        try:
+            if not os.path.exists(object_path):
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                link_or_copy(file_path, object_path)
+        except OSError as e:
+            msg_error = f"Couldn't add {job.filename} to the cache - {e}\n"
+            log_file_write(msg_error, log_path, logging.WARNING)
+            return
+        connection.execute("INSERT OR REPLACE INTO entries (url, validator, sha256, size, last_used, checked_at) VALUES (?, ?, ?, ?, ?, ?)", (job.url, validator, sha256, size, time.time(), time.time()))
+        connection.commit()
+        cache_evict()
+
+
+def cache_discard(url):
+    """Removes a URL's file from the shared cache, e.g. because verify_archive found the downloaded copy damaged (with hard links, the cached copy is the same file)."""
+    with cache_lock:
+        connection = cache_connect()
+        if connection is None:
+            return
+        row = connection.execute("SELECT sha256 FROM entries WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return
+        object_path = cache_object_path(row[0])
+        if os.path.exists(object_path):
+            os.remove(object_path)
+        connection.execute("DELETE FROM entries WHERE sha256 = ?", (row[0],))
+        connection.commit()
+
+
+def cache_evict():
+    """Deletes the least recently used files from the shared cache until it is no bigger than cache_max_mb. Called with cache_lock held."""
+    connection = cache_connect()
+    objects = connection.execute("SELECT sha256, MAX(size), MAX(last_used) FROM entries GROUP BY sha256 ORDER BY MAX(last_used)").fetchall()
+    total_size = sum(size for sha256, size, last_used in objects)
+    max_size = cache_max_mb * 1024 * 1024
+    evicted = 0
+    for sha256, size, last_used in objects:
+        if total_size <= max_size:
+            break
+        object_path = cache_object_path(sha256)
+        if os.path.exists(object_path):
+            os.remove(object_path)
+        connection.execute("DELETE FROM entries WHERE sha256 = ?", (sha256,))
+        total_size -= size
+        evicted += 1
+    if evicted:
+        connection.commit()
+        msg = f"Removed the {evicted} least recently used files from the cache to keep it under {cache_max_mb} MB.\n"
+        log_file_write(msg, log_path, logging.DEBUG)
+
+
+##################### CROSS-PROCESS COORDINATION #######################
+
+def process_alive(pid):
+    """Whether a process with this id is running on this computer. On Windows this can't be checked safely, so it is assumed to be running (claims then expire by age only)."""
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0) # signal 0 checks the process exists without affecting it
+    except ProcessLookupError:
+        return False
+    except PermissionError: # exists, but belongs to another user
+        return True
+    return True
+
+
+def claim_is_stale(claim_path, max_age_seconds):
+    """Whether a claim file was left behind by a process that has finished or crashed: it is older than max_age_seconds, or its owner was on this computer and is no longer running."""
+    try:
+        with open(claim_path) as claim_file:
+            owner = json.load(claim_file)
+        if time.time() - owner["claimed_at"] > max_age_seconds:
+            return True
+        return owner["host"] == socket.gethostname() and not process_alive(owner["pid"])
+    except FileNotFoundError:
+        return True
+    except (OSError, ValueError, KeyError, TypeError): # half-written or unreadable, so judge by the file's age alone
+        try:
+            return time.time() - os.path.getmtime(claim_path) > max_age_seconds
+        except OSError:
+            return True
+
+
+def try_claim(output_directory, name, max_age_seconds):
+    """
+    Tries to claim something (a file to download, or a shard of episodes) for this process, so no other process works on it at the same time.
+
+    The claim is a small file <output_directory>/.sn_files_claims/<name>, created with O_EXCL: the operating system guarantees only one process can create it, however many try at once. It records the claiming process and computer, so a claim left by a crashed process can be taken over (see claim_is_stale and take_over_stale_claim).
+
+    Args:
+        output_directory (str): Directory holding the downloaded Security Now files.
+        name (str): What is being claimed, e.g. "sn-001.pdf.claim" or "shard-0001-0100.lease".
+        max_age_seconds (float): Age after which someone else's claim is assumed abandoned.
+
+    Returns:
+        bool: True if this process now holds the claim (release it with release_claim), False if another process holds it.
+    """
+    claims_directory = os.path.join(output_directory, claims_directory_name)
+    os.makedirs(claims_directory, exist_ok=True)
+    claim_path = os.path.join(claims_directory, name)
+    owner = json.dumps({"pid": os.getpid(), "host": socket.gethostname(), "claimed_at": time.time()})
+    for attempt in range(2): # second attempt only if the claim was released while checking it
+        try:
+            descriptor = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if attempt > 0:
+                return False
+            taken_over = take_over_stale_claim(claim_path, owner, max_age_seconds)
+            if taken_over is None:
+                continue
+            if taken_over:
+                msg_stale = f"Took over abandoned claim {name}.\n"
+                log_file_write(msg_stale, log_path, logging.DEBUG)
+            return taken_over
+        with os.fdopen(descriptor, "w") as claim_file:
+            claim_file.write(owner)
+        return True
+    return False
+
+
+def take_over_stale_claim(claim_path, owner, max_age_seconds):
+    """
+    Replaces a stale claim (see claim_is_stale) with this process's, safely even if several processes find it stale at once.
+
+    Checking a claim's age and then deleting it isn't one step, so two processes could both judge it stale and one delete the other's brand new claim. So only the process that creates <claim>.takeover (with O_EXCL, so only one can) may take a claim over, and it swaps its own claim in with a single rename over the stale one (os.replace). The claim file is never missing along the way, so no other process can create a claim of its own in between.
+
+    Returns:
+        bool: True if this process now holds the claim, False if another process holds it (or is taking it over).
+        None: If the claim was released in the meantime, so try_claim should simply try again.
+    """
+    lock_path = claim_path + ".takeover"
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(lock_path) > takeover_lock_max_age_seconds: # left by a process that crashed part way through a takeover
+                os.remove(lock_path)
+        except OSError:
+            pass
+        return False
+    try:
+        if not os.path.exists(claim_path):
+            return None
+        if not claim_is_stale(claim_path, max_age_seconds):
+            return False
+        temporary_path = f"{claim_path}.{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(temporary_path, "w") as claim_file:
+            claim_file.write(owner)
+        os.replace(temporary_path, claim_path)
+        return True
+    finally:
+        os.remove(lock_path)
+
+
+def release_claim(output_directory, name):
+    """Releases a claim made with try_claim."""
+    try:
+        os.remove(os.path.join(output_directory, claims_directory_name, name))
+    except FileNotFoundError:
+        pass
+
+
+def shard_ranges(ep_start, ep_stop, shard_size):
+    """Splits an episode range into consecutive shards of shard_size episodes. Returns a list of (first episode, last episode) tuples."""
+    return [(shard_start, min(shard_start + shard_size - 1, ep_stop)) for shard_start in range(ep_start, ep_stop+1, shard_size)]
+
+
+########################## DOWNLOAD PLANNING ############################
+
+def episode_url_and_filename(episode, file_format):
+    """
+    Builds the grc.com URL and the original filename for one episode in one file format.
+
+    Args:
+        episode (int): Episode number.
+        file_format (str): One of the keys of file_formats: "pdf_transcript", "txt_transcript", "pdf_shownotes", "htm_shownotes".
+
+    Returns:
+        tuple: (url (str), filename (str)).
+
+    Syntax examples:
+        https://www.grc.com/sn/sn-001.pdf -> sn-001.pdf
+        https://www.grc.com/sn/sn-001.txt -> sn-001.txt
+        https://www.grc.com/sn/sn-432-notes.pdf -> sn-432-notes.pdf
+        https://www.grc.com/sn/notes-001.htm -> sn-001-notes.htm
+    """
+    # Format episode number with leading zeros to make it three digits long if it's less than 100. Will accommodate 999 & beyond :-)
+    formatted_episode = f"{episode:03}"
+
+    if file_format == "pdf_transcript":
+        return f"{grc_base_url}/sn/sn-{formatted_episode}.pdf", f"sn-{formatted_episode}.pdf"
+
+    if file_format == "txt_transcript":
+        return f"{grc_base_url}/sn/sn-{formatted_episode}.txt", f"sn-{formatted_episode}.txt"
+
+    if file_format == "pdf_shownotes":
+        return f"{grc_base_url}/sn/sn-{formatted_episode}-notes.pdf", f"sn-{formatted_episode}-notes.pdf"
+
+    if file_format == "htm_shownotes":
+        url_shownotes_htm = f"{grc_base_url}/sn/notes-{formatted_episode}.htm"
         if formatted_episode == "003":
-            url_shownotes_htm = "https://www.grc.com/nat/nat.htm"        
+            url_shownotes_htm = f"{grc_base_url}/nat/nat.htm"
         if formatted_episode == "023":
-            url_shownotes_htm = "https://www.grc.com/wmf/wmf.htm"
-        
-        filename_shownotes_htm = f"sn-{formatted_episode}-notes.htm"
+            url_shownotes_htm = f"{grc_base_url}/wmf/wmf.htm"
+        return url_shownotes_htm, f"sn-{formatted_episode}-notes.htm"
 
-        # Duplicate file check
-        if os.path.exists(os.path.join(output_directory, filename_shownotes_htm)):
-            msg_dupe = f"File {filename_shownotes_htm} already exists. Skipping.\n"
-            log_file_write(msg_dupe, log_path)
-            continue  # Skip to next iteration if identical filename exists
-        
+    raise ValueError(f"Unknown file format: {file_format}")
+
+
+def make_download_job(episode, file_format):
+    """Returns the DownloadJob for one episode in one file format."""
+    url, filename = episode_url_and_filename(episode, file_format)
+    description = file_formats[file_format][0]
+    return DownloadJob(episode, file_format, url, filename, description)
+
+
+def plan_missing_files(output_directory, latest_episode, formats_to_check):
+    """
+    Works out exactly which (episode, format) files are absent from the archive, across each format's whole available range (e.g. 1 to latest_episode for transcripts, 432 to latest_episode for PDF shownotes).
+
+    Unlike last_downloaded_episode, which only finds the highest episode of each format, this also finds gaps in the middle of the archive (e.g. a missing sn-500.txt). It is a set difference against the manifest, so no files are probed and nothing is re-checked. Files in the negative cache (known not to exist on grc.com), or not linked in the episode catalog (see update_catalog), are left out.
+
+    Args:
+        output_directory (str): Directory holding the downloaded Security Now files.
+        latest_episode (int): Latest episode number published on grc.com, from latest_episode_number.
+        formats_to_check (iterable): Keys of file_formats to check.
+
+    Returns:
+        list: DownloadJobs for every missing file, in episode order.
+    """
+    already_downloaded = manifest_filenames(output_directory) | negative_cache_filenames(output_directory) | catalog_unavailable_filenames(output_directory)
+    missing = []
+    for file_format in formats_to_check:
+        first_episode, last_episode = file_formats[file_format][1:]
+        if last_episode is None or last_episode > latest_episode:
+            last_episode = latest_episode
+        for episode in range(first_episode, last_episode+1):
+            job = make_download_job(episode, file_format)
+            if job.filename not in already_downloaded:
+                missing.append(job)
+    missing.sort(key=lambda job: job.episode)
+    return missing
+
+
+def sanitise_episode_range(file_format, latest_episode, ep_start=None, ep_stop=None):
+    """
+    Fits a requested episode range to what is actually available for one file format, logging any change.
+
+    Args:
+        file_format (str): Key of file_formats.
+        latest_episode (int): Latest episode number published on grc.com, from latest_episode_number.
+        ep_start (int): First episode wanted. None, or anything before the format's first episode, means the format's first episode.
+        ep_stop (int): Last episode wanted. None means just one episode from ep_start (to prevent accidental mass downloading). Anything after the last available episode means the last available episode.
+
+    Returns:
+        tuple: (ep_start, ep_stop), or None if the format has no episodes in the requested range (e.g. htm shownotes after episode 177).
+    """
+    description, first_episode, last_episode = file_formats[file_format]
+    if last_episode is None or last_episode > latest_episode:
+        last_episode = latest_episode
+
+    if ep_start is None or ep_start < first_episode:
+        if ep_start is not None:
+            msg = f"{description} files are only available from episode {first_episode}, starting there.\n"
+            log_file_write(msg, log_path)
+        ep_start = first_episode
+
+    if ep_stop is None:
+        ep_stop = ep_start + 1 # grab just the start episode (and the one after) rather than the whole back catalogue
+        msg = f"No episode stop value entered for {description} files, grabbing just from episode {ep_start} to {ep_stop}.\n"
+        log_file_write(msg, log_path)
+    elif ep_stop < ep_start:
+        msg = f"Episode stop value {ep_stop} is before episode start value {ep_start}, grabbing just episode {ep_start}.\n"
+        log_file_write(msg, log_path, logging.WARNING)
+        ep_stop = ep_start
+
+    if ep_stop > last_episode:
+        msg = f"{description} files are only available up to episode {last_episode}, stopping there.\n"
+        log_file_write(msg, log_path)
+        ep_stop = last_episode
+
+    if ep_start > ep_stop:
+        msg = f"No {description} files are available in the requested episode range.\n"
+        log_file_write(msg, log_path)
+        return None
+    return ep_start, ep_stop
+
+
+def plan_downloads(latest_episode, formats_to_grab, ep_start=None, ep_stop=None):
+    """
+    Builds one work queue of DownloadJobs for several file formats over an episode range, so the range is walked once for all formats rather than once per format.
+
+    Each format's range is fitted to what is available for it (see sanitise_episode_range), e.g. ep_start=1 still only asks for PDF shownotes from 432. The URL rules, including the htm shownotes special cases for episodes 3 and 23, are those of episode_url_and_filename. Jobs are de-duplicated by filename. Nothing is checked against the output directory here - download_jobs skips files already downloaded or known to be missing.
+
+    Args:
+        latest_episode (int): Latest episode number published on grc.com, from latest_episode_number.
+        formats_to_grab (iterable): Keys of file_formats, e.g. ["pdf_transcript", "txt_transcript", "pdf_shownotes"].
+        ep_start (int): First episode wanted.
+        ep_stop (int): Last episode wanted.
+
+    Returns:
+        list: DownloadJobs in episode order, then in the order formats_to_grab lists the formats.
+    """
+    jobs = {}
+    format_order = {}
+    for file_format in formats_to_grab:
+        if file_format not in file_formats:
+            raise ValueError(f"Unknown file format: {file_format}")
+        format_order.setdefault(file_format, len(format_order))
+        episode_range = sanitise_episode_range(file_format, latest_episode, ep_start, ep_stop)
+        if episode_range is None:
+            continue
+        for episode in range(episode_range[0], episode_range[1]+1):
+            job = make_download_job(episode, file_format)
+            jobs.setdefault(job.filename, job)
+    return sorted(jobs.values(), key=lambda job: (job.episode, format_order[job.file_format]))
+
+
+########################## DOWNLOAD ENGINE ############################
+
+def stream_to_file(response, file_path, resume_from=0, keep_partial=False):
+    """
+    Streams the body of a response to disk in chunks, without holding the whole file in memory.
+
+    The body is written to a temporary "<file_path>.part" file, flushed and fsync'd, and only then renamed to file_path. The rename is atomic, so file_path either doesn't exist or is complete - an interrupted download can never leave a truncated sn-xxx file that the duplicate file check would then skip forever.
+
+    Args:
+        response (requests.Response): Response from a request made with stream=True.
+        file_path (str): Final path of the downloaded file.
+        resume_from (int): If more than 0, the response is a 206 Partial Content carrying the rest of the file, and the first resume_from bytes are already in the .part file. They are kept (and hashed) and the response appended after them.
+        keep_partial (bool): If True, the .part file is left in place when the download fails, so it can be resumed later.
+
+    Returns:
+        tuple: (size of the completed file (int), SHA-256 hex digest of the file (str)).
+
+    Raises:
+        requests.RequestException or OSError: If the download or the write fails part way. Unless keep_partial is True, the .part file is removed before the error is re-raised.
+    """
+    part_path = file_path + ".part"
+    bytes_written = 0
+    sha256 = hashlib.sha256() # hashed as it streams, so the manifest gets a hash without re-reading the file
+    try:
+        with open(part_path, 'r+b' if resume_from else 'wb') as file:
+            while bytes_written < resume_from: # hash the part already downloaded
+                chunk = file.read(min(download_chunk_size, resume_from - bytes_written))
+                if not chunk:
+                    raise OSError(f"{part_path} is shorter than expected")
+                sha256.update(chunk)
+                bytes_written += len(chunk)
+            file.truncate(resume_from) # drop anything past the point the server is resuming from
+            for chunk in response.iter_content(chunk_size=download_chunk_size):
+                file.write(chunk)
+                sha256.update(chunk)
+                bytes_written += len(chunk)
+            file.flush()
+            os.fsync(file.fileno()) # make sure the data is on disk before the rename makes it visible
+        os.replace(part_path, file_path)
+    except BaseException:
+        if not keep_partial and os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return bytes_written, sha256.hexdigest()
+
+
+def resume_validator(response):
+    """
+    Returns the value to send in an If-Range header to resume this response's file later, or None if it can't safely be resumed.
+
+    A download can only be resumed if the server identifies this version of the file (a strong ETag or a Last-Modified date), sent it without compression (byte offsets in a compressed body don't match the saved file) and doesn't say it refuses ranges.
+    """
+    if response.headers.get("Content-Encoding", "identity") != "identity" or response.headers.get("Accept-Ranges") == "none":
+        return None
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"): # weak ETags aren't allowed in If-Range
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def content_range_start_and_size(response):
+    """Reads a 206 response's Content-Range header ("bytes 1000-4999/5000"). Returns (first byte (int), full file size (int or None)), or (None, None) if it can't be read."""
+    match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", response.headers.get("Content-Range", ""))
+    if not match:
+        return None, None
+    return int(match.group(1)), None if match.group(2) == "*" else int(match.group(2))
+
+
+def download_file(job, output_directory):
+    """
+    Downloads a single file described by a DownloadJob into the output directory and records it in the manifest (see fetch_file), unless another process is already downloading it or has just done so.
+
+    The file is claimed first (see try_claim), so overlapping runs (e.g. two cron jobs, or several backfill processes) never download the same file twice or write it at the same time.
+
+    Args:
+        job (DownloadJob): The file to fetch.
+        output_directory (str): Directory the file is saved in.
+
+    Returns:
+        bool: True if the file was downloaded, False if it was skipped or the download failed.
+    """
+    claim_name = job.filename + ".claim"
+    if not try_claim(output_directory, claim_name, file_claim_max_age_seconds):
+        msg_claimed = f"{job.filename} is being downloaded by another process. Skipping.\n"
+        log_file_write(msg_claimed, log_path, logging.DEBUG)
+        return False
+    try:
+        if manifest_has_file(output_directory, job.filename): # another process finished it since this run checked the manifest
+            return False
+        return fetch_file(job, output_directory)
+    finally:
+        release_claim(output_directory, claim_name)
+
+
+def fetch_file(job, output_directory):
+    """
+    Downloads a single file described by a DownloadJob into the output directory and records it in the manifest. Doesn't check for an existing file - download_jobs does that for the whole list first. Use download_file, which also stops other processes fetching the same file at the same time.
+
+    If the shared file cache is turned on (cache_directory in sn_files_user_variables.py) and already holds the file, it is copied from there without contacting grc.com. Downloaded files are added to the cache.
+
+    If a download is interrupted part way, and the server allows it, what has arrived is kept as <filename>.part and recorded in the manifest. The next attempt (straight away, or on a later run) asks only for the rest of the file with a Range request. If-Range makes the server send the whole file instead if it has changed in the meantime, so a resumed file is never a mix of two versions.
+
+    Args:
+        job (DownloadJob): The file to fetch.
+        output_directory (str): Directory the file is saved in.
+
+    Returns:
+        bool: True if the file was downloaded, False if it was skipped or the download failed.
+    """
+    file_path = os.path.join(output_directory, job.filename)
+    part_path = file_path + ".part"
+
+    cached = cache_fetch(job, file_path) # already downloaded for another output directory?
+    if cached:
+        manifest_record(output_directory, job.filename, job.episode, job.file_format, *cached)
+        msg_cached = f"Copied {job.description} {job.filename} from the cache.\n"
+        log_file_write(msg_cached, log_path)
+        return True
+
+    load_http_modules()
+    status, size = None, 0
+    job_started = time.perf_counter()
+    fetch_timing.connect, fetch_timing.ttfb, fetch_timing.retries = 0, 0, 0
+    body_retries = 0 # http_get retries failures before the response arrives. These are retries of failures part way through the body.
+
+    while True:
+        headers_received = False
+        resumable = False
+        headers = {}
+        resume_from = 0
+        partial = partial_get(output_directory, job.filename)
+        if partial and partial[0] == job.url and os.path.exists(part_path):
+            resume_from = os.path.getsize(part_path)
+            if resume_from:
+                headers = {"Range": f"bytes={resume_from}-", "If-Range": partial[1], "Accept-Encoding": "identity"}
+        elif partial:
+            partial_clear(output_directory, job.filename) # .part file gone (or URL changed), start again
+            partial = None
         try:
-            response = requests.get(url_shownotes_htm)
-            if response.status_code == 200:
-                with open(os.path.join(output_directory, filename_shownotes_htm), 'wb') as file: # renders better as 'w' and response.text vs 'wb' and response.content
-                    file.write(response.content)
-                
-                success_msg =f"Successfully downloaded htm shownotes {filename_shownotes_htm}.\n"
-                log_file_write(success_msg, log_path)
-                time.sleep(0.5)
+            with http_get(job.url, stream=True, headers=headers) as response: # stream=True: only the headers are read here, the body is read chunk by chunk in stream_to_file
+                headers_received = True
+                status = response.status_code
+                if response.status_code == 206 and resume_from:
+                    range_start, expected_size = content_range_start_and_size(response)
+                    if range_start != resume_from or (partial[2] is not None and expected_size != partial[2]): # not the part we asked for, or not the same file - start again (sizes are only compared if the first response gave one)
+                        os.remove(part_path)
+                        partial_clear(output_directory, job.filename)
+                        continue
+                    resumable = True
+                    msg_resume = f"Resuming {job.filename} from {resume_from} bytes.\n"
+                    log_file_write(msg_resume, log_path)
+                elif response.status_code == 416 and resume_from: # .part is already as long as (or longer than) the file
+                    os.remove(part_path)
+                    partial_clear(output_directory, job.filename)
+                    continue # ask for the whole file
+                elif response.status_code == 200:
+                    resume_from = 0 # first attempt, the file changed since the .part was saved, or the server ignored the Range request
+                    validator = resume_validator(response)
+                    if validator:
+                        expected_size = int(response.headers["Content-Length"]) if response.headers.get("Content-Length", "").isdigit() else None
+                        partial_record(output_directory, job.filename, job.url, validator, expected_size)
+                        resumable = True
+
+                if response.status_code == 200 or response.status_code == 206 and resume_from:
+                    size, sha256 = stream_to_file(response, file_path, resume_from, keep_partial=resumable) # all formats (including txt) are saved byte-for-byte as served
+                    partial_clear(output_directory, job.filename)
+                    manifest_record(output_directory, job.filename, job.episode, job.file_format, size, sha256)
+                    cache_store(job, response.headers.get("ETag") or response.headers.get("Last-Modified"), file_path, size, sha256)
+                    # Bytes: only what this response carried, not the part kept from an earlier attempt, so throughput isn't overstated
+                    record_fetch(FetchRecord(job.url, job.file_format, status, size - resume_from, fetch_timing.connect, fetch_timing.ttfb, time.perf_counter() - fetch_timing.started, fetch_timing.retries + body_retries))
+
+                    msg_success = f"Successfully downloaded {job.description} {job.filename}.\n"
+                    log_file_write(msg_success, log_path)
+                    return True
 
-            else:
-                msg_error = f"Failed to download htm shownotes {filename_shownotes_htm}. Status code: {response.status_code}"
-                log_file_write(msg_error, log_path)
+                else:
+                    msg_error = f"Failed to download {job.description} {job.filename}. Status code: {response.status_code}.\n"
+                    log_file_write(msg_error, log_path, logging.WARNING)
+                    if response.status_code in (404, 410): # not published, so remember that rather than asking again next run
+                        negative_cache_record(output_directory, job, response.status_code)
+                        if partial:
+                            os.remove(part_path)
+                            partial_clear(output_directory, job.filename)
+                    break
 
         except requests.RequestException as e:
-            msg_exception = f"Error, request failed for {formatted_episode} htm shownotes - {e}\n"
-            log_file_write(msg_exception, log_path)
+            if headers_received and body_retries < retry_max_retries: # connection dropped part way through the file
+                delay = backoff_delay(body_retries)
+                msg_retry = f"Download of {job.filename} interrupted ({e}). Retrying in {round(delay, 1)} seconds.\n"
+                log_file_write(msg_retry, log_path, logging.WARNING)
+                time.sleep(delay)
+                body_retries += 1
+                continue
+            msg_exception = f"Request failed for {job.description} {job.filename} - {e}\n"
+            log_file_write(msg_exception, log_path, logging.ERROR)
+            break
+
+        except OSError as e:
+            msg_exception = f"Request failed for {job.description} {job.filename} - {e}\n"
+            log_file_write(msg_exception, log_path, logging.ERROR)
+            break
+
+    if status in success_status_codes: # the response started but the body never arrived in full, so don't count it as a success
+        status = None
+    record_fetch(FetchRecord(job.url, job.file_format, status, size, fetch_timing.connect, fetch_timing.ttfb, time.perf_counter() - job_started, fetch_timing.retries + body_retries))
+    return False
+
+
+def download_jobs(jobs, output_directory, use_negative_cache=True):
+    """
+    Downloads a list of DownloadJobs, skipping any file already recorded in the manifest or known to be missing from grc.com (negative cache or episode catalog). If max_workers (sn_files_user_variables.py) is more than 1, several files are fetched at once by a thread pool, otherwise they are fetched one after another.
 
+    Either way, every request waits on the shared rate limiter, so grc.com never receives more than requests_per_second requests per second.
 
-def grab_sn_shownotes_pdfs(output_directory, latest_episode, ep_start=432, ep_stop=None):
-    """Downloads PDF shownotes for given episode range.
-    First availble PDF shownote is for episode 432: https://www.grc.com/sn/sn-432-notes.pdf
-    
     Args:
-        ep_start: episode number to start range, substitutes 432 if None or lower than 432. 
-        ep_stop:  episode number to end range, defaults just the start episode if non-sensical stop episode is provided meaning just a single request is made.
+        jobs (list): DownloadJob tuples to fetch.
+        output_directory (str): Directory the files are saved in.
+        use_negative_cache (bool): If False, files in the negative cache are requested anyway.
 
-    Available range:
-        432 to latest_episode. None for #592, #643, #747, #851, #954.
-        
-    Syntax examples:
-        https://www.grc.com/sn/sn-432-notes.pdf
+    Returns:
+        int: The number of files successfully downloaded.
+    """
+    # Duplicate file check, against the manifest loaded once rather than probing the directory for every file
+    already_downloaded = manifest_filenames(output_directory)
+    known_missing = negative_cache_filenames(output_directory) | catalog_unavailable_filenames(output_directory) if use_negative_cache else set()
+    jobs_to_run = []
+    for job in jobs:
+        if job.filename in already_downloaded:
+            msg_dupe = f"File {job.filename} already exists. Skipping.\n"
+            log_file_write(msg_dupe, log_path, logging.DEBUG)
+            continue # Skip if identical filename exists
+        if job.filename in known_missing:
+            msg_missing = f"File {job.filename} is known to be unavailable on grc.com. Skipping.\n"
+            log_file_write(msg_missing, log_path, logging.DEBUG)
+            continue # Skip without a round-trip to grc.com
+        jobs_to_run.append(job)
+    if len(jobs_to_run) < len(jobs):
+        msg_skipped = f"Skipped {len(jobs) - len(jobs_to_run)} files already downloaded or known to be unavailable. {len(jobs_to_run)} files to request.\n"
+        log_file_write(msg_skipped, log_path)
+    jobs = jobs_to_run
+    if not jobs:
+        return 0
+
+    metrics_reset()
+    run_started = time.perf_counter()
+    if max_workers <= 1:
+        results = [download_file(job, output_directory) for job in jobs]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(lambda job: download_file(job, output_directory), jobs))
+    metrics_report(output_directory, time.perf_counter() - run_started)
+
+    # Don't let failures go unnoticed: list anything that failed for a reason other than not being published
+    with metrics_lock:
+        failed = [record for record in run_metrics if record.status not in success_status_codes and record.status not in (404, 410) and record.file_format != cache_check_format]
+    if failed:
+        msg_failed = f"{len(failed)} files could not be downloaded even after retrying: {', '.join(record.url.rsplit('/', 1)[-1] for record in failed)}. Run grab_missing_files later to try them again.\n"
+        log_file_write(msg_failed, log_path, logging.WARNING)
+
+    if extract_shownotes_after_download:
+        downloaded_shownotes = [job.filename for job, downloaded in zip(jobs, results) if downloaded and job.file_format in ("pdf_shownotes", "htm_shownotes")]
+        if downloaded_shownotes:
+            from sn_files_shownotes import update_shownotes_text # imported here, as sn_files_shownotes imports this module
+            update_shownotes_text(output_directory, filenames=downloaded_shownotes, workers=1) # in this process: starting worker processes while download threads may still be running isn't safe
+    return sum(results)
+
+
+########################## ARCHIVE VERIFICATION ############################
+
+def check_file_contents(file_path, file_format, recorded_sha256=None, rehash=True):
+    """
+    Checks one downloaded file for signs of truncation or corruption, without contacting grc.com.
+
+    Checks:
+        All files: not empty. If rehash is True (or no hash is recorded yet), SHA-256 is calculated and, if a hash was recorded when the file was downloaded, compared against it.
+        PDFs: start with "%PDF-" and have a "%%EOF" marker near the end (a truncated PDF loses its trailer).
+        txt transcripts: readable as UTF-8 (or Windows-1252, which some older transcripts use) and free of NUL bytes.
+
+    Args:
+        file_path (str): Path of the file.
+        file_format (str): Key of file_formats the file belongs to.
+        recorded_sha256 (str): Hash recorded in the manifest, or None.
+        rehash (bool): If False and a hash is recorded, skip hashing (PDF checks then only read the start and end of the file).
 
     Returns:
-        False: if last_downloaded_episode function found no existing files of the sn-xxx or sn-xxx-notes format in the specified directory, it will have returned "skip" to prevent mass downloading via this function.
+        VerifyResult: The result, with sha256 set to the hash calculated (or None if not hashed).
+    """
+    filename = os.path.basename(file_path)
+    try:
+        size = os.path.getsize(file_path)
+        if size == 0:
+            return VerifyResult(filename, 0, None, "empty file")
+
+        sha256 = None
+        if rehash or recorded_sha256 is None:
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                    digest.update(chunk) # hashlib releases the GIL for large chunks, so several threads really do hash in parallel
+            sha256 = digest.hexdigest()
+            if recorded_sha256 is not None and sha256 != recorded_sha256:
+                return VerifyResult(filename, size, sha256, "contents changed since download (SHA-256 mismatch)")
+
+        if file_format in ("pdf_transcript", "pdf_shownotes"):
+            with open(file_path, 'rb') as file:
+                head = file.read(5)
+                file.seek(max(0, size - 1024))
+                tail = file.read()
+            if head != b"%PDF-":
+                return VerifyResult(filename, size, sha256, "not a PDF (missing %PDF- header)")
+            if b"%%EOF" not in tail:
+                return VerifyResult(filename, size, sha256, "truncated PDF (missing %%EOF trailer)")
+
+        elif file_format == "txt_transcript":
+            with open(file_path, 'rb') as file:
+                raw = file.read()
+            if b"\x00" in raw:
+                return VerifyResult(filename, size, sha256, "text transcript contains NUL bytes")
+            try:
+                raw.decode("utf-8")
+            except UnicodeDecodeError:
+                try:
+                    raw.decode("cp1252")
+                except UnicodeDecodeError:
+                    return VerifyResult(filename, size, sha256, "text transcript isn't valid UTF-8 or Windows-1252 text")
+
+        return VerifyResult(filename, size, sha256, None)
+
+    except OSError as e:
+        return VerifyResult(filename, None, None, f"can't be read ({e})")
+
+
+def check_file_against_server(job, size):
+    """
+    Compares a downloaded file's size with the Content-Length grc.com reports for it, using a HEAD request (headers only, so no file is re-downloaded).
+
+    Returns:
+        str: What's wrong, or None if the sizes match or the server doesn't report a size.
+    """
+    load_http_modules()
+    try:
+        with http_head(job.url, headers={"Accept-Encoding": "identity"}) as response: # identity: the size of the file itself, not a compressed copy
+            content_length = response.headers.get("Content-Length", "")
+            if response.status_code == 200 and content_length.isdigit() and int(content_length) != size:
+                return f"size {size} bytes doesn't match grc.com's {content_length} bytes"
+    except requests.RequestException as e:
+        msg_exception = f"Couldn't check {job.filename} against grc.com - {e}\n"
+        log_file_write(msg_exception, log_path, logging.WARNING)
+    return None
+
+
+def verify_archive(output_directory, rehash=False, check_server=False, redownload=False):
+    """
+    Checks every file recorded in the manifest for truncation or corruption, several files at a time, and queues any bad file to be downloaded again.
+
+    Files are checked locally by check_file_contents, spread over one thread per CPU core. Files without a recorded SHA-256 hash are hashed and the hash saved in the manifest, so later runs can spot files that have changed on disk. If check_server is True, each file's size is also compared with grc.com's, one HEAD request per file (these obey the usual request rate limit, so this is much slower than the local checks).
+
+    A bad file is renamed to <filename>.corrupt (kept, in case you want to look at it) and removed from the manifest, so the next grab_missing_files run (or this function, if redownload is True) fetches it again.
+
+    Run manifest_reconcile first if files have been added to output_directory by hand.
+
+    Args:
+        output_directory (str): Directory holding the downloaded Security Now files.
+        rehash (bool): If True, re-hash every file and compare with the recorded hash. If False, only files without a recorded hash are hashed.
+        check_server (bool): If True, also compare every file's size with grc.com's using HEAD requests.
+        redownload (bool): If True, download the bad files again straight away.
+
+    Returns:
+        list: VerifyResult tuples for the bad files (empty if everything is fine).
+    """
+    with manifest_lock:
+        rows = manifest_connect(output_directory).execute("SELECT filename, episode, file_format, sha256 FROM files ORDER BY episode, file_format").fetchall()
+
+    msg_start = f"Verifying {len(rows)} files in {output_directory}.\n"
+    log_file_write(msg_start, log_path)
+    verify_started = time.perf_counter()
+
+    from sn_files_pack import load_pack_index, check_packed_file, discard_packed_file # imported here, as sn_files_pack imports this module
+    pack_index = load_pack_index(output_directory)
+
+    def check(row):
+        filename, episode, file_format, recorded_sha256 = row
+        file_path = os.path.join(output_directory, filename)
+        if filename in pack_index["files"] and not os.path.exists(file_path): # kept only in the packed archive
+            return check_packed_file(output_directory, filename, recorded_sha256, pack_index)
+        return check_file_contents(file_path, file_format, recorded_sha256, rehash)
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        results = list(executor.map(check, rows))
+
+    jobs_by_filename = {}
+    for filename, episode, file_format, recorded_sha256 in rows:
+        job = make_download_job(episode, file_format)
+        if job.filename == filename: # skip files with non-standard names, there's no URL to fetch them from
+            jobs_by_filename[filename] = job
+
+    if check_server:
+        to_check = [(index, result) for index, result in enumerate(results) if result.problem is None and result.filename in jobs_by_filename]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            problems = list(executor.map(lambda item: check_file_against_server(jobs_by_filename[item[1].filename], item[1].size), to_check))
+        for (index, result), problem in zip(to_check, problems):
+            if problem:
+                results[index] = result._replace(problem=problem)
+
+    bad_files = [result for result in results if result.problem]
+    damaged_packed = [] # bad files kept only in the pack
+    with manifest_lock:
+        connection = manifest_connect(output_directory)
+        connection.executemany("UPDATE files SET sha256 = ? WHERE filename = ?", [(result.sha256, result.filename) for result in results if result.sha256 and not result.problem])
+        for result in bad_files:
+            file_path = os.path.join(output_directory, result.filename)
+            if os.path.exists(file_path):
+                os.replace(file_path, file_path + ".corrupt")
+            elif result.filename in pack_index["files"]:
+                damaged_packed.append(result.filename)
+            if result.filename in jobs_by_filename:
+                cache_discard(jobs_by_filename[result.filename].url) # so it is downloaded again, not copied back from the cache
+            connection.execute("DELETE FROM files WHERE filename = ?", (result.filename,))
+        connection.commit()
+
+    for filename in damaged_packed:
+        if not discard_packed_file(output_directory, filename): # otherwise manifest_reconcile would add the damaged packed copy back
+            msg_busy = f"{filename}: couldn't remove the damaged copy from the pack, as it is being updated by another process. Run verify_archive again later.\n"
+            log_file_write(msg_busy, log_path, logging.WARNING)
+
+    for result in bad_files:
+        msg_bad = f"{result.filename}: {result.problem}. {'Renamed to ' + result.filename + '.corrupt and queued' if os.path.exists(os.path.join(output_directory, result.filename + '.corrupt')) else 'Queued'} to download again.\n"
+        log_file_write(msg_bad, log_path, logging.WARNING)
+    msg_done = f"Verified {len(rows)} files in {round(time.perf_counter() - verify_started, 2)} seconds: {len(bad_files)} bad.\n"
+    log_file_write(msg_done, log_path)
+
+    if redownload and bad_files:
+        download_jobs([jobs_by_filename[result.filename] for result in bad_files if result.filename in jobs_by_filename], output_directory, use_negative_cache=False)
+    return bad_files
+
+
+########################## FILE GRAB FUNCTIONS ############################
+
+def grab_episodes(output_directory, latest_episode, formats_to_grab, ep_start=None, ep_stop=None):
+    """
+    Downloads the files in any mix of formats for an episode range, as one pipeline: one plan (plan_downloads), one duplicate check against the manifest and one pass through the download engine (download_jobs). The grab_sn_* functions below are shortcuts to this for a single format.
+
+    Args:
+        output_directory (str): Directory the files are saved in.
+        latest_episode (int): Latest episode number published on grc.com, from latest_episode_number.
+        formats_to_grab (iterable): Keys of file_formats, from "pdf_transcript", "txt_transcript", "pdf_shownotes", "htm_shownotes".
+        ep_start (int): First episode wanted. See sanitise_episode_range for how out of range values are handled.
+        ep_stop (int): Last episode wanted.
+
+    Returns:
+        False: if ep_start is "skip", which last_downloaded_episode returns if it found no existing files of the sn-xxx or sn-xxx-notes format in the directory, to prevent mass downloading of the entire back catalogue by accident.
+        int: The number of files downloaded.
     """
-    
     if ep_start == "skip": # This string is returned by the last_downloaded_episode function if it finds no existing files of the sn-xxx or sn-xxx-notes format in the specified directory. This is to prevent mass downloading of entire back catalogue via that function, or by accident.
+        return False
+
+    jobs = plan_downloads(latest_episode, formats_to_grab, ep_start, ep_stop)
+    if not jobs:
+        return 0
+    request_time_est(jobs[0].episode, jobs[-1].episode, output_directory, request_count=len(jobs)) # prints & logs expected time to run based on measured throughput of previous runs, or the requests_per_second courtesy limit
+    return download_jobs(jobs, output_directory)
+
+
+def grab_missing_files(output_directory, latest_episode, formats_to_grab=None):
+    """
+    Fills every hole in the archive in one pass: downloads each missing (episode, format) file between the first available episode and latest_episode, including gaps in the middle of the archive.
+
+    Args:
+        output_directory (str): Directory holding the downloaded Security Now files.
+        latest_episode (int): Latest episode number published on grc.com, from latest_episode_number.
+        formats_to_grab (iterable): Keys of file_formats to fill, e.g. ["txt_transcript", "pdf_shownotes"]. Defaults to the formats that already have at least one file in output_directory, so an empty or wrong directory doesn't trigger a download of the entire back catalogue.
+
+    Returns:
+        False: if no formats were given and output_directory contains no Security Now files.
+        int: The number of files downloaded.
+    """
+    if formats_to_grab is None:
+        formats_to_grab = [file_format for file_format in file_formats if file_format in manifest_last_episodes(output_directory)]
+        if not formats_to_grab:
+            msg_error = "No matching Security Now files found in the output directory, so no missing files to fill. Use the back-catalogue functions to download from scratch.\n"
+            log_file_write(msg_error, log_path, logging.WARNING)
             return False
 
-    # Santize the episode range values
-    if ep_start < 432 or ep_start == None:
-        msg = "Invalid episode start value entered, 432 used.\n"
-        ep_start = 432
-        log_file_write(msg, log_path)
-    
-    if ep_stop is None:
-        ep_stop = ep_start + 1  # Default to just the start episode if no stop is provided, to prevent accidental mass-downloading
-        msg = "Invalid episode stop value entered, grabbing just one episode.\n"
-    
-    if ep_stop > latest_episode:
-        ep_stop = latest_episode
-        msg = "Invalid episode stop value entered, grabbing through to latest episode.\n"
+    jobs = plan_missing_files(output_directory, latest_episode, formats_to_grab)
+    for file_format in formats_to_grab:
+        count = sum(1 for job in jobs if job.file_format == file_format)
+        msg = f"{count} {file_formats[file_format][0]} files missing from the output directory.\n"
         log_file_write(msg, log_path)
 
+    if jobs:
+        request_time_est(1, len(jobs), output_directory, request_count=len(jobs))
+    return download_jobs(jobs, output_directory)
 
-    request_time_est(ep_start, ep_stop) # prints & logs expected time to run based on 0.5 second pause between requests
 
-    episodes_to_grab = range(ep_start, ep_stop+1, 1)
-    for episode in episodes_to_grab:
-        # Don't need to format episode number with leading zeros as it's already minimum three digits long. Will accommodate 999 & beyond :-)
-        url_shownotes = f"https://www.grc.com/sn/sn-{episode}-notes.pdf"
-        filename_shownotes = f"sn-{episode}-notes.pdf"
+def grab_episodes_sharded(output_directory, latest_episode, formats_to_grab, ep_start=None, ep_stop=None, shard_size=100):
+    """
+    Like grab_episodes, but the episode range is split into shards of shard_size episodes, and each shard is only worked on by one process at a time. Several processes (or overlapping scheduled runs) can run this over the same range and output directory at once: each claims a shard with a lease file in output_directory, downloads it, releases it and moves on to the next unclaimed shard, so the work is shared out with nothing downloaded twice.
 
-        # Duplicate file check
-        if os.path.exists(os.path.join(output_directory, filename_shownotes)):
-            dupe_msg = f"File {filename_shownotes} already exists. Skipping.\n"
-            log_file_write(dupe_msg, log_path)
-            continue  # Skip to next iteration if identical filename exists
+    Args:
+        output_directory (str): Directory the files are saved in.
+        latest_episode (int): Latest episode number published on grc.com, from latest_episode_number.
+        formats_to_grab (iterable): Keys of file_formats.
+        ep_start (int): First episode wanted. Defaults to 1.
+        ep_stop (int): Last episode wanted. Defaults to latest_episode.
+        shard_size (int): Episodes per shard.
 
+    Returns:
+        int: The number of files downloaded by this process.
+    """
+    ep_start = 1 if ep_start is None else max(1, ep_start)
+    ep_stop = latest_episode if ep_stop is None else min(ep_stop, latest_episode)
+    downloaded = 0
+    shards_done = 0
+    for shard_start, shard_stop in shard_ranges(ep_start, ep_stop, shard_size):
+        lease_name = f"shard-{shard_start:04}-{shard_stop:04}.lease"
+        if not try_claim(output_directory, lease_name, shard_lease_max_age_seconds):
+            msg_leased = f"Episodes {shard_start} to {shard_stop} are being downloaded by another process. Skipping.\n"
+            log_file_write(msg_leased, log_path, logging.DEBUG)
+            continue
         try:
-            response = requests.get(url_shownotes)
-            if response.status_code == 200:
-                with open(os.path.join(output_directory, filename_shownotes), 'wb') as file:
-                    file.write(response.content)
-                
-                success_msg =f"Successfully downloaded PDF shownotes {filename_shownotes}.\n"
-                log_file_write(success_msg, log_path)
-                time.sleep(0.5)
+            msg_shard = f"Downloading episodes {shard_start} to {shard_stop}.\n"
+            log_file_write(msg_shard, log_path)
+            downloaded += grab_episodes(output_directory, latest_episode, formats_to_grab, shard_start, shard_stop) or 0
+            shards_done += 1
+        finally:
+            release_claim(output_directory, lease_name)
 
-            else:
-                msg_error = f"Failed to download PDF shownotes {filename_shownotes}. Status code: {response.status_code}\n"
-                log_file_write(msg_error, log_path)
+    msg_done = f"This process downloaded {downloaded} files from {shards_done} shards of episodes {ep_start} to {ep_stop}.\n"
+    log_file_write(msg_done, log_path)
+    return downloaded
+
+
+def grab_sn_shownotes_htm(output_directory, ep_start=1, ep_stop=177):
+    """
+    Downloads original htm shownotes, for given episode range.
+    Htm shownotes were only produced for episodes 001 - 177.
+    No shownotes at all 2011, '12, half '13, then pdf from 432.
+    Shows missing htm notes: 138, 139, 140, 146, 148-152, 154, 156, 158-163, 165-168, 169-175, these will simply be passed over.
+
+    Args:
+        ep_start: episode number to start range, defaults to 1.
+        ep_stop: episode number to end range, defaults to 177. 
         
-        except requests.RequestException as e:
-            msg_exception = f"Request failed for PDF shownotes {filename_shownotes} - {e}\n"
-            log_file_write(msg_exception, log_path)
+    Available range: 001 - 177.
+        
+    Syntax examples:
+        https://www.grc.com/sn/notes-001.htm
+        https://www.grc.com/sn/notes-177.htm
+    
+    Returns:
+        False: if last_downloaded_episode function found no existing files of the sn-xxx or sn-xxx-notes format in the specified directory, it will have returned "skip" to prevent mass downloading via this function.
+        int: The number of files downloaded.
+
+    """
+    last_htm_episode = file_formats["htm_shownotes"][2] # the htm shownotes series is finished, so no need to know the latest episode
+    return grab_episodes(output_directory, last_htm_episode, ["htm_shownotes"], ep_start, ep_stop) # see episode_url_and_filename for the URL rules, including the special cases for episodes 3 and 23
+
+
+def grab_sn_shownotes_pdfs(output_directory, latest_episode, ep_start=432, ep_stop=None):
+    """Downloads PDF shownotes for given episode range.
+    First availble PDF shownote is for episode 432: https://www.grc.com/sn/sn-432-notes.pdf
+    
+    Args:
+        ep_start: episode number to start range, substitutes 432 if None or lower than 432. 
+        ep_stop:  episode number to end range, defaults just the start episode if non-sensical stop episode is provided meaning just a single request is made.
+
+    Available range:
+        432 to latest_episode. None for #592, #643, #747, #851, #954.
+        
+    Syntax examples:
+        https://www.grc.com/sn/sn-432-notes.pdf
+
+    Returns:
+        False: if last_downloaded_episode function found no existing files of the sn-xxx or sn-xxx-notes format in the specified directory, it will have returned "skip" to prevent mass downloading via this function.
+        int: The number of files downloaded.
+    """
+    return grab_episodes(output_directory, latest_episode, ["pdf_shownotes"], ep_start, ep_stop)
 
 
 def grab_sn_transcripts_pdfs(output_directory, latest_episode, ep_start, ep_stop):
@@ -421,60 +2250,10 @@ def grab_sn_transcripts_pdfs(output_directory, latest_episode, ep_start, ep_stop
 
     Returns:
         False: if last_downloaded_episode function found no existing files of the sn-xxx or sn-xxx-notes format in the specified directory, it will have returned "skip" to prevent mass downloading via this function.
+        int: The number of files downloaded.
            
     """
-    if ep_start == "skip": # This string is returned by the last_downloaded_episode function if it finds no existing files of the sn-xxx or sn-xxx-notes format in the specified directory. This is to prevent mass downloading of entire back catalogue via that function, or by accident.
-        return False
-
-    # Sanitise episode range values
-    if ep_start < 1 or ep_start > ep_stop:
-        ep_start = 1
-        msg = "Invalid episode start value entered, 001 used.\n"
-        log_file_write(msg, log_path)
-    
-    if ep_stop < ep_start:
-        ep_stop = ep_start + 1  # Default to just the start episode if non-sensical stop episode is provided
-        msg = "Invalid episode stop value entered, grabbing just one episode.\n"
-        log_file_write(msg, log_path)
-
-    if ep_stop > latest_episode:
-        ep_stop = latest_episode
-        msg = "Invalid episode stop value entered, grabbing through to latest episode.\n"
-        log_file_write(msg, log_path)    
-
-
-    request_time_est(ep_start, ep_stop) # prints & logs expected time to run based on 0.5 second pause between requests
-
-    episodes_to_grab = range(ep_start, ep_stop+1, 1)
-    for episode in episodes_to_grab:
-        # Format each episode number with leading zeros to make it three digits long if it's less than 100
-        formatted_episode = f"{episode:03}" if episode < 100 else str(episode)
-        
-        url_transcript_pdf = f"https://www.grc.com/sn/sn-{formatted_episode}.pdf"
-        filename_transcript_pdf = f"sn-{formatted_episode}.pdf"
-
-        # Duplicate file check
-        if os.path.exists(os.path.join(output_directory, filename_transcript_pdf)):
-            msg_dupe = f"File {filename_transcript_pdf} already exists. Skipping.\n"
-            log_file_write(msg_dupe, log_path)
-            continue  # Skip to the next iteration if identical filename exists
-        
-        try:
-            response = requests.get(url_transcript_pdf)
-            if response.status_code == 200:
-                with open(os.path.join(output_directory,filename_transcript_pdf), 'wb') as file:
-                    file.write(response.content)
-                
-                msg_success =f"Successfully downloaded PDF transcript for {filename_transcript_pdf}.\n"
-                log_file_write(msg_success, log_path)
-                time.sleep(0.5)
-            else:
-                msg_error = f"Failed to download PDF transcript for episode {filename_transcript_pdf}. Status code: {response.status_code}.\n"
-                log_file_write(msg_error, log_path)
-
-        except requests.RequestException as e:
-            msg_exception = f"Request failed for {filename_transcript_pdf} - {e}\n"
-            log_file_write(msg_exception, log_path)
+    return grab_episodes(output_directory, latest_episode, ["pdf_transcript"], ep_start, ep_stop)
 
 
 def grab_sn_transcripts_txts(output_directory, latest_episode, ep_start, ep_stop):
@@ -492,57 +2271,119 @@ def grab_sn_transcripts_txts(output_directory, latest_episode, ep_start, ep_stop
 
     Returns:
         False: if last_downloaded_episode function found no existing files of the sn-xxx or sn-xxx-notes format in the specified directory, it will have returned "skip" to prevent mass downloading via this function.
+        int: The number of files downloaded.
 
     """
-    if ep_start == "skip": # This string is returned by the last_downloaded_episode function if it finds no existing files of the sn-xxx or sn-xxx-notes format in the specified directory. This is to prevent mass downloading of entire back catalogue via that function, or by accident.
-        return False
-
-    # Sanitise episode range values
-    if ep_start < 1 or ep_start > ep_stop:
-        ep_start = 1
-        msg = "Invalid episode start value entered, 001 used.\n"
-        log_file_write(msg, log_path)
-    
-    if ep_stop < ep_start:
-        ep_stop = ep_start + 1  # Default to just the start episode if non-sensical stop episode is provided
-        msg = "Invalid episode stop value entered, grabbing just one episode.\n"
-        log_file_write(msg, log_path)
+    return grab_episodes(output_directory, latest_episode, ["txt_transcript"], ep_start, ep_stop)
 
-    if ep_stop > latest_episode:
-        ep_stop = latest_episode
-        msg = "Invalid episode stop value entered, grabbing through to latest episode.\n"
-        log_file_write(msg, log_path)  
-    
-    request_time_est(ep_start, ep_stop) # prints & logs expected time to run based on 0.5 second pause between requests
 
-    episodes_to_grab = range(ep_start, ep_stop+1)
-    for episode in episodes_to_grab:
-        # Format each episode number with leading zeros to make it three digits long if it's less than 100
-        formatted_episode = f"{episode:03}" if episode < 100 else str(episode)
+########################## WATCH FOR NEW EPISODES ############################
 
-        url_transcript_txt = f"https://www.grc.com/sn/sn-{formatted_episode}.txt"
-        filename_transcript_txt = f"sn-{formatted_episode}.txt"
+def is_published(job):
+    """
+    Asks grc.com whether a file exists yet, with a HEAD request (headers only, no file body).
 
-         # Duplicate file check
-        if os.path.exists(os.path.join(output_directory, filename_transcript_txt)):
-            msg_dupe = f"File {filename_transcript_txt} already exists. Skipping.\n"
-            log_file_write(msg_dupe, log_path)
-            continue  # Skip to the next iteration if identical filename exists
-        
-        try:
-            response = requests.get(url_transcript_txt)
+    Returns:
+        True: the file is published.
+        False: not published (404 / 410).
+        None: couldn't tell (request failed or another status code), the error is logged.
+    """
+    load_http_modules()
+    try:
+        with http_head(job.url, headers={"Accept-Encoding": "identity"}) as response:
             if response.status_code == 200:
-                with open(os.path.join(output_directory, filename_transcript_txt), 'w', encoding='utf-8') as file: # NB: not wb
-                    file.write(response.text) # NB: .text not .content
-                
-                msg_success =f"Successfully downloaded text transcript for {filename_transcript_txt}.\n"
-                log_file_write(msg_success, log_path)
-                time.sleep(0.5)
+                return True
+            if response.status_code in (404, 410):
+                return False
+            msg_error = f"Couldn't check whether {job.filename} is published. Status code: {response.status_code}.\n"
+            log_file_write(msg_error, log_path, logging.WARNING)
+    except requests.RequestException as e:
+        msg_exception = f"Couldn't check whether {job.filename} is published - {e}\n"
+        log_file_write(msg_exception, log_path, logging.WARNING)
+    return None
 
-            else:
-                msg_error = f"Failed to download text transcript for episode {filename_transcript_txt}. Status code: {response.status_code}.\n"
-                log_file_write(msg_error, log_path) 
-        
-        except requests.RequestException as e:
-            msg_exception = f"Request failed for {filename_transcript_txt} - {e}\n"
-            log_file_write(msg_exception, log_path)
\ No newline at end of file
+
+def watch_for_new_episodes(output_directory, formats_to_grab=None, poll_seconds=None, max_poll_seconds=None, max_polls=None):
+    """
+    Keeps running, downloading the files for each new episode as soon as it is published. Stop it with Ctrl+C.
+
+    Rather than fetching securitynow.htm and listing the output directory on every check, it keeps the latest episode number in memory and each poll is a single HEAD request for the next episode's txt transcript (e.g. sn-1001.txt). When that appears, every format for the episode is downloaded in one go. Files not published yet (shownotes PDFs often appear later than the transcripts) are re-checked with a HEAD request at every poll, for up to watch_late_file_hours, and downloaded when they appear. securitynow.htm itself is only re-checked (conditionally) every watch_page_check_seconds.
+
+    Polls that find nothing new wait 1.5 times longer than the last, up to max_poll_seconds, so a quiet week costs very few requests. The wait goes back to poll_seconds as soon as something is downloaded.
+
+    Args:
+        output_directory (str): Directory the files are saved in.
+        formats_to_grab (iterable): Keys of file_formats to download for each new episode. Defaults to the three current formats.
+        poll_seconds (int or float): Shortest wait between polls. Defaults to watch_poll_seconds in sn_files_user_variables.py.
+        max_poll_seconds (int or float): Longest wait between polls. Defaults to watch_max_poll_seconds.
+        max_polls (int): Stop after this many polls. None (default) to keep going until stopped.
+
+    Returns:
+        int: The latest episode number seen, or None if it was never determined.
+    """
+    formats_to_grab = list(formats_to_grab or ["pdf_shownotes", "txt_transcript", "pdf_transcript"])
+    poll_seconds = watch_poll_seconds if poll_seconds is None else poll_seconds
+    max_poll_seconds = watch_max_poll_seconds if max_poll_seconds is None else max_poll_seconds
+
+    latest_seen = None
+    pending = {} # filename: (DownloadJob, time.monotonic() when first found unpublished), for files of recent episodes not published yet
+    interval = poll_seconds
+    last_page_check = None
+    polls = 0
+
+    msg_start = f"Watching for new episodes in the formats {', '.join(formats_to_grab)}. Press Ctrl+C to stop.\n"
+    log_file_write(msg_start, log_path)
+
+    try:
+        while max_polls is None or polls < max_polls:
+            polls += 1
+            new_episodes = []
+
+            # Is there a new episode?
+            if latest_seen is None or time.monotonic() - last_page_check >= watch_page_check_seconds:
+                page_latest = latest_episode_number(output_directory) # conditional request, so usually just a 304 Not Modified
+                last_page_check = time.monotonic()
+                if page_latest is not None:
+                    if latest_seen is None:
+                        new_episodes = [page_latest] # on start-up, pick up anything still missing for the current episode
+                    elif page_latest > latest_seen:
+                        new_episodes = list(range(latest_seen+1, page_latest+1))
+                    latest_seen = max(page_latest, latest_seen or 0)
+            elif is_published(make_download_job(latest_seen+1, "txt_transcript")):
+                latest_seen += 1
+                new_episodes = [latest_seen]
+                msg_new = f"Episode #{latest_seen} has been published.\n"
+                log_file_write(msg_new, log_path)
+
+            # Download the new episode(s), plus any late files that have now appeared
+            jobs = [job for episode in new_episodes for job in plan_downloads(latest_seen, formats_to_grab, episode, episode)]
+            for filename, (job, first_checked) in list(pending.items()):
+                published = is_published(job)
+                if published:
+                    jobs.append(job)
+                elif time.monotonic() - first_checked > watch_late_file_hours * 3600:
+                    msg_give_up = f"{job.filename} still isn't published after {watch_late_file_hours} hours. No longer checking for it.\n"
+                    log_file_write(msg_give_up, log_path, logging.WARNING)
+                    del pending[filename]
+
+            downloaded = download_jobs(jobs, output_directory, use_negative_cache=False) if jobs else 0
+
+            # Anything asked for but still not downloaded is checked again next poll
+            already_downloaded = manifest_filenames(output_directory)
+            for job in jobs:
+                if job.filename in already_downloaded:
+                    pending.pop(job.filename, None)
+                else:
+                    pending.setdefault(job.filename, (job, time.monotonic()))
+
+            interval = poll_seconds if downloaded else min(max_poll_seconds, interval * 1.5)
+            if max_polls is not None and polls >= max_polls:
+                break
+            msg_wait = f"Latest episode #{latest_seen}, {len(pending)} files waiting to be published. Next check in {round(interval)} seconds.\n"
+            log_file_write(msg_wait, log_path, logging.DEBUG)
+            time.sleep(interval)
+
+    except KeyboardInterrupt:
+        msg_stop = "Watch mode stopped.\n"
+        log_file_write(msg_stop, log_path)
+    return latest_seen